@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""Chaîne Kokoro -> RVC entièrement en mémoire (aucun fichier WAV temporaire).
+
+torch / rvc_python / fairseq ne sont importés qu'au premier chargement de modèle RVC :
+importer ce module (découpage du texte, rééchantillonnage, fondus) reste rapide.
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+import av
+import numpy as np
+import soundfile as sf
+
+from metrics import record_stage
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes ---
+RVC_INPUT_SAMPLE_RATE = 16000  # Taux d'entrée de HuBERT / du pipeline RVC
+
+
+# --- Conversion de l'audio Kokoro vers l'entrée RVC ---
+def quantize_pcm16(samples, sample_rate):
+    """Quantifie en PCM 16 bits exactement comme sf.write(..., ".wav") le ferait."""
+    # On passe par libsndfile en format RAW (sans en-tête, sans disque) pour garantir
+    # le même arrondi que l'ancien fichier temporaire, quelle que soit la version de la lib.
+    buffer = io.BytesIO()
+    sf.write(buffer, samples, sample_rate, format="RAW", subtype="PCM_16")
+    return np.frombuffer(buffer.getbuffer(), dtype="<i2")
+
+
+def wav_bytes(samples, sample_rate):
+    """Fichier WAV PCM 16 bits en mémoire, identique à sf.write(..., ".wav")."""
+    buffer = io.BytesIO()
+    sf.write(buffer, samples, sample_rate, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+def resample_for_rvc(samples, sample_rate):
+    """Rééchantillonne l'audio Kokoro (float32) en mono float32 à 16 kHz pour RVC."""
+    pcm = quantize_pcm16(samples, sample_rate)
+    frame = av.AudioFrame.from_ndarray(pcm.reshape(1, -1), format="s16", layout="mono")
+    frame.sample_rate = sample_rate
+    # Même libswresample que rvc_python.lib.audio.load_audio. Comme load_audio, on ne vide
+    # pas le resampler à la fin : la sortie reste identique à celle du chemin fichier.
+    resampler = av.AudioResampler(format="flt", layout="mono", rate=RVC_INPUT_SAMPLE_RATE)
+    frames = resampler.resample(frame)
+    if not frames: return np.array([], dtype=np.float32)
+    return np.concatenate([f.to_ndarray().reshape(-1) for f in frames])
+
+
+def decode_audio_for_rvc(data):
+    """Décode un fichier audio reçu en mémoire (WAV, FLAC, MP3, Ogg...) en mono float32 à 16 kHz."""
+    with av.open(io.BytesIO(data)) as container:
+        resampler = av.AudioResampler(format="flt", layout="mono", rate=RVC_INPUT_SAMPLE_RATE)
+        frames = [out for frame in container.decode(audio=0) for out in resampler.resample(frame)]
+    if not frames: return np.array([], dtype=np.float32)
+    return np.concatenate([f.to_ndarray().reshape(-1) for f in frames])
+
+
+def audio_cache_key(audio):
+    """Clé stable pour un buffer audio (utilisée par le cache F0 'harvest' de rvc_python)."""
+    return "mem:" + hashlib.sha1(np.ascontiguousarray(audio).tobytes()).hexdigest()
+
+
+# --- Inférence RVC sur tableaux NumPy ---
+F0_METHODS = ["harvest", "pm", "rmvpe", "crepe"]
+
+
+class RVCParams(NamedTuple):
+    """Paramètres d'inférence RVC d'une requête (immuables, jamais stockés sur le modèle partagé)."""
+    f0_up_key: int = 0
+    f0_method: str = "harvest"
+    index_rate: float = 0.5
+    protect: float = 0.33
+    filter_radius: int = 3
+    resample_sr: int = 0
+    rms_mix_rate: float = 1
+
+
+_LAZY_MODELS_LOCK = threading.Lock()
+_SAFE_GLOBALS_DONE = False
+_AUDIO_KEYS_LOCK = threading.Lock()
+_audio_keys_in_use = {}  # audio_key -> conversions en cours (cf. _release_harvest_input)
+
+
+def _release_harvest_input(audio_key):
+    """Retire l'audio gardé par rvc_python pour le F0 'harvest' quand plus aucune conversion ne l'utilise.
+
+    rvc_python le range dans un dict global (input_audio_path2wav) jamais vidé : sans cela, chaque
+    énoncé ou morceau de streaming y laisserait une copie float64 pour toute la vie du serveur.
+    """
+    with _AUDIO_KEYS_LOCK:
+        remaining = _audio_keys_in_use[audio_key] - 1
+        if remaining: _audio_keys_in_use[audio_key] = remaining; return
+        del _audio_keys_in_use[audio_key]
+        from rvc_python.modules.vc import pipeline as rvc_pipeline
+        getattr(rvc_pipeline, "input_audio_path2wav", {}).pop(audio_key, None)
+
+
+def _allow_fairseq_dictionary():
+    """torch >= 2.6 charge en weights_only : le dictionnaire fairseq de HuBERT doit être autorisé."""
+    global _SAFE_GLOBALS_DONE
+    with _LAZY_MODELS_LOCK:
+        if _SAFE_GLOBALS_DONE: return
+        try:
+            import torch
+            from fairseq.data.dictionary import Dictionary
+            torch.serialization.add_safe_globals([Dictionary])
+        except Exception as e: logger.warning(f"Could not add Dictionary to safe globals (may be harmless): {e}")
+        _SAFE_GLOBALS_DONE = True
+
+
+def _ensure_lazy_models(vc, f0_method):
+    """Charge une seule fois HuBERT / RMVPE, que rvc_python initialise paresseusement sans verrou.
+
+    HuBERT est partagé par tous les modèles RVC du processus (cf. rvc_backend).
+    """
+    pipeline = vc.pipeline
+    if vc.hubert_model is not None and (f0_method != "rmvpe" or hasattr(pipeline, "model_rmvpe")): return
+    with _LAZY_MODELS_LOCK:
+        if vc.hubert_model is None:
+            from rvc_python.modules.vc.utils import load_hubert
+            from rvc_backend import shared_hubert
+            vc.hubert_model = shared_hubert(vc.config, lambda: load_hubert(vc.config, vc.lib_dir))
+        if f0_method == "rmvpe" and not hasattr(pipeline, "model_rmvpe"):
+            from rvc_python.lib.rmvpe import RMVPE
+            pipeline.model_rmvpe = RMVPE(Path(pipeline.lib_dir) / "base_model" / "rmvpe.pt", is_half=pipeline.is_half, device=pipeline.device)
+
+
+def _pipeline_index_path(rvc):
+    """Chemin de l'index tel que le pipeline rvc_python le lira (même nettoyage que VC.vc_single)."""
+    file_index = rvc.models[rvc.current_model].get("index") or ""
+    if file_index:
+        file_index = file_index.strip(" ").strip('"').strip("\n").strip('"').strip(" ").replace("trained", "added")
+    return file_index
+
+
+def load_rvc_inference(rvc_pth_path, rvc_index_path, device):
+    """Crée un RVCInference prêt à l'emploi pour un couple (.pth, .index)."""
+    from rvc_python.infer import RVCInference
+    from rvc_index import install_index_hook, open_rvc_index
+    from rvc_backend import compile_generator, install_f0_cache
+    _allow_fairseq_dictionary()
+    install_index_hook()
+    install_f0_cache()
+    rvc = RVCInference(device=device)
+    rvc.load_model(rvc_pth_path, index_path=rvc_index_path)
+    # HuBERT (partagé) est chargé tout de suite plutôt qu'à la 1re inférence
+    _ensure_lazy_models(rvc.vc, None)
+    # Sur CPU : générateur compilé TorchScript si RVC_CPU_BACKEND le permet (repli eager sinon)
+    rvc.vc.net_g = compile_generator(rvc.vc.net_g, rvc.vc.if_f0, device)
+    # L'index reste ouvert (mmap si possible) tant que ce modèle est en cache, au lieu d'être relu à chaque conversion
+    file_index = _pipeline_index_path(rvc)
+    if file_index and os.path.exists(file_index):
+        try: rvc.shared_index = open_rvc_index(file_index)
+        except Exception as e: logger.warning(f"Could not open RVC index {file_index}: {e}")
+    return rvc
+
+
+def rvc_infer_array(rvc, audio, params=None, audio_key=None):
+    """Équivalent en mémoire de rvc.infer_file() suivi de sf.read().
+
+    `audio` est un tableau mono float32 à 16 kHz (cf. resample_for_rvc / load_audio).
+    Les réglages viennent de `params` (RVCParams) et non des attributs de `rvc` : le même
+    modèle en cache peut servir plusieurs requêtes en parallèle sans mélanger les hauteurs.
+    Retourne (sample_rate, audio float64 normalisé), identique à la relecture du WAV.
+    """
+    if not rvc.current_model: raise ValueError("Please load a model first.")
+    if params is None: params = RVCParams()
+    vc = rvc.vc
+    # Même prétraitement que VC.vc_single
+    audio = np.array(audio, dtype=np.float32)
+    audio_max = np.abs(audio).max() / 0.95 if len(audio) else 0
+    if audio_max > 1: audio /= audio_max
+    _ensure_lazy_models(vc, params.f0_method)
+    file_index = _pipeline_index_path(rvc)
+    # rvc_python met en cache le F0 'harvest' par chemin d'entrée : une clé de contenu
+    # évite toute collision entre requêtes et réutilise le F0 pour un audio identique.
+    if audio_key is None: audio_key = audio_cache_key(audio)
+    times = [0, 0, 0]  # rempli par rvc_python : [HuBERT (ou cache de features) + recherche index, F0, générateur]
+    start = time.perf_counter()
+    with _AUDIO_KEYS_LOCK: _audio_keys_in_use[audio_key] = _audio_keys_in_use.get(audio_key, 0) + 1
+    try:
+        audio_opt = vc.pipeline.pipeline(
+            vc.hubert_model, vc.net_g, 0, audio, audio_key, times,
+            int(params.f0_up_key), params.f0_method, file_index, params.index_rate, vc.if_f0,
+            params.filter_radius, vc.tgt_sr, params.resample_sr, params.rms_mix_rate, vc.version,
+            params.protect, "",
+        )
+    finally:
+        _release_harvest_input(audio_key)
+    record_stage("rvc_features", times[0]); record_stage("rvc_f0", times[1]); record_stage("rvc_generator", times[2])
+    # Reste : ouverture de l'index (partagé, cf. rvc_index), filtre passe-haut, découpage et recollage
+    record_stage("rvc_other", max(0.0, time.perf_counter() - start - sum(times)))
+    # infer_file écrit du PCM int16 que sf.read relit en float64 / 32768
+    return vc.tgt_sr, audio_opt.astype(np.float64) / 32768.0
+
+
+# ==================================================
+#           MODE STREAMING (PAR PHRASES)
+# ==================================================
+STREAM_CHUNK_MAX_CHARS = 220       # Taille max d'un morceau de texte envoyé à Kokoro
+STREAM_CROSSFADE_MS = 25           # Durée du fondu enchaîné entre deux morceaux
+STREAM_RVC_CONTEXT_SAMPLES = 8000  # 0.5 s de contexte à 16 kHz (multiple de la fenêtre RVC de 160)
+STREAM_RVC_INPUT_CHUNK_SAMPLES = 160000  # Tranches de 10 s pour convertir un fichier audio morceau par morceau
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?;:…])\s+|(?<=[。！？；])")
+_CLAUSE_END_RE = re.compile(r"(?<=[,;:，、；：])")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _split_long(text, max_chars):
+    """Coupe un passage plus long que max_chars aux virgules / points-virgules / deux-points, puis aux espaces."""
+    if len(text) <= max_chars: return [text]
+    for pattern in (_CLAUSE_END_RE, _WHITESPACE_RE):
+        parts = [p.strip() for p in pattern.split(text) if p and p.strip()]
+        if len(parts) > 1: return [piece for part in parts for piece in _split_long(part, max_chars)]
+    # Mot (ou texte sans espaces) plus long que max_chars : coupe franche
+    return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+
+
+def split_text_for_streaming(text, max_chars=STREAM_CHUNK_MAX_CHARS):
+    """Découpe le texte en morceaux d'au plus max_chars : aux fins de phrase, sinon aux virgules, sinon aux espaces."""
+    sentences = [s.strip() for s in _SENTENCE_END_RE.split(text or "") if s and s.strip()]
+    chunks, current = [], ""
+    for number, sentence in enumerate(sentences):
+        for piece_number, piece in enumerate(_split_long(sentence, max_chars)):
+            # Le premier morceau reste la première phrase seule : le premier son arrive plus vite
+            after_first_sentence = number > 0 and piece_number == 0 and not chunks
+            if current and (after_first_sentence or len(current) + len(piece) + 1 > max_chars):
+                chunks.append(current); current = piece
+            else:
+                separator = "" if not current or current[-1] in "。！？；，、：" else " "
+                current = f"{current}{separator}{piece}"
+    if current: chunks.append(current)
+    return chunks
+
+
+def split_audio_for_streaming(audio, chunk_samples=STREAM_RVC_INPUT_CHUNK_SAMPLES):
+    """Découpe un audio 16 kHz en tranches pour rvc_stream."""
+    return (audio[i:i + chunk_samples] for i in range(0, len(audio), chunk_samples))
+
+
+def resample_stream_for_rvc(chunks):
+    """Version incrémentale de resample_for_rvc pour un flux de (sample_rate, samples)."""
+    # Un seul resampler pour tout le flux : le résultat est celui du texte entier,
+    # sans discontinuité aux jonctions de morceaux.
+    resampler = None
+    for sample_rate, samples in chunks:
+        if len(samples) == 0: continue
+        if resampler is None:
+            resampler = av.AudioResampler(format="flt", layout="mono", rate=RVC_INPUT_SAMPLE_RATE)
+        pcm = quantize_pcm16(samples, sample_rate)
+        frame = av.AudioFrame.from_ndarray(pcm.reshape(1, -1), format="s16", layout="mono")
+        frame.sample_rate = sample_rate
+        frames = resampler.resample(frame)
+        if frames: yield np.concatenate([f.to_ndarray().reshape(-1) for f in frames])
+
+
+class CrossfadeStitcher:
+    """Recolle des morceaux audio successifs avec un fondu enchaîné, sans clic aux jonctions."""
+
+    def __init__(self, sample_rate, crossfade_ms=STREAM_CROSSFADE_MS):
+        self.sample_rate = sample_rate
+        self.crossfade_len = max(1, int(sample_rate * crossfade_ms / 1000))
+        self._tail = np.array([], dtype=np.float32)
+
+    def push(self, audio, overlap=0):
+        """Ajoute un morceau et retourne l'audio prêt à être diffusé.
+
+        `overlap` : nombre d'échantillons en tête de `audio` qui re-rendent la fin du
+        morceau précédent (contexte RVC). Le fondu se fait alors sur ce même passage.
+        """
+        audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+        tail = self._tail
+        if overlap: audio = audio[max(0, overlap - len(tail)):]
+        n = min(len(tail), len(audio))
+        if n:
+            t = (np.arange(n, dtype=np.float32) + 0.5) / n
+            if overlap:
+                # Même contenu rendu deux fois (corrélé) : fondu à gain constant
+                fade_in = 0.5 - 0.5 * np.cos(np.pi * t)
+                fade_out = 1.0 - fade_in
+            else:
+                # Morceaux indépendants : fondu à puissance constante
+                fade_in = np.sin(0.5 * np.pi * t)
+                fade_out = np.cos(0.5 * np.pi * t)
+            mixed = tail[len(tail) - n:] * fade_out + audio[:n] * fade_in
+            joined = np.concatenate([tail[:len(tail) - n], mixed, audio[n:]])
+        else:
+            joined = np.concatenate([tail, audio])
+        if len(joined) <= self.crossfade_len:
+            self._tail = joined
+            return np.array([], dtype=np.float32)
+        self._tail = joined[-self.crossfade_len:]
+        return joined[:-self.crossfade_len]
+
+    def flush(self):
+        """Retourne la fin retenue pour le prochain fondu (fin du flux)."""
+        tail, self._tail = self._tail, np.array([], dtype=np.float32)
+        return tail
+
+
+def rvc_stream(convert, audio_chunks, context_samples=STREAM_RVC_CONTEXT_SAMPLES, crossfade_ms=STREAM_CROSSFADE_MS):
+    """Convertit un flux audio 16 kHz morceau par morceau et produit des (sample_rate, audio).
+
+    `convert(audio_16k, audio_key)` renvoie (sample_rate, audio) comme rvc_infer_array.
+    Chaque morceau est précédé des `context_samples` derniers échantillons déjà vus :
+    HuBERT et l'estimation du F0 gardent ainsi le contexte à gauche, et la hauteur
+    reste continue d'un morceau à l'autre. La partie contexte n'est pas rediffusée,
+    elle sert de zone de fondu avec la fin du morceau précédent.
+    """
+    context = np.array([], dtype=np.float32)
+    stitcher = None
+    for chunk in audio_chunks:
+        if len(chunk) == 0: continue
+        audio_in = np.concatenate([context, chunk])
+        sample_rate, converted = convert(audio_in, audio_cache_key(audio_in))
+        if stitcher is None: stitcher = CrossfadeStitcher(sample_rate, crossfade_ms)
+        overlap = int(round(len(context) * sample_rate / RVC_INPUT_SAMPLE_RATE))
+        ready = stitcher.push(converted, overlap=overlap)
+        if len(ready): yield sample_rate, ready
+        context = audio_in[-context_samples:] if context_samples else context
+    if stitcher is not None:
+        tail = stitcher.flush()
+        if len(tail): yield stitcher.sample_rate, tail
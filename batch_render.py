@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""Rendu en masse Texte -> (Kokoro) -> RVC depuis un manifeste CSV ou JSONL, sans l'interface Gradio.
+
+Colonnes / clés reconnues (seule `text` est obligatoire, les autres ont des valeurs par défaut en option) :
+    id, text, phonemes, voice, lang, speed, pth, index, pitch, f0_method, index_rate, protect
+`phonemes` : phonèmes Kokoro pré-calculés (cf. kokoro_frontend.py), utilisés à la place du G2P.
+`pth` / `index` : nom de fichier dans modelRVC/pth et modelRVC/index (comme dans l'UI) ou chemin.
+Sans `pth`, la ligne est rendue en TTS Kokoro seul.
+
+Les tâches sont regroupées par modèle RVC (chaque modèle n'est chargé qu'une fois) et chaque
+fichier est écrit de façon atomique : relancer la même commande après un crash reprend là où
+le rendu s'était arrêté (les fichiers déjà présents sont sautés, sauf --overwrite).
+Une ligne invalide (valeur illisible, `id` déjà utilisé) est notée dans failed.jsonl sans
+arrêter le rendu des autres.
+
+Exemple :
+    python batch_render.py catalogue.csv --out rendu/ --workers 4 --pth voix.pth --index voix.index
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import soundfile as sf
+
+from audio_pipeline import RVCParams, load_rvc_inference, resample_for_rvc, rvc_infer_array
+from inference_pool import InferencePool
+from rvc_cache import ModelCache, estimate_rvc_model_bytes
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+RVC_PTH_DIR = Path("modelRVC") / "pth"
+RVC_INDEX_DIR = Path("modelRVC") / "index"
+KOKORO_ONNX_PATH = "modelTTS/kokoro-v1.0.onnx"
+KOKORO_VOICES_PATH = "modelTTS/voices-v1.0.bin"
+PROGRESS_EVERY = 25
+
+
+# --- Manifeste ---
+def read_manifest(path):
+    """Lit un manifeste .csv ou .jsonl en liste de dict (une entrée par ligne non vide)."""
+    path = Path(path)
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            return [row for row in csv.DictReader(f) if any((v or "").strip() for v in row.values())]
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _resolve(name, directory):
+    if not name: return None
+    return str(name) if os.path.exists(name) else str(directory / name)
+
+
+def _safe_id(value):
+    return re.sub(r"[^\w.-]+", "_", str(value)).strip("._") or "item"
+
+
+def build_jobs(rows, args):
+    """Normalise les lignes du manifeste en tâches (valeurs par défaut de la ligne de commande).
+
+    Retourne (tâches, rejets) : une ligne dont une valeur est illisible ou dont l'`id` est déjà pris
+    devient un rejet {"id", "text" ou "phonemes", "error"} au lieu d'arrêter tout le rendu.
+    """
+    jobs, rejected, width = [], [], len(str(len(rows)))
+    # Les id explicites passent avant les id numérotés : une ligne sans id ne prend pas le fichier d'une autre
+    explicit = {_safe_id(row["id"]) for row in rows if row.get("id") not in (None, "")}
+    used = {}
+    for number, row in enumerate(rows, start=1):
+        get = lambda key, default=None: row.get(key) if row.get(key) not in (None, "") else default
+        text, phonemes = (str(get("text") or "")).strip(), (str(get("phonemes") or "")).strip()
+        if not text and not phonemes:
+            logger.warning(f"Manifest line {number}: empty text, skipped.")
+            continue
+        if get("id") is not None:
+            job_id = _safe_id(get("id"))
+        else:
+            job_id, suffix = str(number).zfill(width), 1
+            while job_id in explicit or job_id in used: suffix += 1; job_id = f"{str(number).zfill(width)}_{suffix}"
+        pth = get("pth", args.pth)
+        defaults = RVCParams()
+        try:
+            if job_id in used: raise ValueError(f"duplicate id '{job_id}' (already used on line {used[job_id]})")
+            job = {
+                "id": job_id, "text": phonemes or text, "is_phonemes": bool(phonemes),
+                "voice": get("voice", args.voice), "lang": get("lang", args.lang), "speed": float(get("speed", args.speed)),
+                "model_key": (_resolve(pth, RVC_PTH_DIR), _resolve(get("index", args.index), RVC_INDEX_DIR)) if pth else None,
+                "params": defaults._replace(
+                    f0_up_key=int(get("pitch", args.pitch)), f0_method=get("f0_method", args.f0_method),
+                    index_rate=float(get("index_rate", defaults.index_rate)), protect=float(get("protect", defaults.protect)),
+                ),
+            }
+        except (ValueError, TypeError) as e:
+            logger.error(f"Manifest line {number}: {e}")
+            rejected.append({"id": job_id, "phonemes" if phonemes else "text": phonemes or text, "error": f"Manifest line {number}: {e}"})
+            continue
+        used[job_id] = number
+        jobs.append(job)
+    # Regroupement par modèle : un modèle est chargé une fois et reste "chaud" pour tout son groupe
+    jobs.sort(key=lambda job: tuple(part or "" for part in job["model_key"] or ()))
+    return jobs, rejected
+
+
+# --- Backends ---
+class LocalBackend:
+    """Kokoro + RVC dans ce processus (même interface que InferencePool)."""
+
+    def __init__(self, max_models=2):
+        import torch
+        from kokoro_frontend import load_kokoro_frontend
+        from kokoro_session import create_kokoro_session
+        self.kokoro = load_kokoro_frontend(KOKORO_ONNX_PATH, KOKORO_VOICES_PATH, create_kokoro_session(KOKORO_ONNX_PATH))
+        self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
+        self.cache = ModelCache(max_models=max_models, size_fn=lambda key, rvc: estimate_rvc_model_bytes(rvc, key[1]))
+
+    def tts(self, text, voice, speed, lang, is_phonemes=False):
+        samples, sample_rate = self.kokoro.create(text, voice=voice, speed=speed, lang=lang, is_phonemes=is_phonemes)
+        return sample_rate, samples
+
+    def text_to_rvc(self, text, voice, speed, lang, model_key, params, is_phonemes=False):
+        sample_rate, samples = self.tts(text, voice, speed, lang, is_phonemes)
+        if samples is None or len(samples) == 0: return None
+        rvc_pth_path, rvc_index_path = model_key
+        if rvc_index_path and not os.path.exists(rvc_index_path): rvc_index_path = None
+        rvc = self.cache.get_or_load(model_key, lambda: load_rvc_inference(rvc_pth_path, rvc_index_path, self.device))
+        return rvc_infer_array(rvc, resample_for_rvc(samples, sample_rate), params=params)
+
+    def shutdown(self):
+        self.cache.clear()
+
+
+# --- Rendu ---
+def write_atomic(path, audio, sample_rate, fmt):
+    fd, tmp_path = tempfile.mkstemp(suffix=f".{fmt}.part", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f: sf.write(f, audio, sample_rate, format=fmt.upper(), subtype="PCM_16")
+        os.replace(tmp_path, path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+
+def render_job(backend, job, out_path, fmt):
+    start = time.perf_counter()
+    if job["model_key"]:
+        result = backend.text_to_rvc(job["text"], job["voice"], job["speed"], job["lang"], job["model_key"], job["params"], job["is_phonemes"])
+        if result is None: raise RuntimeError("Kokoro TTS returned no audio.")
+    else:
+        result = backend.tts(job["text"], job["voice"], job["speed"], job["lang"], job["is_phonemes"])
+    sample_rate, audio = result
+    if len(audio) == 0: raise RuntimeError("Empty audio.")
+    write_atomic(out_path, audio, sample_rate, fmt)
+    return len(audio) / sample_rate, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("manifest", help="Fichier .csv ou .jsonl")
+    parser.add_argument("--out", default="batch_output", help="Dossier de sortie")
+    parser.add_argument("--format", default="wav", choices=["wav", "flac"])
+    parser.add_argument("--workers", type=int, default=0, help="Processus d'inférence (0 = dans ce processus)")
+    parser.add_argument("--threads", type=int, default=None, help="Threads par worker (défaut : cœurs / workers)")
+    parser.add_argument("--overwrite", action="store_true", help="Re-rendre les fichiers déjà présents")
+    parser.add_argument("--voice", default="ff_siwis", help="Voix Kokoro par défaut")
+    parser.add_argument("--lang", default="fr-fr")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--pth", default=None, help="Modèle RVC par défaut")
+    parser.add_argument("--index", default=None)
+    parser.add_argument("--pitch", type=int, default=0)
+    parser.add_argument("--f0-method", default="harvest")
+    parser.add_argument("--report", default=None, help="Écrit le résumé (JSON) dans ce fichier")
+    args = parser.parse_args()
+
+    out_dir = Path(args.out); out_dir.mkdir(parents=True, exist_ok=True)
+    for partial in out_dir.glob("*.part"): partial.unlink()  # écritures interrompues par un crash
+    jobs, rejected = build_jobs(read_manifest(args.manifest), args)
+    failures_path = out_dir / "failed.jsonl"
+    if rejected:
+        with open(failures_path, "a", encoding="utf-8") as f:
+            for failure in rejected: f.write(json.dumps(failure, ensure_ascii=False) + "\n")
+    todo = [job for job in jobs if args.overwrite or not (out_dir / f"{job['id']}.{args.format}").exists()]
+    skipped = len(jobs) - len(todo)
+    models = len({job["model_key"] for job in todo if job["model_key"]})
+    logger.info(f"{len(jobs)} jobs, {len(rejected)} invalid, {skipped} already rendered, {len(todo)} to render across {models} RVC model(s).")
+    if not todo: return 1 if rejected else 0
+
+    backend = InferencePool(args.workers, threads_per_worker=args.threads, cache_max_models=max(2, models)) if args.workers > 0 else LocalBackend()
+    if args.workers > 0: backend.warmup(wait=True)
+    audio_seconds, done, failed = 0.0, 0, len(rejected)
+    start = time.perf_counter()
+
+    def run(job):
+        return render_job(backend, job, out_dir / f"{job['id']}.{args.format}", args.format)
+
+    # Un client de plus que de workers : chaque worker a toujours une tâche en attente
+    with ThreadPoolExecutor(max_workers=args.workers + 1 if args.workers > 0 else 1) as clients:
+        futures = {clients.submit(run, job): job for job in todo}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                seconds, _ = future.result()
+                audio_seconds += seconds; done += 1
+            except Exception as e:
+                failed += 1
+                logger.error(f"Job {job['id']} failed: {e}")
+                with open(failures_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"id": job["id"], "phonemes" if job["is_phonemes"] else "text": job["text"], "error": str(e)}, ensure_ascii=False) + "\n")
+            finished = done + failed - len(rejected)
+            if finished % PROGRESS_EVERY == 0:
+                elapsed = time.perf_counter() - start
+                logger.info(f"{finished}/{len(todo)} jobs, {done / elapsed * 60:.1f} files/min")
+    elapsed = time.perf_counter() - start
+    backend.shutdown()
+
+    summary = {
+        "jobs": len(jobs) + len(rejected), "skipped": skipped, "rendered": done, "failed": failed, "invalid": len(rejected),
+        "wall_seconds": round(elapsed, 2), "audio_seconds": round(audio_seconds, 2),
+        "realtime_factor": round(elapsed / audio_seconds, 4) if audio_seconds else None,
+        "files_per_minute": round(done / elapsed * 60, 2) if elapsed else None,
+    }
+    print(f"Rendered {done} file(s) in {elapsed:.1f}s ({summary['files_per_minute']} files/min), "
+          f"{audio_seconds:.1f}s of audio, RTF {summary['realtime_factor']}; {failed} failure(s), {skipped} skipped.")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f: json.dump(summary, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
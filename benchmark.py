@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""Banc de mesure reproductible : TTS Kokoro, conversion RVC et chaîne Texte -> RVC.
+
+Pour chaque étape et chaque niveau de concurrence : facteur temps réel (RTF), latences
+p50/p95/p99, pic de RSS et débit. Le résultat est un JSON que l'on peut comparer à une
+référence sauvegardée (--baseline) pour détecter une régression après une mise à jour
+de dépendance ou un changement de configuration.
+
+Si les poids réels sont absents (modelTTS/, modelRVC/pth/), de petits modèles de
+substitution NumPy déterministes sont utilisés : ils ne mesurent pas Kokoro ou RVC
+eux-mêmes, mais le reste de la chaîne (rééchantillonnage, découpe, concurrence) et
+le banc lui-même restent exécutables sur n'importe quelle machine Linux CPU.
+
+Les caches RVC sont neutralisés (cache de features / F0 de rvc_backend, cache F0 'harvest'
+de rvc_python) : sinon chaque répétition d'une même entrée mesurerait un hit de cache.
+
+Exemples :
+    python benchmark.py --out bench.json
+    python benchmark.py --concurrency 1,4 --baseline bench.json --fail-on-regression
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from audio_pipeline import RVC_INPUT_SAMPLE_RATE, RVCParams, load_rvc_inference, resample_for_rvc, rvc_infer_array
+
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+KOKORO_ONNX_PATH = "modelTTS/kokoro-v1.0.onnx"
+KOKORO_VOICES_PATH = "modelTTS/voices-v1.0.bin"
+RVC_PTH_DIR = Path("modelRVC") / "pth"
+RVC_INDEX_DIR = Path("modelRVC") / "index"
+
+# Corpus fixe : (identifiant, langue, voix Kokoro, texte) -- courts, moyens et longs, plusieurs langues
+CORPUS = [
+    ("fr-short", "fr-fr", "ff_siwis", "Bonjour, comment allez-vous ?"),
+    ("fr-medium", "fr-fr", "ff_siwis",
+     "Votre commande a bien été enregistrée. Vous recevrez un courriel de confirmation dans quelques minutes, "
+     "avec le numéro de suivi de votre colis."),
+    ("fr-long", "fr-fr", "ff_siwis",
+     "Il était une fois, dans un petit village au bord de la mer, une vieille femme qui réparait les filets des pêcheurs. "
+     "Chaque matin, elle s'installait sur le quai, saluait les bateaux qui partaient et racontait aux enfants des histoires "
+     "de tempêtes, de baleines et de phares perdus dans la brume. Personne ne savait d'où elle venait, mais tout le monde "
+     "connaissait sa voix."),
+    ("en-short", "en-us", "af_heart", "Thanks for calling. Please hold."),
+    ("en-medium", "en-us", "af_heart",
+     "Your appointment has been confirmed for Tuesday at three in the afternoon. If you need to reschedule, "
+     "reply to this message or call us at any time."),
+    ("en-long", "en-gb", "bf_emma",
+     "The committee met on Thursday to review the quarterly figures. Revenue grew modestly in every region except the north, "
+     "where a late harvest and a long strike delayed deliveries by several weeks. The board agreed to revisit the forecast "
+     "in the spring, once the new distribution centre is fully operational and the backlog has been cleared."),
+    ("es-medium", "es", "ef_dora", "Gracias por su paciencia. Un agente le atenderá en unos momentos."),
+    ("it-medium", "it", "if_sara", "Il treno regionale per Firenze partirà dal binario quattro con dieci minuti di ritardo."),
+    ("pt-medium", "pt-br", "pf_dora", "Seu pedido saiu para entrega e deve chegar até o final do dia."),
+]
+STAGES = ["tts", "rvc", "text_to_rvc"]
+# Métriques comparées à la référence : True = plus haut est meilleur
+COMPARED_METRICS = {"rtf": False, "latency_p50_ms": False, "latency_p95_ms": False, "latency_p99_ms": False,
+                    "peak_rss_mb": False, "throughput_rps": True}
+
+
+# --- Modèles de substitution (poids absents) ---
+class StandInKokoro:
+    """Synthèse factice déterministe : durée et coût proportionnels à la longueur du texte."""
+    SAMPLE_RATE = 24000
+    HOP = 300
+
+    def __init__(self):
+        rng = np.random.default_rng(0)
+        self.layers = [rng.standard_normal((256, 256)).astype(np.float32) / 16 for _ in range(4)]
+
+    def create(self, text, voice, speed=1.0, lang="en-us"):
+        rng = np.random.default_rng(zlib.crc32(f"{voice}|{text}".encode("utf-8")))
+        frames = max(1, int(len(text) * 0.065 * self.SAMPLE_RATE / self.HOP / speed))
+        hidden = rng.standard_normal((frames, 256)).astype(np.float32)
+        for weights in self.layers: hidden = np.tanh(hidden @ weights)
+        f0 = 140 + 40 * np.repeat(hidden[:, 0], self.HOP)
+        phase = 2 * np.pi * np.cumsum(f0) / self.SAMPLE_RATE
+        envelope = np.repeat(np.abs(hidden[:, 1]), self.HOP)
+        audio = sum(np.sin(k * phase) / k for k in range(1, 8)) * envelope
+        return (0.3 * audio / (np.abs(audio).max() + 1e-9)).astype(np.float32), self.SAMPLE_RATE
+
+
+class StandInRVC:
+    """Conversion factice : trames de 20 ms -> petit réseau dense -> audio à 40 kHz."""
+    SAMPLE_RATE = 40000
+    FRAME = 320
+
+    def __init__(self):
+        rng = np.random.default_rng(1)
+        self.project = rng.standard_normal((self.FRAME, 256)).astype(np.float32) / 18
+        self.layers = [rng.standard_normal((256, 256)).astype(np.float32) / 16 for _ in range(3)]
+
+    def convert(self, audio_16k, params):
+        frames = len(audio_16k) // self.FRAME
+        if frames == 0: return self.SAMPLE_RATE, np.zeros(0)
+        hidden = np.tanh(audio_16k[:frames * self.FRAME].reshape(frames, self.FRAME) @ self.project)
+        for weights in self.layers: hidden = np.tanh(hidden @ weights)
+        hop = self.FRAME * self.SAMPLE_RATE // RVC_INPUT_SAMPLE_RATE
+        semitone = 2 ** (params.f0_up_key / 12)
+        f0 = semitone * (150 + 30 * np.repeat(hidden[:, 0], hop))
+        phase = 2 * np.pi * np.cumsum(f0) / self.SAMPLE_RATE
+        audio = np.sin(phase) * np.repeat(np.abs(hidden[:, 1]), hop)
+        return self.SAMPLE_RATE, (0.3 * audio).astype(np.float64)
+
+
+# --- Backends ---
+def build_backend(args):
+    """Retourne (tts(text, voice, speed, lang), rvc(audio_16k), description)."""
+    meta = {}
+    if not args.stand_in and os.path.exists(KOKORO_ONNX_PATH) and os.path.exists(KOKORO_VOICES_PATH):
+        from kokoro_onnx import Kokoro
+        from kokoro_session import create_kokoro_session, session_info
+        kokoro = Kokoro.from_session(create_kokoro_session(KOKORO_ONNX_PATH, args.kokoro_profile), KOKORO_VOICES_PATH)
+        # Profil réellement utilisé (int8 retombe sur optimized sans modèle quantifié) : --baseline signale un changement
+        meta["kokoro"] = f"kokoro-v1.0.onnx ({session_info()['profile']})"
+    else:
+        kokoro = StandInKokoro()
+        meta["kokoro"] = "stand-in"
+    def tts(text, voice, speed, lang):
+        samples, sample_rate = kokoro.create(text, voice=voice, speed=speed, lang=lang)
+        return sample_rate, samples
+
+    params = RVCParams(f0_up_key=args.pitch, f0_method=args.f0_method)
+    pth = args.pth or next((str(p) for p in sorted(RVC_PTH_DIR.glob("*.pth"))), None)
+    if not args.stand_in and pth:
+        pth_path = pth if os.path.exists(pth) else str(RVC_PTH_DIR / pth)
+        index_path = (args.index if os.path.exists(args.index) else str(RVC_INDEX_DIR / args.index)) if args.index else None
+        # Avant le chargement : le HuBERT partagé et le hook F0 lisent FEATURE_CACHE à leur création
+        import rvc_backend
+        rvc_backend.FEATURE_CACHE = None
+        rvc_model = load_rvc_inference(pth_path, index_path, args.device)
+        calls = itertools.count()
+        def rvc(audio_16k):
+            # Clé d'audio unique : le cache 'harvest' de rvc_python (par chemin d'entrée) ne sert jamais une répétition
+            audio_key = f"benchmark-{next(calls)}"
+            return rvc_infer_array(rvc_model, audio_16k, params=params, audio_key=audio_key)
+        meta["rvc"] = os.path.basename(pth_path) + (f" + {os.path.basename(index_path)}" if index_path else "")
+    else:
+        stand_in = StandInRVC()
+        rvc = lambda audio_16k: stand_in.convert(audio_16k, params)
+        meta["rvc"] = "stand-in"
+    meta.update(device=args.device, rvc_params=params._asdict(),
+                caches={"rvc_feature_cache": False, "rvc_harvest_f0_cache": False})
+    return tts, rvc, meta
+
+
+# --- Mesures ---
+def _current_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f: return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakRSS:
+    """Échantillonne la RSS du processus pendant un bloc `with` et garde le maximum."""
+
+    def __init__(self, interval=0.01):
+        self.interval, self.peak = interval, 0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _current_rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = _current_rss_bytes()
+        self._thread = threading.Thread(target=self._run, daemon=True); self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set(); self._thread.join()
+        self.peak = max(self.peak, _current_rss_bytes())
+
+
+def _percentile_ms(latencies, q):
+    return round(float(np.percentile(latencies, q)) * 1000, 2)
+
+
+def run_stage(fn, inputs, concurrency, repeats):
+    """Exécute fn(x) sur tous les inputs (x repeats) avec `concurrency` clients ; retourne les métriques."""
+    for x in inputs[:concurrency]: fn(x)  # chauffe (allocations, caches) hors mesure
+    jobs = [x for _ in range(repeats) for x in inputs]
+    def timed(x):
+        start = time.perf_counter()
+        sample_rate, audio = fn(x)
+        return time.perf_counter() - start, len(audio) / sample_rate
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as clients: results = list(clients.map(timed, jobs))
+        wall = time.perf_counter() - start
+    latencies = [r[0] for r in results]
+    audio_seconds = sum(r[1] for r in results)
+    return {
+        "requests": len(jobs), "wall_seconds": round(wall, 3), "audio_seconds": round(audio_seconds, 3),
+        "rtf": round(sum(latencies) / audio_seconds, 4) if audio_seconds else None,
+        "wall_rtf": round(wall / audio_seconds, 4) if audio_seconds else None,
+        "latency_p50_ms": _percentile_ms(latencies, 50), "latency_p95_ms": _percentile_ms(latencies, 95),
+        "latency_p99_ms": _percentile_ms(latencies, 99),
+        "throughput_rps": round(len(jobs) / wall, 3), "peak_rss_mb": round(rss.peak / 2**20, 1),
+    }
+
+
+def environment_info():
+    versions = {}
+    for module in ("numpy", "onnxruntime", "torch", "kokoro_onnx", "av", "soundfile"):
+        try: versions[module] = getattr(__import__(module), "__version__", "?")
+        except Exception: pass  # module absent ou non importable : simplement non listé
+    return {"python": platform.python_version(), "platform": platform.platform(), "machine": platform.machine(),
+            "cpu_count": os.cpu_count(), "versions": versions}
+
+
+def run_benchmark(args):
+    np.random.seed(0)
+    corpus = [item for item in CORPUS if not args.langs or item[1] in args.langs]
+    tts, rvc, models = build_backend(args)
+    def tts_item(item):
+        _, lang, voice, text = item
+        return tts(text, voice, args.speed, lang)
+    def tts_item_16k(item):
+        sample_rate, samples = tts_item(item)
+        return resample_for_rvc(samples, sample_rate)
+    # Entrées RVC : sortie TTS du corpus, rééchantillonnée une fois pour toutes (hors mesure)
+    rvc_inputs = [tts_item_16k(item) for item in corpus]
+    stage_fns = {
+        "tts": (tts_item, corpus),
+        "rvc": (rvc, rvc_inputs),
+        "text_to_rvc": (lambda item: rvc(tts_item_16k(item)), corpus),
+    }
+    results = {}
+    for stage in args.stages:
+        fn, inputs = stage_fns[stage]
+        results[stage] = {}
+        for concurrency in args.concurrency:
+            metrics = run_stage(fn, inputs, concurrency, args.repeats)
+            results[stage][f"c{concurrency}"] = metrics
+            print(f"{stage:>12} c={concurrency:<3} RTF {metrics['rtf']}  p50 {metrics['latency_p50_ms']} ms  "
+                  f"p95 {metrics['latency_p95_ms']} ms  p99 {metrics['latency_p99_ms']} ms  "
+                  f"{metrics['throughput_rps']} req/s  peak RSS {metrics['peak_rss_mb']} MB")
+    corpus_hash = hashlib.sha1(json.dumps(corpus, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+    return {
+        "meta": {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "corpus": corpus_hash, "repeats": args.repeats,
+                 "models": models, "environment": environment_info()},
+        "stages": results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Affiche les écarts avec la référence ; retourne la liste des régressions au-delà de `threshold` (fraction)."""
+    if current["meta"]["models"] != baseline["meta"].get("models") or current["meta"]["corpus"] != baseline["meta"].get("corpus"):
+        print("WARNING: models or corpus differ from the baseline; the comparison may not be meaningful.")
+    regressions = []
+    print(f"{'stage':>12} {'load':>5} {'metric':>16} {'baseline':>10} {'current':>10} {'delta':>8}")
+    for stage, levels in current["stages"].items():
+        for level, metrics in levels.items():
+            base = baseline.get("stages", {}).get(stage, {}).get(level)
+            if not base: continue
+            for metric, higher_is_better in COMPARED_METRICS.items():
+                old, new = base.get(metric), metrics.get(metric)
+                if not old or new is None: continue
+                delta = (new - old) / old
+                worse = -delta if higher_is_better else delta
+                flag = "  REGRESSION" if worse > threshold else ""
+                if flag: regressions.append(f"{stage}/{level}/{metric}")
+                print(f"{stage:>12} {level:>5} {metric:>16} {old:>10} {new:>10} {delta:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Étapes mesurées parmi {','.join(STAGES)}")
+    parser.add_argument("--concurrency", default="1,4", help="Nombres de clients simultanés")
+    parser.add_argument("--repeats", type=int, default=3, help="Passes sur le corpus par mesure")
+    parser.add_argument("--langs", default="", help="Filtre de langues du corpus (ex. fr-fr,en-us)")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--pth", default=None, help="Modèle RVC (défaut : premier .pth de modelRVC/pth)")
+    parser.add_argument("--index", default=None)
+    parser.add_argument("--pitch", type=int, default=0)
+    parser.add_argument("--f0-method", default="harvest")
+    parser.add_argument("--device", default="cpu", help="Périphérique RVC (cpu, cuda:0...)")
+    parser.add_argument("--kokoro-profile", default=None, help="Profil ONNX de Kokoro (default, optimized, int8 ; défaut : KOKORO_ONNX_PROFILE)")
+    parser.add_argument("--stand-in", action="store_true", help="Forcer les modèles de substitution")
+    parser.add_argument("--out", default=None, help="Écrit les résultats JSON dans ce fichier")
+    parser.add_argument("--baseline", default=None, help="Résultats JSON de référence à comparer")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Écart toléré avant de signaler une régression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Code de sortie 1 si une régression est détectée")
+    args = parser.parse_args()
+    args.stages = [s for s in args.stages.split(",") if s]
+    unknown = set(args.stages) - set(STAGES)
+    if unknown: parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c]
+    args.langs = [l for l in args.langs.split(",") if l]
+
+    results = run_benchmark(args)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f: json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Results written to {args.out}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f: baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}" + (f": {', '.join(regressions)}" if regressions else ""))
+        if regressions and args.fail_on_regression: return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
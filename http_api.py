@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+"""API HTTP asynchrone pour tts, rvc et text_to_rvc : file d'attente bornée, 429 et annulation.
+
+- POST /v1/tts et /v1/text_to_rvc (paramètres en JSON), POST /v1/rvc (fichier audio brut dans
+  le corps, paramètres dans l'URL), GET /v1/stats ; servie à côté de l'UI Gradio ou seule
+  (HTTP_API=on / only, cf. main.py) ;
+- file d'attente bornée, servie par priorité (`priority`, la plus haute d'abord) puis par ordre
+  d'arrivée ; file pleine, ou trop de requêtes pour un même client (en-tête X-Client-Id, sinon
+  adresse IP) : réponse 429 avec un Retry-After estimé d'après la durée moyenne des requêtes ;
+- le calcul avance morceau par morceau (groupes de phrases Kokoro, tranches RVC) dans un
+  thread : si le client se déconnecte, en attente ou en cours, le travail s'arrête au morceau suivant ;
+- réponse en octets bruts : PCM 16 bits mono little-endian (`format=pcm`, taux dans l'en-tête
+  X-Sample-Rate) ou Ogg Opus (`format=opus`), en un bloc ou en flux (`stream=true`) ;
+- endpoints "archive" (POST /v1/text_to_rvc_fanout) : un fichier par voix dans un zip (WAV ou
+  Ogg Opus selon `format`), chaque fichier étant ajouté dès que sa voix est prête.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import math
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+
+import av
+import numpy as np
+
+from audio_pipeline import quantize_pcm16, wav_bytes
+from metrics import REQUESTS, record_stage
+
+logger = logging.getLogger(__name__)
+
+# Requêtes calculées en même temps, requêtes en attente au-delà, requêtes par client (en attente + en cours)
+HTTP_API_CONCURRENCY = int(os.environ.get("HTTP_API_CONCURRENCY", "2"))
+HTTP_API_MAX_QUEUE = int(os.environ.get("HTTP_API_MAX_QUEUE", "32"))
+HTTP_API_PER_CLIENT = int(os.environ.get("HTTP_API_PER_CLIENT", "4"))
+OPUS_BITRATE = 64000
+OPUS_PAGE_MICROSECONDS = 100000  # pages Ogg courtes : le flux Opus part sans attendre la fin
+_END = object()
+
+
+class Rejected(Exception):
+    """Requête refusée (file pleine ou limite par client), à retenter après `retry_after` secondes."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+class BadRequest(Exception):
+    """Paramètre manquant ou mal formé : réponse 400 avec ce message."""
+
+
+_REQUIRED = object()
+
+
+def get_param(params, name, default=_REQUIRED, kind=None):
+    """params[name] converti par `kind` ; BadRequest s'il manque (sans `default`) ou s'il ne se convertit pas."""
+    value = params.get(name)
+    if value is None or value == "":
+        if default is _REQUIRED: raise BadRequest(f"Missing parameter: {name}")
+        return default
+    if kind is None: return value
+    try: return kind(value)
+    except (ValueError, TypeError): raise BadRequest(f"Invalid value for '{name}': {value!r}") from None
+
+
+class RequestQueue:
+    """File d'attente à priorités avec limite de concurrence ; à utiliser depuis un seul event loop."""
+
+    def __init__(self, max_concurrency=HTTP_API_CONCURRENCY, max_queue=HTTP_API_MAX_QUEUE, per_client=HTTP_API_PER_CLIENT):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.per_client = per_client   # 0 = pas de limite
+        self._running = self._waiting = 0
+        self._heap = []                # (-priorité, n° d'arrivée, future) ; les futures annulées y restent jusqu'au pop
+        self._order = itertools.count()
+        self._clients = {}             # client -> requêtes en attente ou en cours
+        self._service_seconds = 1.0    # moyenne glissante de la durée de calcul d'une requête
+        self._accepted = self._rejected = self._completed = 0
+
+    def retry_after(self):
+        """Secondes estimées avant qu'une place se libère."""
+        return max(1, math.ceil(self._service_seconds * (self._waiting + 1) / self.max_concurrency))
+
+    async def acquire(self, client, priority=0):
+        """Attend une place de calcul ; lève Rejected au lieu d'attendre si la file est pleine."""
+        if self.per_client and self._clients.get(client, 0) >= self.per_client:
+            self._rejected += 1
+            raise Rejected("Too many concurrent requests for this client.", self.retry_after())
+        if self._running >= self.max_concurrency and self._waiting >= self.max_queue:
+            self._rejected += 1
+            raise Rejected("Request queue is full.", self.retry_after())
+        self._clients[client] = self._clients.get(client, 0) + 1
+        self._accepted += 1
+        if self._running < self.max_concurrency and not self._waiting:
+            self._running += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (-priority, next(self._order), future))
+        self._waiting += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self._waiting -= 1
+                self._client_done(client)
+            else:
+                self.release(client)  # place obtenue juste avant l'annulation : on la rend
+            raise
+
+    def release(self, client, seconds=None):
+        """Libère la place d'une requête terminée et la donne à la suivante ; `seconds` : durée de calcul."""
+        self._client_done(client)
+        if seconds is not None:
+            self._completed += 1
+            self._service_seconds += 0.2 * (seconds - self._service_seconds)
+        while self._heap:
+            _, _, future = heapq.heappop(self._heap)
+            if not future.done():
+                self._waiting -= 1
+                future.set_result(None)
+                return
+        self._running -= 1
+
+    def _client_done(self, client):
+        count = self._clients.get(client, 0) - 1
+        if count > 0: self._clients[client] = count
+        else: self._clients.pop(client, None)
+
+    def stats(self):
+        return {"running": self._running, "queued": self._waiting, "clients": len(self._clients),
+                "max_concurrency": self.max_concurrency, "max_queue": self.max_queue, "per_client": self.per_client,
+                "accepted": self._accepted, "rejected": self._rejected, "completed": self._completed,
+                "avg_service_seconds": round(self._service_seconds, 3), "retry_after": self.retry_after()}
+
+
+class _Job:
+    """Générateur bloquant exécuté dans un thread ; ses morceaux arrivent dans une asyncio.Queue."""
+
+    def __init__(self, make_chunks, executor):
+        loop = asyncio.get_running_loop()
+        self.chunks = asyncio.Queue()
+        self._stop = threading.Event()
+        self.done = loop.run_in_executor(executor, self._run, loop, make_chunks)
+
+    def _run(self, loop, make_chunks):
+        put = lambda item: loop.call_soon_threadsafe(self.chunks.put_nowait, item)
+        iterator = None
+        try:
+            iterator = iter(make_chunks())
+            # Annulation vérifiée avant chaque morceau : le morceau en cours se termine, pas le suivant
+            while not self._stop.is_set():
+                chunk = next(iterator, _END)
+                if chunk is _END: break
+                put(chunk)
+        except Exception as e:
+            put(e)
+        finally:
+            # Ferme le générateur (GeneratorExit : compté "cancelled" par instrument_stream s'il n'était pas fini)
+            if hasattr(iterator, "close"): iterator.close()
+            put(_END)
+
+    def cancel(self):
+        self._stop.set()
+
+    async def next(self):
+        """Morceau suivant (sample_rate, samples[, nom]), ou None à la fin du calcul."""
+        item = await self.chunks.get()
+        if isinstance(item, Exception): raise item
+        return None if item is _END else item
+
+
+class _PCMEncoder:
+    """PCM 16 bits mono little-endian, sans en-tête (même arrondi que les WAV de l'UI)."""
+    media_type = "application/octet-stream"
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+
+    def headers(self):
+        return {"X-Sample-Rate": str(self.sample_rate), "X-Channels": "1", "X-Sample-Format": "s16le"}
+
+    def encode(self, chunk):
+        return quantize_pcm16(chunk[1], self.sample_rate).tobytes()
+
+    def finish(self):
+        return b""
+
+
+class _OpusEncoder:
+    """Ogg Opus (libopus via PyAV, rééchantillonné à 48 kHz) ; les pages sortent au fil de l'encodage."""
+    media_type = "audio/ogg; codecs=opus"
+
+    def __init__(self, sample_rate):
+        self.sample_rate, self._samples, self._pages = sample_rate, 0, []
+        self._container = av.open(self, mode="w", format="ogg", options={"page_duration": str(OPUS_PAGE_MICROSECONDS)}, buffer_size=4096)
+        self._stream = self._container.add_stream("libopus", rate=48000, layout="mono")
+        self._stream.bit_rate = OPUS_BITRATE
+
+    def write(self, data):
+        # Appelé par le muxer (cet objet sert de fichier de sortie à av.open)
+        self._pages.append(bytes(data))
+        return len(data)
+
+    def headers(self):
+        return {"X-Sample-Rate": "48000", "X-Channels": "1"}
+
+    def encode(self, chunk):
+        frame = av.AudioFrame.from_ndarray(np.asarray(chunk[1], dtype=np.float32).reshape(1, -1), format="flt", layout="mono")
+        frame.sample_rate, frame.pts, frame.time_base = self.sample_rate, self._samples, Fraction(1, self.sample_rate)
+        self._samples += frame.samples
+        return self._mux(frame)
+
+    def finish(self):
+        data = self._mux(None)
+        self._container.close()
+        return data + self._drain()
+
+    def _mux(self, frame):
+        for packet in self._stream.encode(frame): self._container.mux(packet)
+        return self._drain()
+
+    def _drain(self):
+        data = b"".join(self._pages); self._pages.clear()
+        return data
+
+
+ENCODERS = {"pcm": _PCMEncoder, "opus": _OpusEncoder}
+
+
+class _ZipEncoder:
+    """Zip produit au fil de l'eau : un fichier par morceau (sample_rate, samples, nom), WAV 16 bits ou Ogg Opus."""
+    media_type = "application/zip"
+
+    def __init__(self, entry_format):
+        self.entry_format, self._data = entry_format, []
+        # Sortie non seekable : zipfile écrit la taille de chaque fichier après ses données
+        self._zip = zipfile.ZipFile(self, mode="w")
+
+    def write(self, data):
+        self._data.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def headers(self):
+        return {"Content-Disposition": 'attachment; filename="voices.zip"'}
+
+    def encode(self, chunk):
+        sample_rate, samples, name = chunk
+        if self.entry_format == "opus":
+            encoder = _OpusEncoder(sample_rate)
+            self._zip.writestr(f"{name}.ogg", encoder.encode(chunk) + encoder.finish())
+        else:
+            self._zip.writestr(f"{name}.wav", wav_bytes(samples, sample_rate))
+        return self._drain()
+
+    def finish(self):
+        self._zip.close()
+        return self._drain()
+
+    def _drain(self):
+        data = b"".join(self._data); self._data.clear()
+        return data
+
+
+def _as_bool(value):
+    return value if isinstance(value, bool) else str(value).lower() in ("1", "true", "yes")
+
+
+async def _read_params(request):
+    """Paramètres (URL + corps JSON) et corps brut quand ce n'est pas du JSON (audio à convertir)."""
+    params = dict(request.query_params)
+    body = await request.body()
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try: data = json.loads(body or b"{}")
+        except ValueError as e: raise BadRequest(f"Invalid JSON body: {e}") from None
+        if not isinstance(data, dict): raise BadRequest("JSON body must be an object.")
+        params.update(data)
+        return params, None
+    return params, body or None
+
+
+async def _wait_disconnect(request):
+    # Le corps est déjà lu : le seul message restant est la déconnexion du client
+    while (await request.receive())["type"] != "http.disconnect": pass
+
+
+async def _unless_disconnected(awaitable, disconnected):
+    """Attend `awaitable`, ou lève ClientDisconnected si le client part avant."""
+    task = asyncio.ensure_future(awaitable)
+    await asyncio.wait({task, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+    if task.done(): return task.result()
+    task.cancel()
+    try: await task
+    except asyncio.CancelledError: pass
+    raise ClientDisconnected()
+
+
+class HTTPInferenceAPI:
+    """Endpoints HTTP au-dessus de générateurs bloquants de morceaux audio.
+
+    `handlers` : {nom: fn(params, body) -> itérateur de (sample_rate, samples float32)} ; `body`
+    est le corps brut (audio) pour les requêtes non JSON, sinon None. Les handlers nommés dans
+    `archives` produisent (sample_rate, samples, nom de fichier) et répondent par un zip. Les
+    handlers valident leurs paramètres (get_param) : BadRequest et les exceptions de
+    `client_errors` donnent une réponse 400, toutes les autres 500.
+    """
+
+    def __init__(self, handlers, client_errors=(), queue=None, archives=()):
+        self.handlers = handlers
+        self.archives = set(archives)
+        self.client_errors = (BadRequest, *client_errors)
+        self.queue = queue or RequestQueue()
+        self._executor = ThreadPoolExecutor(max_workers=self.queue.max_concurrency, thread_name_prefix="http-api")
+        self._disconnects = 0
+
+    def routes(self, prefix="/v1"):
+        """Routes Starlette, à passer à l'app Gradio (app_kwargs) ou à une app Starlette seule."""
+        from starlette.responses import JSONResponse
+        from starlette.routing import Route
+        def endpoint(name):
+            async def handle(request): return await self.handle(name, request)
+            return handle
+        async def stats(request): return JSONResponse(self.stats())
+        routes = [Route(f"{prefix}/{name}", endpoint(name), methods=["POST"]) for name in self.handlers]
+        return routes + [Route(f"{prefix}/stats", stats, methods=["GET"])]
+
+    def stats(self):
+        return dict(self.queue.stats(), disconnects=self._disconnects)
+
+    async def handle(self, name, request):
+        from starlette.responses import JSONResponse, Response, StreamingResponse
+        endpoint = f"http_{name}"
+        try:
+            params, body = await _read_params(request)
+            output_format = str(params.pop("format", "pcm")).lower()
+            stream, priority = _as_bool(params.pop("stream", False)), get_param(params, "priority", 0, int)
+            if output_format not in ENCODERS: raise BadRequest(f"Unknown format '{output_format}' (expected: {', '.join(ENCODERS)}).")
+        except BadRequest as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        client = request.headers.get("x-client-id") or (request.client.host if request.client else "unknown")
+        disconnected = asyncio.ensure_future(_wait_disconnect(request))
+        job, streaming = None, False
+        try:
+            queued_at = time.perf_counter()
+            try: await _unless_disconnected(self.queue.acquire(client, priority), disconnected)
+            except Rejected as e:
+                REQUESTS.inc(endpoint, "rejected")
+                return JSONResponse({"error": str(e), "retry_after": e.retry_after}, status_code=429, headers={"Retry-After": str(e.retry_after)})
+            record_stage("http_queue_wait", time.perf_counter() - queued_at)
+            started_at = time.perf_counter()
+            job = _Job(lambda: self.handlers[name](params, body), self._executor)
+            # La place est rendue quand le thread s'arrête vraiment, pas au départ du client
+            job.done.add_done_callback(lambda _: self.queue.release(client, time.perf_counter() - started_at))
+            first = await _unless_disconnected(job.next(), disconnected)
+            if first is None: return Response(status_code=204)
+            encoder = _ZipEncoder(output_format) if name in self.archives else ENCODERS[output_format](first[0])
+            if stream:
+                streaming = True
+                disconnected.cancel()  # StreamingResponse surveille elle-même la déconnexion
+                async def chunks():
+                    try:
+                        yield encoder.encode(first)
+                        while (chunk := await job.next()) is not None: yield encoder.encode(chunk)
+                        yield encoder.finish()
+                    finally:
+                        job.cancel()  # sans effet si le calcul est fini
+                return StreamingResponse(chunks(), media_type=encoder.media_type, headers=encoder.headers())
+            parts = [encoder.encode(first)]
+            while (chunk := await _unless_disconnected(job.next(), disconnected)) is not None: parts.append(encoder.encode(chunk))
+            parts.append(encoder.finish())
+            return Response(b"".join(parts), media_type=encoder.media_type, headers=encoder.headers())
+        except ClientDisconnected:
+            self._disconnects += 1
+            if job is None: REQUESTS.inc(endpoint, "cancelled")
+            logger.info(f"HTTP API client {client} disconnected; {name} request cancelled.")
+            return Response(status_code=499)
+        except Exception as e:
+            message = getattr(e, "message", None) or str(e)
+            if isinstance(e, self.client_errors): return JSONResponse({"error": message}, status_code=400)
+            logger.error(f"HTTP API {name} request failed: {e}", exc_info=True)
+            return JSONResponse({"error": message}, status_code=500)
+        finally:
+            disconnected.cancel()
+            if job is not None and not streaming: job.cancel()
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""Pool de processus d'inférence Kokoro + RVC, avec affinité de modèle.
+
+Chaque worker est un processus qui possède sa propre session ONNX Kokoro et son propre
+cache de modèles RVC. Les threads intra-op (torch / onnxruntime / OpenMP) sont limités
+par worker pour que N workers n'occupent pas plus de cœurs que la machine n'en a.
+Les requêtes RVC sont routées vers un worker qui détient déjà le .pth demandé.
+
+Les variables de threads (OMP_NUM_THREADS...) sont fixées dans l'environnement du processus
+principal avant le démarrage des workers : un enfant "spawn" réimporte le module principal
+(main.py, donc numpy / torch...) avant d'exécuter _init_worker, trop tard pour les y fixer.
+main.py saute alors le scan des modèles, l'API HTTP et l'interface (IS_INFERENCE_WORKER).
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import record_stage
+
+logger = logging.getLogger(__name__)
+
+# Un worker "affin" n'est préféré que si sa file d'attente ne dépasse pas de plus de
+# SPILL_THRESHOLD requêtes celle du worker le moins chargé (sinon on duplique le modèle).
+SPILL_THRESHOLD = 2
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+def default_threads_per_worker(num_workers):
+    return max(1, (os.cpu_count() or 1) // max(1, num_workers))
+
+
+# ==================================================
+#           CÔTÉ WORKER (processus enfant)
+# ==================================================
+_WORKER = {}
+
+
+def _init_worker(worker_id, threads, kokoro_onnx_path, kokoro_voices_path, cache_max_models, cache_max_bytes=None):
+    # THREAD_ENV_VARS sont hérités du parent (cf. InferencePool) ; torch et onnxruntime sont aussi réglés explicitement
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s - worker{worker_id} - %(levelname)s - %(message)s')
+    import torch
+    torch.set_num_threads(threads)
+    try: torch.set_num_interop_threads(1)
+    except RuntimeError: pass  # déjà fixé dans ce processus
+    import audio_pipeline
+    from rvc_cache import ModelCache, estimate_rvc_model_bytes
+
+    kokoro = None
+    if os.path.exists(kokoro_onnx_path) and os.path.exists(kokoro_voices_path):
+        from kokoro_frontend import load_kokoro_frontend
+        from kokoro_session import create_kokoro_session
+        session = create_kokoro_session(kokoro_onnx_path, intra_threads=threads, inter_threads=1)
+        kokoro = load_kokoro_frontend(kokoro_onnx_path, kokoro_voices_path, session)
+    else:
+        logger.error(f"Kokoro TTS files not found. Check paths: {kokoro_onnx_path}, {kokoro_voices_path}")
+    _WORKER.update(
+        id=worker_id, kokoro=kokoro, pipeline=audio_pipeline,
+        device="cuda:0" if torch.cuda.is_available() else "cpu",
+        cache=ModelCache(max_models=cache_max_models, max_bytes=cache_max_bytes, size_fn=lambda key, rvc: estimate_rvc_model_bytes(rvc, key[1])),
+    )
+    logger.info(f"Inference worker {worker_id} ready ({threads} threads, Kokoro {'loaded' if kokoro else 'missing'})")
+
+
+def _worker_models():
+    return _WORKER["cache"].keys()
+
+
+def _worker_ping():
+    return _WORKER["id"], _worker_models()
+
+
+def _worker_traced(fn, *args):
+    # Les durées mesurées dans le worker repartent avec le résultat (cf. InferencePool._run)
+    from metrics import request_trace
+    with request_trace(fn.__name__) as trace:
+        result, models = fn(*args)
+    return result, models, trace.stages
+
+
+def _worker_kokoro(text, voice, speed, lang, is_phonemes=False):
+    from metrics import span
+    kokoro = _WORKER["kokoro"]
+    if kokoro is None: raise RuntimeError("Kokoro TTS model is not loaded in inference worker.")
+    with span("kokoro"): return kokoro.create(text, voice=voice, speed=speed, lang=lang, is_phonemes=is_phonemes)
+
+
+def _worker_load_rvc(model_key):
+    pipeline = _WORKER["pipeline"]
+    rvc_pth_path, rvc_index_path = model_key
+    if rvc_index_path and not os.path.exists(rvc_index_path): rvc_index_path = None
+    def load():
+        from metrics import span
+        with span("rvc_model_load"): return pipeline.load_rvc_inference(rvc_pth_path, rvc_index_path, _WORKER["device"])
+    return _WORKER["cache"].get_or_load(model_key, load)
+
+
+def _worker_rvc_convert(audio_16k, model_key, params, audio_key):
+    rvc = _worker_load_rvc(model_key)
+    return _WORKER["pipeline"].rvc_infer_array(rvc, audio_16k, params=params, audio_key=audio_key)
+
+
+def _worker_tts(text, voice, speed, lang, is_phonemes):
+    samples, sample_rate = _worker_kokoro(text, voice, speed, lang, is_phonemes)
+    return (sample_rate, samples), _worker_models()
+
+
+def _worker_phonemize(text, lang):
+    kokoro = _WORKER["kokoro"]
+    if kokoro is None: raise RuntimeError("Kokoro TTS model is not loaded in inference worker.")
+    return kokoro.phonemize(text, lang), _worker_models()
+
+
+def _worker_tts_batch(texts, voice, speed, lang):
+    kokoro = _WORKER["kokoro"]
+    if kokoro is None: raise RuntimeError("Kokoro TTS model is not loaded in inference worker.")
+    from tts_scheduler import kokoro_create_batch
+    return kokoro_create_batch(kokoro, texts, voice, speed, lang), _worker_models()
+
+
+def _worker_preload(model_key):
+    _worker_load_rvc(model_key)
+    return None, _worker_models()
+
+
+def _worker_invalidate(paths):
+    cache = _WORKER["cache"]
+    for key in cache.keys():
+        if key[0] in paths or key[1] in paths: cache.invalidate(key)
+    return _WORKER["id"], _worker_models()
+
+
+def _worker_rvc(audio_16k, model_key, params, audio_key):
+    return _worker_rvc_convert(audio_16k, model_key, params, audio_key), _worker_models()
+
+
+def _worker_text_to_rvc(text, voice, speed, lang, model_key, params, is_phonemes):
+    # Un seul aller-retour : l'audio Kokoro ne repasse pas par le processus principal
+    samples, sample_rate = _worker_kokoro(text, voice, speed, lang, is_phonemes)
+    if samples is None or len(samples) == 0: return None, _worker_models()
+    from metrics import span
+    with span("resample"): audio_16k = _WORKER["pipeline"].resample_for_rvc(samples, sample_rate)
+    return _worker_rvc_convert(audio_16k, model_key, params, None), _worker_models()
+
+
+# ==================================================
+#           CÔTÉ PROCESSUS PRINCIPAL
+# ==================================================
+class InferencePool:
+    """Pool de N workers d'inférence ; chaque appel bloque jusqu'au résultat (utilisable depuis plusieurs threads)."""
+
+    def __init__(self, num_workers, threads_per_worker=None, kokoro_onnx_path="modelTTS/kokoro-v1.0.onnx",
+                 kokoro_voices_path="modelTTS/voices-v1.0.bin", cache_max_models=8, cache_max_bytes=None,
+                 spill_threshold=SPILL_THRESHOLD):
+        self.num_workers = max(1, int(num_workers))
+        self.threads_per_worker = threads_per_worker or default_threads_per_worker(self.num_workers)
+        self.spill_threshold = spill_threshold
+        self._init_args = (kokoro_onnx_path, kokoro_voices_path, cache_max_models, cache_max_bytes)
+        self._context = multiprocessing.get_context("spawn")  # pas de fork après l'init de torch / onnxruntime
+        # Hérités par les workers au démarrage (et aux redémarrages) ; le processus principal délègue l'inférence
+        for var in THREAD_ENV_VARS: os.environ[var] = str(self.threads_per_worker)
+        self._lock = threading.Lock()
+        self._executors = [self._new_executor(i) for i in range(self.num_workers)]
+        self._pending = [0] * self.num_workers
+        self._models = [set() for _ in range(self.num_workers)]
+        self._completed = [0] * self.num_workers
+        self._affinity_hits = self._spills = self._restarts = 0
+        logger.info(f"Inference pool: {self.num_workers} workers x {self.threads_per_worker} threads")
+
+    def _new_executor(self, worker_id):
+        return ProcessPoolExecutor(
+            max_workers=1, mp_context=self._context, initializer=_init_worker,
+            initargs=(worker_id, self.threads_per_worker) + self._init_args,
+        )
+
+    def _pick_worker(self, model_key=None):
+        with self._lock:
+            least_loaded = min(range(self.num_workers), key=lambda i: (self._pending[i], len(self._models[i])))
+            if model_key is not None:
+                holders = [i for i in range(self.num_workers) if model_key in self._models[i]]
+                if holders:
+                    best = min(holders, key=lambda i: self._pending[i])
+                    if self._pending[best] - self._pending[least_loaded] <= self.spill_threshold:
+                        self._affinity_hits += 1
+                        chosen = best
+                    else:
+                        self._spills += 1
+                        chosen = least_loaded
+                else:
+                    chosen = least_loaded
+            else:
+                chosen = least_loaded
+            self._pending[chosen] += 1
+            return chosen
+
+    def _run(self, model_key, fn, *args):
+        worker_id = self._pick_worker(model_key)
+        start = time.perf_counter()
+        executor = self._executors[worker_id]
+        try:
+            result, models, stages = executor.submit(_worker_traced, fn, *args).result()
+        except BrokenProcessPool:
+            # Worker mort (OOM, crash natif) : on le relance pour les requêtes suivantes, une seule fois
+            # même si plusieurs requêtes en cours sur ce worker échouent ensemble
+            with self._lock:
+                restart = self._executors[worker_id] is executor
+                if restart:
+                    self._restarts += 1
+                    self._models[worker_id] = set()
+                    self._executors[worker_id] = self._new_executor(worker_id)
+            if restart:
+                executor.shutdown(wait=False)
+                logger.error(f"Inference worker {worker_id} died; restarted.")
+            raise
+        finally:
+            with self._lock: self._pending[worker_id] -= 1
+        with self._lock:
+            self._models[worker_id] = set(models)
+            self._completed[worker_id] += 1
+        for stage, seconds in stages.items(): record_stage(stage, seconds)
+        # Attente dans la file du worker + sérialisation / transfert entre processus
+        record_stage("pool_queue_ipc", max(0.0, time.perf_counter() - start - sum(stages.values())))
+        return result
+
+    def tts(self, text, voice, speed, lang, is_phonemes=False):
+        """Synthèse Kokoro : retourne (sample_rate, samples) ; `is_phonemes` : `text` est déjà phonémisé."""
+        return self._run(None, _worker_tts, text, voice, speed, lang, is_phonemes)
+
+    def phonemize(self, text, lang):
+        """Phonèmes Kokoro d'un texte (cache de phonèmes du worker)."""
+        return self._run(None, _worker_phonemize, text, lang)
+
+    def tts_batch(self, texts, voice, speed, lang):
+        """Lot de synthèses Kokoro en un seul aller-retour (cf. tts_scheduler.kokoro_create_batch)."""
+        return self._run(None, _worker_tts_batch, texts, voice, speed, lang)
+
+    def rvc(self, audio_16k, model_key, params, audio_key=None):
+        """Conversion RVC d'un audio 16 kHz : retourne (sample_rate, audio)."""
+        return self._run(model_key, _worker_rvc, audio_16k, model_key, params, audio_key)
+
+    def text_to_rvc(self, text, voice, speed, lang, model_key, params, is_phonemes=False):
+        """Kokoro + RVC dans le même worker : retourne (sample_rate, audio), ou None si Kokoro ne produit rien."""
+        return self._run(model_key, _worker_text_to_rvc, text, voice, speed, lang, model_key, params, is_phonemes)
+
+    def preload(self, model_key):
+        """Charge un modèle RVC dans un worker (celui qui le détient déjà, sinon le moins chargé)."""
+        self._run(model_key, _worker_preload, model_key)
+
+    def invalidate(self, paths):
+        """Décharge de tous les workers les modèles RVC dont le .pth ou le .index fait partie de `paths`."""
+        paths = set(paths)
+        futures = [executor.submit(_worker_invalidate, paths) for executor in self._executors]
+        for future in futures:
+            try: worker_id, models = future.result()
+            except Exception as e:
+                logger.warning(f"Could not invalidate RVC models in an inference worker: {e}")
+                continue
+            with self._lock: self._models[worker_id] = set(models)
+
+    def warmup(self, wait=False):
+        """Démarre tous les workers (chargement de Kokoro) sans attendre une première requête."""
+        futures = [executor.submit(_worker_ping) for executor in self._executors]
+        if wait:
+            for future in futures: future.result()
+        return futures
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.num_workers, "threads_per_worker": self.threads_per_worker,
+                "pending": list(self._pending), "completed": list(self._completed),
+                "models_per_worker": [len(m) for m in self._models],
+                "affinity_hits": self._affinity_hits, "spills": self._spills, "restarts": self._restarts,
+            }
+
+    def shutdown(self):
+        for executor in self._executors: executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ==================================================
+#           MINI-BENCHMARK DE SCALABILITÉ
+# ==================================================
+def _benchmark(args):
+    from concurrent.futures import ThreadPoolExecutor
+    from audio_pipeline import RVCParams
+    model_key = None
+    if args.pth:
+        model_key = (os.path.join("modelRVC", "pth", args.pth), os.path.join("modelRVC", "index", args.index) if args.index else None)
+    params = RVCParams(f0_up_key=args.pitch)
+    for num_workers in sorted({1, args.workers}):
+        pool = InferencePool(num_workers, threads_per_worker=args.threads)
+        pool.warmup(wait=True)
+        def one(_):
+            if model_key: return pool.text_to_rvc(args.text, args.voice, 1.0, args.lang, model_key, params)
+            return pool.tts(args.text, args.voice, 1.0, args.lang)
+        one(0)  # chargement des modèles hors mesure
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=num_workers * 2) as clients:
+            list(clients.map(one, range(args.requests)))
+        elapsed = time.perf_counter() - start
+        print(f"{num_workers} worker(s) x {pool.threads_per_worker} threads: {args.requests / elapsed:.2f} req/s ({elapsed:.1f}s) {pool.stats()}")
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mesure le débit du pool d'inférence avec 1 puis N workers.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads", type=int, default=None, help="Threads par worker (défaut : cœurs / workers)")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--text", default="Bonjour, ceci est un test de débit du pool d'inférence.")
+    parser.add_argument("--voice", default="ff_siwis")
+    parser.add_argument("--lang", default="fr-fr")
+    parser.add_argument("--pth", default=None, help="Nom du .pth dans modelRVC/pth (sinon TTS seul)")
+    parser.add_argument("--index", default=None)
+    parser.add_argument("--pitch", type=int, default=0)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    _benchmark(parser.parse_args())
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""Front-end Kokoro mis en cache : phonèmes mémoïsés et styles de voix en mémoire partagée.
+
+À chaque kokoro.create(), kokoro_onnx refait la normalisation + G2P (phonemizer / espeak,
+avec un backend recréé à chaque appel) et relit le style de la voix dans voices-v1.0.bin,
+une archive .npz dont chaque accès décompresse l'entrée. Ici :
+- les phonèmes sont mémoïsés par (phrase, langue) dans un LRU borné : une phrase répétée
+  (prompts, catalogues) n'est phonémisée qu'une fois, même au sein de textes différents ;
+- tous les styles sont empilés une fois pour toutes dans `<voices>.styles.npy`, ouvert en
+  mmap : pas de décompression par requête, pages partagées entre les workers d'inférence ;
+- create(..., is_phonemes=True) synthétise depuis des phonèmes déjà calculés, par exemple
+  un catalogue pré-phonémisé hors ligne avec ce module :
+
+    python kokoro_frontend.py prompts.txt --lang fr-fr --out prompts.jsonl
+
+  (le .jsonl produit est un manifeste valide pour batch_render.py, colonne `phonemes`).
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Nombre de phrases phonémisées gardées en mémoire, par processus (0 = pas de mémoïsation)
+PHONEME_CACHE_SIZE = int(os.environ.get("KOKORO_PHONEME_CACHE_SIZE", "4096"))
+_SEGMENT_RE = re.compile(r"(?<=[.!?;:…])\s+|\n+")
+
+
+def split_segments(text):
+    """Découpe un texte en phrases, unité de mémoïsation des phonèmes."""
+    return [segment.strip() for segment in _SEGMENT_RE.split(text or "") if segment.strip()]
+
+
+def phonemize_cached(text, lang, cache, phonemize):
+    """Phonèmes d'un texte, phrase par phrase via `cache` ; `phonemize(phrase, langue)` est le G2P de kokoro_onnx."""
+    return " ".join(filter(None, (cache.get_or_compute(segment, lang, phonemize) for segment in split_segments(text))))
+
+
+class PhonemeCache:
+    """LRU thread-safe (phrase, langue) -> phonèmes."""
+
+    def __init__(self, max_entries=PHONEME_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._hits = self._misses = 0
+
+    def get_or_compute(self, segment, lang, compute):
+        if self.max_entries <= 0: return compute(segment, lang)
+        key = (segment, lang)
+        with self._lock:
+            phonemes = self._entries.get(key)
+            if phonemes is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return phonemes
+            self._misses += 1
+        phonemes = compute(segment, lang)
+        with self._lock:
+            self._entries[key] = phonemes
+            while len(self._entries) > self.max_entries: self._entries.popitem(last=False)
+        return phonemes
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self._hits,
+                    "misses": self._misses, "hit_rate": self._hits / lookups if lookups else 0.0}
+
+
+class VoiceStyles:
+    """Styles de voix empilés dans un seul tableau [voix, 510, 1, 256] ouvert en mmap.
+
+    Même interface que l'archive chargée par kokoro_onnx (`name in styles`, `styles[name]`,
+    `keys()`), pour remplacer `kokoro.voices`.
+    """
+
+    def __init__(self, voices_path, cache_path=None):
+        self.voices_path = Path(voices_path)
+        self.cache_path = Path(cache_path) if cache_path else self.voices_path.with_name(self.voices_path.name + ".styles.npy")
+        meta_path = self.cache_path.with_suffix(".json")
+        st = self.voices_path.stat()
+        source = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        try: meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError): meta = None
+        if meta is None or meta.get("source") != source or not self.cache_path.exists():
+            meta = self._build(source, meta_path)
+        if meta is None:
+            return  # dossier en lecture seule : _build a gardé les styles en mémoire
+        self.names = meta["names"]
+        self.styles = np.load(self.cache_path, mmap_mode="r")
+        self._index = {name: i for i, name in enumerate(self.names)}
+
+    def _build(self, source, meta_path):
+        with np.load(self.voices_path) as archive:
+            names = sorted(archive.files)
+            stacked = np.stack([np.asarray(archive[name], dtype=np.float32) for name in names])
+        meta = {"source": source, "names": names}
+        try:
+            # Écriture atomique : plusieurs workers peuvent construire le fichier en même temps
+            for path, write in ((self.cache_path, lambda f: np.save(f, stacked)),
+                                (meta_path, lambda f: f.write(json.dumps(meta).encode("utf-8")))):
+                fd, tmp_path = tempfile.mkstemp(suffix=".part", dir=path.parent)
+                try:
+                    with os.fdopen(fd, "wb") as f: write(f)
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    try: os.remove(tmp_path)
+                    except OSError: pass
+                    raise
+        except OSError as e:
+            logger.warning(f"Could not write voice style cache {self.cache_path} ({e}); keeping styles in memory.")
+            self.names, self.styles = names, stacked
+            self._index = {name: i for i, name in enumerate(names)}
+            return None
+        logger.info(f"Voice style cache built: {len(names)} voices -> {self.cache_path}")
+        return meta
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __getitem__(self, name):
+        return self.styles[self._index[name]]
+
+    def keys(self):
+        return list(self.names)
+
+
+class KokoroFrontend:
+    """Enveloppe un objet kokoro_onnx.Kokoro : même create(), phonèmes mémoïsés et styles en mmap."""
+
+    def __init__(self, kokoro, phoneme_cache_size=PHONEME_CACHE_SIZE):
+        self.kokoro = kokoro
+        old_voices = kokoro.voices
+        kokoro.voices = VoiceStyles(kokoro.config.voices_path)
+        if hasattr(old_voices, "close"): old_voices.close()
+        self.phoneme_cache = PhonemeCache(phoneme_cache_size)
+
+    def __getattr__(self, name):
+        return getattr(self.kokoro, name)
+
+    def phonemize(self, text, lang):
+        return phonemize_cached(text, lang, self.phoneme_cache, self.kokoro.tokenizer.phonemize)
+
+    def create(self, text, voice, speed=1.0, lang="en-us", is_phonemes=False, trim=True):
+        phonemes = text if is_phonemes else self.phonemize(text, lang)
+        if isinstance(voice, str):
+            if voice not in self.kokoro.voices: raise ValueError(f"Voice {voice} not found in available voices")
+            voice = self.kokoro.voices[voice]
+        return self.kokoro.create(phonemes, voice=voice, speed=speed, lang=lang, is_phonemes=True, trim=trim)
+
+    def stats(self):
+        return dict(self.phoneme_cache.stats(), voices=len(self.kokoro.voices.keys()))
+
+
+def load_kokoro_frontend(onnx_path, voices_path, session=None):
+    """Kokoro (depuis une session ONNX existante ou les fichiers) enveloppé dans KokoroFrontend."""
+    from kokoro_onnx import Kokoro
+    kokoro = Kokoro.from_session(session, voices_path) if session is not None else Kokoro(onnx_path, voices_path)
+    return KokoroFrontend(kokoro)
+
+
+# ==================================================
+#           PRÉ-PHONÉMISATION D'UN CATALOGUE
+# ==================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pré-phonémise un catalogue de textes (un par ligne) en JSONL.")
+    parser.add_argument("texts", help="Fichier texte, un énoncé par ligne")
+    parser.add_argument("--lang", default="fr-fr")
+    parser.add_argument("--out", required=True, help="Fichier .jsonl de sortie : text, lang, phonemes")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    from kokoro_onnx.tokenizer import Tokenizer
+    tokenizer, cache = Tokenizer(), PhonemeCache()
+    lines = [line.strip() for line in open(args.texts, encoding="utf-8") if line.strip()]
+    with open(args.out, "w", encoding="utf-8") as out:
+        for text in lines:
+            phonemes = phonemize_cached(text, args.lang, cache, tokenizer.phonemize)
+            out.write(json.dumps({"text": text, "lang": args.lang, "phonemes": phonemes}, ensure_ascii=False) + "\n")
+    logger.info(f"{len(lines)} text(s) phonemized into {args.out} ({cache.stats()['hits']} repeated sentence(s)).")
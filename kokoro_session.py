@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""Sessions ONNX Runtime de Kokoro : profil d'exécution CPU choisi au démarrage.
+
+Profils (KOKORO_ONNX_PROFILE) :
+- "default" : réglages par défaut d'onnxruntime (comportement historique) ;
+- "optimized" : optimisation complète du graphe ; le modèle optimisé est écrit une fois dans
+  `<modèle>.ort<version>.opt.onnx`, puis rechargé tel quel aux démarrages suivants ;
+- "int8" : comme "optimized", sur le modèle quantifié int8 dynamique `<modèle sans .onnx>.int8.onnx`
+  produit par l'outil ci-dessous (si ce fichier manque, on retombe sur "optimized").
+
+Threads ONNX : KOKORO_ONNX_INTRA_THREADS / KOKORO_ONNX_INTER_THREADS (0 = choix d'onnxruntime) ;
+avec des workers d'inférence, inference_pool impose les threads de chaque worker.
+
+Outil :
+    python kokoro_session.py quantize                       # écrit modelTTS/kokoro-v1.0.int8.onnx
+    python kokoro_session.py check --profiles default,optimized,int8 --max-lsd 2.0
+`check` synthétise le corpus de benchmark.py avec chaque profil et rapporte le RTF, l'accélération
+par rapport à "default" et la distance log-spectrale (dB) à la sortie fp32 de "default".
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PROFILES = ("default", "optimized", "int8")
+KOKORO_ONNX_PROFILE = os.environ.get("KOKORO_ONNX_PROFILE", "default").lower()
+KOKORO_ONNX_INTRA_THREADS = int(os.environ.get("KOKORO_ONNX_INTRA_THREADS", "0"))
+KOKORO_ONNX_INTER_THREADS = int(os.environ.get("KOKORO_ONNX_INTER_THREADS", "0"))
+# Opérateurs quantifiés par défaut : les MatMul / Gemm portent l'essentiel des poids et du calcul
+QUANTIZED_OPS = ("MatMul", "Gemm")
+
+_last_session = {}  # profil, modèle, threads et temps de chargement de la dernière session de ce processus
+
+
+def int8_model_path(onnx_path):
+    return str(Path(onnx_path).with_suffix(".int8.onnx"))
+
+
+def optimized_model_path(onnx_path):
+    import onnxruntime as ort
+    return f"{onnx_path}.ort{ort.__version__}.opt.onnx"
+
+
+def _fresh(derived, source):
+    """Le fichier dérivé existe et n'est pas plus ancien que sa source."""
+    try: return os.stat(derived).st_mtime_ns >= os.stat(source).st_mtime_ns
+    except OSError: return False
+
+
+def _write_optimized_model(model_path, cache_path):
+    # Seules les optimisations portables (EXTENDED) sont enregistrées : celles qui dépendent du CPU
+    # (niveau ALL) sont refaites à chaque chargement, rapidement sur un graphe déjà simplifié
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    # Nom temporaire puis renommage : plusieurs workers peuvent démarrer en même temps
+    partial_path = f"{cache_path}.{os.getpid()}.part"
+    options.optimized_model_filepath = partial_path
+    try:
+        ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        os.replace(partial_path, cache_path)
+        logger.info(f"Optimized Kokoro model written: {cache_path}")
+    except Exception as e:
+        logger.warning(f"Could not write optimized Kokoro model {cache_path}: {e}")
+        try: os.remove(partial_path)
+        except OSError: pass
+
+
+def create_kokoro_session(onnx_path, profile=None, intra_threads=None, inter_threads=None):
+    """InferenceSession CPU de Kokoro selon le profil (cf. docstring du module)."""
+    import onnxruntime as ort
+    profile = (profile or KOKORO_ONNX_PROFILE).lower()
+    if profile not in PROFILES: raise ValueError(f"Unknown Kokoro ONNX profile '{profile}' (expected: {', '.join(PROFILES)}).")
+    intra_threads = KOKORO_ONNX_INTRA_THREADS if intra_threads is None else intra_threads
+    inter_threads = KOKORO_ONNX_INTER_THREADS if inter_threads is None else inter_threads
+    model_path = onnx_path
+    if profile == "int8":
+        model_path = int8_model_path(onnx_path)
+        if not _fresh(model_path, onnx_path):
+            logger.warning(f"Int8 Kokoro model {model_path} missing or older than {onnx_path} "
+                           f"(run: python kokoro_session.py quantize); using the 'optimized' profile instead.")
+            profile, model_path = "optimized", onnx_path
+    options = ort.SessionOptions()
+    if intra_threads: options.intra_op_num_threads = intra_threads
+    if inter_threads: options.inter_op_num_threads = inter_threads
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    cache_hit = False
+    if profile != "default":
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        cache_path = optimized_model_path(model_path)
+        cache_hit = _fresh(cache_path, model_path)
+        if not cache_hit and os.access(os.path.dirname(os.path.abspath(cache_path)), os.W_OK):
+            _write_optimized_model(model_path, cache_path)
+        if _fresh(cache_path, model_path): model_path = cache_path
+    start = time.perf_counter()
+    session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+    load_seconds = time.perf_counter() - start
+    _last_session.update(profile=profile, model=os.path.basename(model_path), intra_threads=intra_threads,
+                         inter_threads=inter_threads, load_seconds=round(load_seconds, 3), optimized_cache_hit=cache_hit)
+    logger.info(f"Kokoro ONNX session: profile={profile}, model={os.path.basename(model_path)}, "
+                f"threads intra={intra_threads or 'auto'} inter={inter_threads or 'auto'}, loaded in {load_seconds:.2f}s"
+                f"{' (optimized model cache)' if cache_hit else ''}")
+    return session
+
+
+def session_info():
+    """Profil configuré et, si une session a été créée dans ce processus, ce qu'elle utilise vraiment."""
+    return dict({"profile": KOKORO_ONNX_PROFILE, "intra_threads": KOKORO_ONNX_INTRA_THREADS,
+                 "inter_threads": KOKORO_ONNX_INTER_THREADS}, **_last_session)
+
+
+def session_metrics():
+    """Collecteur pour metrics.register_collector : profil en label, temps de chargement en jauge."""
+    info = session_info()
+    families = [("kokoro_onnx_profile_info", "gauge", "Kokoro ONNX execution profile in use.",
+                 {(("profile", info["profile"]), ("model", info.get("model", ""))): 1})]
+    if "load_seconds" in info:
+        families.append(("kokoro_onnx_session_load_seconds", "gauge", "Kokoro ONNX session creation time.", {(): info["load_seconds"]}))
+    return families
+
+
+# ==================================================
+#           QUANTIFICATION ET CONTRÔLE QUALITÉ
+# ==================================================
+def quantize_model(onnx_path, out_path=None, op_types=QUANTIZED_OPS):
+    """Écrit la version int8 dynamique (poids int8, activations quantifiées à la volée) du modèle."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    out_path = out_path or int8_model_path(onnx_path)
+    quantize_dynamic(onnx_path, out_path, weight_type=QuantType.QInt8, op_types_to_quantize=list(op_types))
+    return out_path
+
+
+def log_spectral_distance(reference, test, n_fft=1024, hop=256):
+    """Distance log-spectrale moyenne (dB) entre deux signaux, sur leur longueur commune."""
+    n = min(len(reference), len(test))
+    if n < n_fft: return 0.0
+    window = np.hanning(n_fft)
+    def log_power(x):
+        frames = np.lib.stride_tricks.sliding_window_view(np.asarray(x[:n], dtype=np.float64), n_fft)[::hop] * window
+        return 10 * np.log10(np.abs(np.fft.rfft(frames, axis=1)) ** 2 + 1e-10)
+    return float(np.mean(np.sqrt(np.mean((log_power(reference) - log_power(test)) ** 2, axis=1))))
+
+
+def check_profiles(onnx_path, voices_path, profiles, repeats=3, intra_threads=None, inter_threads=None):
+    """Mesure chaque profil sur le corpus de benchmark.py ; le premier profil sert de référence."""
+    from kokoro_onnx import Kokoro
+    from benchmark import CORPUS
+    results, reference = {}, None
+    for profile in profiles:
+        kokoro = Kokoro.from_session(create_kokoro_session(onnx_path, profile, intra_threads, inter_threads), voices_path)
+        kokoro.create(CORPUS[0][3], voice=CORPUS[0][2], speed=1.0, lang=CORPUS[0][1])  # chauffe hors mesure
+        outputs, elapsed, audio_seconds = [], 0.0, 0.0
+        for _ in range(repeats):
+            outputs = []
+            for _, lang, voice, text in CORPUS:
+                start = time.perf_counter()
+                samples, sample_rate = kokoro.create(text, voice=voice, speed=1.0, lang=lang)
+                elapsed += time.perf_counter() - start
+                audio_seconds += len(samples) / sample_rate
+                outputs.append(samples)
+        if reference is None: reference = outputs
+        results[profile] = {
+            "session": dict(_last_session), "rtf": round(elapsed / audio_seconds, 4),
+            "lsd_db": round(float(np.mean([log_spectral_distance(r, o) for r, o in zip(reference, outputs)])), 3),
+            "duration_ratio": round(sum(map(len, outputs)) / sum(map(len, reference)), 4),
+        }
+    base_rtf = results[profiles[0]]["rtf"]
+    for result in results.values(): result["speedup"] = round(base_rtf / result["rtf"], 3)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profils ONNX de Kokoro : quantification int8 et contrôle qualité / vitesse.")
+    parser.add_argument("command", choices=["quantize", "check"])
+    parser.add_argument("--onnx", default="modelTTS/kokoro-v1.0.onnx")
+    parser.add_argument("--voices", default="modelTTS/voices-v1.0.bin")
+    parser.add_argument("--ops", default=",".join(QUANTIZED_OPS), help="quantize : types d'opérateurs quantifiés")
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="check : profils comparés, le premier sert de référence")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--intra-threads", type=int, default=None)
+    parser.add_argument("--inter-threads", type=int, default=None)
+    parser.add_argument("--max-lsd", type=float, default=None, help="check : code de sortie 1 si un profil dépasse cette distance (dB)")
+    parser.add_argument("--out", default=None, help="check : écrit les résultats JSON dans ce fichier")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == "quantize":
+        start = time.perf_counter()
+        out_path = quantize_model(args.onnx, op_types=[op for op in args.ops.split(",") if op])
+        logger.info(f"{args.onnx} ({os.path.getsize(args.onnx) / 1e6:.0f} MB) -> {out_path} "
+                    f"({os.path.getsize(out_path) / 1e6:.0f} MB) in {time.perf_counter() - start:.0f}s")
+    else:
+        profiles = [p for p in args.profiles.split(",") if p]
+        results = check_profiles(args.onnx, args.voices, profiles, args.repeats, args.intra_threads, args.inter_threads)
+        print(f"{'profile':>10} {'model':>36} {'RTF':>8} {'speedup':>8} {'LSD dB':>8} {'duration':>9}")
+        for profile, r in results.items():
+            print(f"{profile:>10} {r['session']['model']:>36} {r['rtf']:>8} {r['speedup']:>8} {r['lsd_db']:>8} {r['duration_ratio']:>9}")
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f: json.dump(results, f, indent=2)
+        if args.max_lsd is not None and any(r["lsd_db"] > args.max_lsd for r in results.values()):
+            raise SystemExit(f"Quality check failed: log-spectral distance above {args.max_lsd} dB.")
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""Synthèse de documents longs (chapitres) : segments rendus en parallèle, recollés et écrits au fil de l'eau.
+
+- le texte est découpé en segments d'au plus LONGFORM_SEGMENT_CHARS caractères, aux fins de phrase,
+  sinon aux virgules / points-virgules, sinon aux espaces (cf. split_text_for_streaming) ;
+- les segments sont rendus en parallèle (dans ce processus ou répartis sur les workers d'inférence),
+  mais au plus `parallelism + LONGFORM_LOOKAHEAD` segments sont en cours ou en attente d'écriture :
+  la mémoire reste bornée quelle que soit la longueur du document ;
+- ils sont recollés dans l'ordre avec un fondu enchaîné (CrossfadeStitcher) et écrits au fur et à
+  mesure en WAV, FLAC ou Ogg Opus dans `<sortie>.part`, renommé à la fin ;
+- un segment en échec est relancé seul (LONGFORM_RETRIES fois), les autres ne sont pas refaits ;
+  une erreur déterministe (`no_retry`, ValueError par défaut : paramètre invalide...) fait
+  échouer le document tout de suite ;
+- `on_progress(segments écrits, total, secondes d'audio écrites)` est appelé après chaque segment.
+
+Exemple :
+    python longform.py chapitre.txt --out chapitre.flac --workers 4 --pth voix.pth --index voix.index
+"""
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+
+from audio_pipeline import STREAM_CROSSFADE_MS, CrossfadeStitcher, split_text_for_streaming
+from metrics import record_stage
+
+logger = logging.getLogger(__name__)
+
+LONGFORM_SEGMENT_CHARS = int(os.environ.get("LONGFORM_SEGMENT_CHARS", "400"))
+# Segments rendus d'avance au-delà des segments en cours (borne la mémoire, garde les workers occupés)
+LONGFORM_LOOKAHEAD = int(os.environ.get("LONGFORM_LOOKAHEAD", "2"))
+LONGFORM_RETRIES = int(os.environ.get("LONGFORM_RETRIES", "2"))
+RETRY_DELAY_SECONDS = 1.0  # doublé à chaque nouvel essai
+FORMATS = {".wav": "wav", ".flac": "flac", ".ogg": "opus", ".opus": "opus"}
+
+
+def output_format(path):
+    """Format d'écriture d'après l'extension du fichier de sortie."""
+    fmt = FORMATS.get(os.path.splitext(str(path))[1].lower())
+    if fmt is None: raise ValueError(f"Unsupported output file '{path}' (expected: {', '.join(FORMATS)}).")
+    return fmt
+
+
+class _SoundFileWriter:
+    """WAV / FLAC 16 bits écrit bloc par bloc par libsndfile (même arrondi que sf.write)."""
+
+    def __init__(self, path, sample_rate, fmt):
+        self._file = sf.SoundFile(path, mode="w", samplerate=sample_rate, channels=1, format=fmt.upper(), subtype="PCM_16")
+
+    def write(self, samples):
+        self._file.write(samples)
+
+    def close(self):
+        self._file.close()
+
+
+class _OpusWriter:
+    """Ogg Opus : mêmes réglages que le format `opus` de l'API HTTP, pages écrites au fil de l'encodage."""
+
+    def __init__(self, path, sample_rate):
+        from http_api import ENCODERS
+        self.sample_rate = sample_rate
+        self._encoder = ENCODERS["opus"](sample_rate)
+        self._file = open(path, "wb")
+
+    def write(self, samples):
+        self._file.write(self._encoder.encode((self.sample_rate, samples)))
+
+    def close(self):
+        try: self._file.write(self._encoder.finish())
+        finally: self._file.close()
+
+
+def _open_writer(path, fmt, sample_rate):
+    return _OpusWriter(path, sample_rate) if fmt == "opus" else _SoundFileWriter(path, sample_rate, fmt)
+
+
+def _render_with_retries(render_segment, segment, position, retries, no_retry=()):
+    """render_segment(segment) avec nouvel essai en cas d'échec (sauf exceptions `no_retry`) : (sample_rate, samples, essais)."""
+    for attempt in range(retries + 1):
+        try:
+            start = time.perf_counter()
+            sample_rate, samples = render_segment(segment)
+            record_stage("longform_segment", time.perf_counter() - start)
+            return sample_rate, samples, attempt + 1
+        except no_retry:
+            raise
+        except Exception as e:
+            if attempt == retries: raise RuntimeError(f"Segment {position + 1} failed after {retries + 1} attempt(s): {e}") from e
+            logger.warning(f"Long-form segment {position + 1} failed ({e}); retry {attempt + 1}/{retries}.")
+            time.sleep(RETRY_DELAY_SECONDS * 2 ** attempt)
+
+
+def render_document(text, render_segment, out_path, parallelism=2, on_progress=None, segment_chars=LONGFORM_SEGMENT_CHARS,
+                    retries=LONGFORM_RETRIES, crossfade_ms=STREAM_CROSSFADE_MS, no_retry=(ValueError,)):
+    """Rend `text` avec render_segment(texte) -> (sample_rate, samples) et l'écrit dans `out_path`.
+
+    Les exceptions `no_retry` (erreurs qu'un nouvel essai ne corrigerait pas) sont propagées telles quelles.
+    Retourne un résumé : segments, secondes d'audio, nouveaux essais, durée, RTF.
+    """
+    fmt = output_format(out_path)
+    segments = split_text_for_streaming(text, segment_chars)
+    if not segments: raise ValueError("Nothing to synthesize: the document is empty.")
+    parallelism = max(1, parallelism)
+    window = parallelism + max(0, LONGFORM_LOOKAHEAD)
+    logger.info(f"Long-form: {len(segments)} segments, {len(text)} characters, {parallelism} in parallel -> {out_path}")
+    partial_path = f"{out_path}.part"
+    executor = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="longform")
+    futures, writer, stitcher = {}, None, None
+    submitted = written = retried = samples_written = 0
+    start = time.perf_counter()
+    try:
+        while written < len(segments):
+            # Fenêtre glissante : pas plus de `window` segments rendus d'avance sur l'écriture
+            while submitted < len(segments) and submitted - written < window:
+                futures[submitted] = executor.submit(_render_with_retries, render_segment, segments[submitted], submitted, retries, no_retry)
+                submitted += 1
+            sample_rate, samples, attempts = futures.pop(written).result()
+            retried += attempts - 1
+            written += 1
+            if writer is None:
+                writer = _open_writer(partial_path, fmt, sample_rate)
+                stitcher = CrossfadeStitcher(sample_rate, crossfade_ms)
+            if sample_rate == stitcher.sample_rate:
+                ready = stitcher.push(samples)
+                if len(ready): writer.write(ready); samples_written += len(ready)
+            # Un segment muet de remplacement (texte sans son) peut avoir un autre taux : rien à écrire
+            elif np.any(samples):
+                raise RuntimeError(f"Segment {written} has sample rate {sample_rate} Hz, expected {stitcher.sample_rate} Hz.")
+            if on_progress: on_progress(written, len(segments), samples_written / stitcher.sample_rate)
+        tail = stitcher.flush()
+        if len(tail): writer.write(tail); samples_written += len(tail)
+        writer.close(); writer = None
+        os.replace(partial_path, out_path)
+    except BaseException:
+        for future in futures.values(): future.cancel()
+        if writer is not None:
+            try: writer.close()
+            except Exception: pass
+        try: os.remove(partial_path)
+        except OSError: pass
+        raise
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    elapsed = time.perf_counter() - start
+    audio_seconds = samples_written / stitcher.sample_rate
+    logger.info(f"Long-form done: {len(segments)} segments, {audio_seconds:.1f}s of audio in {elapsed:.1f}s, {retried} retried segment attempt(s).")
+    return {"segments": len(segments), "audio_seconds": round(audio_seconds, 2), "retries": retried,
+            "wall_seconds": round(elapsed, 2), "realtime_factor": round(elapsed / audio_seconds, 4) if audio_seconds else None}
+
+
+def main():
+    import json
+    from pathlib import Path
+    from audio_pipeline import RVCParams
+    from batch_render import RVC_INDEX_DIR, RVC_PTH_DIR, LocalBackend
+    from inference_pool import InferencePool
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("document", help="Fichier texte (UTF-8)")
+    parser.add_argument("--out", required=True, help="Fichier de sortie .wav, .flac, .ogg ou .opus")
+    parser.add_argument("--workers", type=int, default=0, help="Processus d'inférence (0 = dans ce processus)")
+    parser.add_argument("--threads", type=int, default=None, help="Threads par worker (défaut : cœurs / workers)")
+    parser.add_argument("--parallel", type=int, default=None, help="Segments rendus en même temps (défaut : workers + 1, ou 1)")
+    parser.add_argument("--segment-chars", type=int, default=LONGFORM_SEGMENT_CHARS)
+    parser.add_argument("--voice", default="ff_siwis", help="Voix Kokoro")
+    parser.add_argument("--lang", default="fr-fr")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--pth", default=None, help="Modèle RVC (sans : Kokoro seul)")
+    parser.add_argument("--index", default=None)
+    parser.add_argument("--pitch", type=int, default=0)
+    parser.add_argument("--f0-method", default="harvest")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    text = Path(args.document).read_text(encoding="utf-8")
+    resolve = lambda name, directory: name if not name or os.path.exists(name) else str(directory / name)
+    model_key = (resolve(args.pth, RVC_PTH_DIR), resolve(args.index, RVC_INDEX_DIR)) if args.pth else None
+    params = RVCParams()._replace(f0_up_key=args.pitch, f0_method=args.f0_method)
+    backend = InferencePool(args.workers, threads_per_worker=args.threads) if args.workers > 0 else LocalBackend()
+    if args.workers > 0: backend.warmup(wait=True)
+
+    def render(segment):
+        if model_key is None: return backend.tts(segment, args.voice, args.speed, args.lang)
+        result = backend.text_to_rvc(segment, args.voice, args.speed, args.lang, model_key, params)
+        if result is None: raise RuntimeError("Kokoro TTS returned no audio.")
+        return result
+
+    def progress(done, total, audio_seconds):
+        logger.info(f"{done}/{total} segments written, {audio_seconds:.1f}s of audio")
+
+    try:
+        summary = render_document(text, render, args.out, args.parallel or (args.workers + 1 if args.workers > 0 else 1),
+                                  on_progress=progress, segment_chars=args.segment_chars)
+    finally:
+        backend.shutdown()
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,480 +1,1221 @@
-# -*- coding: utf-8 -*-
-import gradio as gr
-import soundfile as sf
-from kokoro_onnx import Kokoro
-import torch
-from pathlib import Path
-import os
-import numpy as np
-from rvc_python.infer import RVCInference
-import tempfile
-import logging
-import traceback
-
-# Configuration du logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
-
-# --- Constantes et Configuration ---
-RVC_MODEL_DIR = Path("modelRVC")
-RVC_INDEX_DIR = RVC_MODEL_DIR / "index"
-RVC_PTH_DIR = RVC_MODEL_DIR / "pth"
-KOKORO_ONNX_PATH = "modelTTS/kokoro-v1.0.onnx"
-KOKORO_VOICES_PATH = "modelTTS/voices-v1.0.bin"
-DEFAULT_UI_LANGUAGE = "en" # Default language set here
-
-# --- Variables Globales ---
-AVAILABLE_INDEX_FILES = []
-AVAILABLE_PTH_FILES = []
-RVC_CACHE = {}
-kokoro = None
-
-# ==================================================
-#           TEXTES DE L'INTERFACE (FR/EN)
-# ==================================================
-# (Dictionnaire UI_TEXTS reste le même qu'avant)
-UI_TEXTS = {
-    "fr": {
-        "app_title": "Convertisseur Audio Texte-Parole (Kokoro TTS + RVC)",
-        "app_description": "Générez de la parole à partir de texte avec Kokoro TTS, puis convertissez la voix avec des modèles RVC.",
-        "refresh_button": "🔄 Actualiser les Listes de Modèles RVC",
-        "lang_select_label": "Langue de l'Interface",
-        # Tab 1: TTS
-        "tab1_title": "1. Texte -> Parole (Kokoro TTS)",
-        "tts_text_input_label": "Texte à Synthétiser",
-        "tts_text_input_placeholder": "Entrez votre texte ici...",
-        "tts_voice_select_label": "Voix Kokoro TTS",
-        "tts_language_select_label": "Langue (peut affecter la prononciation)",
-        "tts_speed_slider_label": "Vitesse de Parole",
-        "tts_generate_button": "🔊 Générer Audio TTS",
-        "tts_output_audio_label": "Audio TTS Généré",
-        # Tab 2: RVC
-        "tab2_title": "2. Conversion de Voix (RVC)",
-        "rvc_input_audio_label": "Audio d'Entrée pour RVC",
-        "rvc_input_audio_info": "👆 Utilisez l'audio généré à l'étape 1 OU téléchargez/enregistrez un fichier.",
-        "rvc_pth_select_label": "Modèle de Voix RVC (.pth)",
-        "rvc_pth_select_info": "Choisissez le fichier .pth de la voix cible.",
-        "rvc_index_select_label": "Fichier Index RVC (.index)",
-        "rvc_index_select_info": "Optionnel mais recommandé pour la qualité. Doit correspondre au .pth.",
-        "rvc_pitch_slider_label": "Décalage de Hauteur (demi-tons)",
-        "rvc_generate_button": "🗣️ Convertir la Voix RVC",
-        "rvc_output_audio_label": "Audio Converti par RVC",
-        # Tab 3: Text -> RVC
-        "tab3_title": "3. Texte -> Voix RVC (Direct)",
-        "ttrvc_description": "Combine les étapes 1 et 2 : Génère la parole avec Kokoro puis la convertit avec RVC.",
-        "ttrvc_text_input_label": "Texte à Convertir",
-        "ttrvc_text_input_placeholder": "Entrez votre texte ici...",
-        "ttrvc_rvc_pth_select_label": "Modèle de Voix RVC (.pth)",
-        "ttrvc_rvc_index_select_label": "Fichier Index RVC (.index)",
-        "ttrvc_pitch_slider_label": "Décalage de Hauteur (demi-tons)",
-        "ttrvc_kokoro_voice_label": "Voix Kokoro TTS (Base)",
-        "ttrvc_kokoro_voice_info": "Voix utilisée pour générer la parole initiale avant conversion RVC.",
-        "ttrvc_language_select_label": "Langue Kokoro",
-        "ttrvc_speed_slider_label": "Vitesse de Parole (Base)",
-        "ttrvc_generate_button": "🚀 Générer Audio RVC depuis Texte",
-        "ttrvc_output_audio_label": "Audio RVC Final",
-        # Erreurs (utilisées dans le backend, la langue est fixée au moment de l'erreur)
-        "error_kokoro_not_loaded": "Erreur: Le modèle Kokoro TTS n'est pas chargé.",
-        "error_tts_failed": "Erreur Kokoro TTS: {e}",
-        # ... (autres textes d'erreur et warnings comme avant) ...
-    },
-    "en": {
-        "app_title": "Text-to-Speech Audio Converter (Kokoro TTS + RVC)",
-        "app_description": "Generate speech from text using Kokoro TTS, then convert the voice using RVC models.",
-        "refresh_button": "🔄 Refresh RVC Model Lists",
-        "lang_select_label": "Interface Language",
-        # Tab 1: TTS
-        "tab1_title": "1. Text -> Speech (Kokoro TTS)",
-        "tts_text_input_label": "Text to Synthesize",
-        "tts_text_input_placeholder": "Enter your text here...",
-        "tts_voice_select_label": "Kokoro TTS Voice",
-        "tts_language_select_label": "Language (may affect pronunciation)",
-        "tts_speed_slider_label": "Speech Speed",
-        "tts_generate_button": "🔊 Generate TTS Audio",
-        "tts_output_audio_label": "Generated TTS Audio",
-        # Tab 2: RVC
-        "tab2_title": "2. Voice Conversion (RVC)",
-        "rvc_input_audio_label": "Input Audio for RVC",
-        "rvc_input_audio_info": "👆 Use the audio generated in step 1 OR upload/record a file.",
-        "rvc_pth_select_label": "RVC Voice Model (.pth)",
-        "rvc_pth_select_info": "Choose the target voice's .pth file.",
-        "rvc_index_select_label": "RVC Index File (.index)",
-        "rvc_index_select_info": "Optional but recommended for quality. Should match the .pth file.",
-        "rvc_pitch_slider_label": "Pitch Shift (semitones)",
-        "rvc_generate_button": "🗣️ Convert RVC Voice",
-        "rvc_output_audio_label": "Converted RVC Audio",
-        # Tab 3: Text -> RVC
-        "tab3_title": "3. Text -> RVC Voice (Direct)",
-        "ttrvc_description": "Combines steps 1 and 2: Generates speech with Kokoro then converts it with RVC.",
-        "ttrvc_text_input_label": "Text to Convert",
-        "ttrvc_text_input_placeholder": "Enter your text here...",
-        "ttrvc_rvc_pth_select_label": "RVC Voice Model (.pth)",
-        "ttrvc_rvc_index_select_label": "RVC Index File (.index)",
-        "ttrvc_pitch_slider_label": "Pitch Shift (semitones)",
-        "ttrvc_kokoro_voice_label": "Kokoro TTS Voice (Base)",
-        "ttrvc_kokoro_voice_info": "Voice used to generate the initial speech before RVC conversion.",
-        "ttrvc_language_select_label": "Kokoro Language",
-        "ttrvc_speed_slider_label": "Speech Speed (Base)",
-        "ttrvc_generate_button": "🚀 Generate RVC Audio from Text",
-        "ttrvc_output_audio_label": "Final RVC Audio",
-        # Errors (used in backend, language is fixed when error occurs)
-        "error_kokoro_not_loaded": "Error: Kokoro TTS model is not loaded.",
-        "error_tts_failed": "Kokoro TTS Error: {e}",
-        # ... (other error texts and warnings as before) ...
-    }
-}
-
-# --- Fonctions Utilitaires (inchangées) ---
-def scan_rvc_models(log_results=True):
-    # ... (même code qu'avant) ...
-    global AVAILABLE_INDEX_FILES, AVAILABLE_PTH_FILES
-    logger.info(f"Scanning RVC model directories: {RVC_PTH_DIR} and {RVC_INDEX_DIR}")
-    found_pth = []
-    found_index = []
-    try:
-        RVC_INDEX_DIR.mkdir(parents=True, exist_ok=True)
-        RVC_PTH_DIR.mkdir(parents=True, exist_ok=True)
-        found_pth = sorted([f for f in os.listdir(RVC_PTH_DIR) if f.endswith(".pth")])
-        found_index = sorted([f for f in os.listdir(RVC_INDEX_DIR) if f.endswith(".index")])
-    except Exception as e:
-        logger.error(f"Error during RVC model scan: {e}", exc_info=True)
-    AVAILABLE_PTH_FILES = found_pth
-    AVAILABLE_INDEX_FILES = found_index
-    if log_results:
-        logger.info(f"Scan complete. Found PTH files: {len(AVAILABLE_PTH_FILES)}")
-        logger.info(f"Scan complete. Found Index files: {len(AVAILABLE_INDEX_FILES)}")
-        if not AVAILABLE_PTH_FILES: logger.warning("No .pth model files found.")
-
-def create_silent_audio(sample_rate=44100):
-    # ... (même code qu'avant) ...
-    return (sample_rate, np.array([], dtype=np.float32))
-
-def refresh_models_list():
-    # ... (même code qu'avant) ...
-    logger.info("Refreshing RVC model lists for Tabs 2 & 3...")
-    scan_rvc_models(log_results=True)
-    return (
-        gr.update(choices=AVAILABLE_PTH_FILES),   # rvc_pth_select (Tab 2)
-        gr.update(choices=AVAILABLE_INDEX_FILES), # rvc_index_select (Tab 2)
-        gr.update(choices=AVAILABLE_PTH_FILES),   # ttrvc_rvc_pth_select (Tab 3)
-        gr.update(choices=AVAILABLE_INDEX_FILES)  # ttrvc_rvc_index_select (Tab 3)
-    )
-
-# --- Initialisation des modèles au démarrage (inchangée) ---
-scan_rvc_models()
-try:
-    # ... (Initialisation Kokoro) ...
-    if os.path.exists(KOKORO_ONNX_PATH) and os.path.exists(KOKORO_VOICES_PATH):
-        kokoro = Kokoro(KOKORO_ONNX_PATH, KOKORO_VOICES_PATH)
-        logger.info("Kokoro TTS model initialized successfully.")
-    else:
-        logger.error(f"Kokoro TTS files not found. Check paths: {KOKORO_ONNX_PATH}, {KOKORO_VOICES_PATH}")
-        kokoro = None
-except Exception as e:
-    logger.error(f"Critical error during Kokoro TTS initialization: {e}", exc_info=True)
-    kokoro = None
-
-# --- Préparation des listes pour Gradio (Noms de voix/langues, inchangé) ---
-# ... (VOICES_KOKORO_RAW, LANGUAGES_KOKORO, COUNTRY_FLAGS, VOICES_KOKORO, LANGUAGES_KOKORO_CHOICES) ...
-VOICES_KOKORO_RAW = [
-    "af_alloy", "af_aoede", "af_bella", "af_heart", "af_jessica", "af_kore", "af_nicole",
-    "af_nova", "af_river", "af_sarah", "af_sky", "am_adam", "am_echo", "am_eric",
-    "am_fenrir", "am_liam", "am_michael", "am_onyx", "am_puck", "bf_alice",
-    "bf_emma", "bf_isabella", "bf_lily", "bm_daniel", "bm_fable", "bm_george", "bm_lewis",
-    "ff_siwis", "if_sara", "im_nicola", "jf_alpha", "jf_gongitsune", "jf_nezumi",
-    "jf_tebukuro", "jm_kumo", "zf_xiaobei",
-    "zf_xiaoni", "zf_xiaoxiao", "zf_xiaoyi"
-]
-LANGUAGES_KOKORO = {
-    "fr-fr": "Français", "it": "Italiano", "en-us": "English (US)", "en-gb": "English (GB)",
-    "ja": "日本語", "cmn": "中文", "pt-br": "Português (BR)", "es": "Español"
-}
-COUNTRY_FLAGS = { "af": "🇺🇸", "am": "🇺🇸", "bf": "🇬🇧", "bm": "🇬🇧", "ff": "🇫🇷", "if": "🇮🇹", "im": "🇮🇹", "jf": "🇯🇵", "jm": "🇯🇵", "zf": "🇨🇳" }
-VOICES_KOKORO = []
-for voice_code in VOICES_KOKORO_RAW:
-    country_code = voice_code[:2]
-    flag = COUNTRY_FLAGS.get(country_code, "🌐")
-    lang_key_fr = f"{country_code}-fr"; lang_key_base = country_code
-    lang_name = LANGUAGES_KOKORO.get(lang_key_fr, LANGUAGES_KOKORO.get(lang_key_base, country_code.upper()))
-    display_name = f"{flag} {voice_code.split('_')[1].capitalize()} ({lang_name})"
-    VOICES_KOKORO.append((display_name, voice_code))
-LANGUAGES_KOKORO_CHOICES = [(name, code) for code, name in LANGUAGES_KOKORO.items()]
-
-
-# --- Fonctions Core (inchangées, utilisent T pour les erreurs) ---
-# ... (text_to_speech_fn, load_rvc_model, voice_conversion_fn, text_to_rvc_voice_fn) ...
-# Note: Les gr.Error levées utiliseront la langue active AU MOMENT où l'erreur se produit.
-# Elles ne seront pas retraduites si l'utilisateur change la langue *après* l'affichage de l'erreur.
-def text_to_speech_fn(text, voice, speed, lang):
-    # Utilise T[key] pour les messages d'erreur levés par gr.Error
-    T_err = UI_TEXTS[DEFAULT_UI_LANGUAGE] # Utilise la langue par défaut pour les erreurs backend pour simplifier
-    if not kokoro: raise gr.Error(T_err["error_kokoro_not_loaded"])
-    if not text or not text.strip(): return create_silent_audio(), None
-    logger.info(f"TTS Kokoro: Voice='{voice}', Speed={speed}, Lang='{lang}', Text='{text[:50]}...'")
-    output_path = None
-    try:
-        samples, sample_rate = kokoro.create(text, voice=voice, speed=speed, lang=lang)
-        if samples is None or len(samples) == 0: return create_silent_audio(), None
-        logger.info(f"  Kokoro TTS generated {len(samples)} samples at {sample_rate} Hz.")
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_file:
-            output_path = tmp_file.name
-            sf.write(output_path, samples, sample_rate)
-            logger.info(f"Temporary Kokoro TTS audio created: {output_path}")
-        return (sample_rate, samples), output_path
-    except Exception as e:
-        logger.error(f"Error during Kokoro TTS synthesis: {e}\n{traceback.format_exc()}")
-        if output_path and os.path.exists(output_path):
-            try: os.remove(output_path); logger.info(f"Cleaned up temp TTS file after error: {output_path}")
-            except OSError as ose: logger.error(f"Failed to delete temp file {output_path}: {ose}")
-        raise gr.Error(T_err["error_tts_failed"].format(e=e))
-
-try:
-    from fairseq.data.dictionary import Dictionary
-    torch.serialization.add_safe_globals([Dictionary])
-except Exception as e: logger.warning(f"Could not add Dictionary to safe globals (may be harmless): {e}")
-
-def load_rvc_model(rvc_pth_path, rvc_index_path):
-    T_err = UI_TEXTS[DEFAULT_UI_LANGUAGE]
-    model_key = (rvc_pth_path, rvc_index_path)
-    if model_key in RVC_CACHE:
-        logger.info(f"Using cached RVC model: {os.path.basename(rvc_pth_path)}")
-        return RVC_CACHE[model_key]
-    else:
-        logger.info(f"Loading new RVC model: {os.path.basename(rvc_pth_path)}")
-        if not os.path.exists(rvc_pth_path): raise FileNotFoundError(T_err["error_pth_not_found"].format(path=rvc_pth_path))
-        if rvc_index_path and not os.path.exists(rvc_index_path):
-            logger.warning(T_err["error_index_not_found_warning"].format(path=rvc_index_path))
-            rvc_index_path = None
-        device = "cuda:0" if torch.cuda.is_available() else "cpu"; logger.info(f"Using RVC device: {device}")
-        try:
-            rvc = RVCInference(device=device)
-            if rvc_index_path: logger.info(f"  with index: {os.path.basename(rvc_index_path)}")
-            rvc.load_model(rvc_pth_path, index_path=rvc_index_path)
-            RVC_CACHE[model_key] = rvc; return rvc
-        except Exception as e:
-            logger.error(f"Error loading RVC model ({os.path.basename(rvc_pth_path)}): {e}\n{traceback.format_exc()}")
-            raise gr.Error(T_err["error_rvc_load_failed"].format(e=e))
-
-def voice_conversion_fn(input_audio_path, rvc_index_file_name, rvc_pth_file_name, pitch_shift):
-    T_err = UI_TEXTS[DEFAULT_UI_LANGUAGE]
-    if not input_audio_path or not os.path.exists(input_audio_path): raise gr.Error(T_err["error_rvc_input_audio_invalid"])
-    if not rvc_pth_file_name: raise gr.Error(T_err["error_rvc_pth_missing"])
-    logger.info(f"RVC: Audio='{os.path.basename(str(input_audio_path))}', Index='{rvc_index_file_name}', PTH='{rvc_pth_file_name}', Pitch={pitch_shift}")
-    output_rvc_audio_path = None
-    try:
-        rvc_pth_path = RVC_PTH_DIR / rvc_pth_file_name
-        rvc_index_path = RVC_INDEX_DIR / rvc_index_file_name if rvc_index_file_name else None
-        rvc = load_rvc_model(str(rvc_pth_path), str(rvc_index_path) if rvc_index_path else None)
-        rvc.f0up_key = pitch_shift; logger.info(f"RVC f0up_key set to: {rvc.f0up_key}")
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_file: output_rvc_audio_path = tmp_file.name
-        logger.info(f"  Calling rvc.infer_file (input: {input_audio_path}, output: {output_rvc_audio_path})")
-        rvc.infer_file(str(input_audio_path), output_rvc_audio_path)
-        logger.info(f"Temporary RVC audio created: {output_rvc_audio_path}")
-        converted_audio_rvc, sample_rate_rvc = sf.read(output_rvc_audio_path)
-        logger.info(f"RVC conversion successful. Samples: {len(converted_audio_rvc)}, Rate: {sample_rate_rvc}")
-        return (sample_rate_rvc, converted_audio_rvc)
-    except Exception as e:
-        logger.error(f"Error during RVC conversion: {e}\n{traceback.format_exc()}")
-        raise gr.Error(T_err["error_rvc_conversion_failed"].format(e=e))
-    finally:
-        if output_rvc_audio_path and os.path.exists(output_rvc_audio_path):
-            try: os.remove(output_rvc_audio_path); logger.info(f"Cleaned up temp RVC file: {output_rvc_audio_path}")
-            except OSError as ose: logger.error(f"Failed to delete temp RVC file {output_rvc_audio_path}: {ose}")
-
-def text_to_rvc_voice_fn(text, rvc_index_file_name, rvc_pth_file_name, pitch_shift, kokoro_voice, speed, lang):
-    T_err = UI_TEXTS[DEFAULT_UI_LANGUAGE]
-    logger.info(f"Pipeline Text -> RVC: Kokoro='{kokoro_voice}', RVC='{rvc_pth_file_name}', Pitch={pitch_shift}, Text='{text[:50]}...'")
-    temp_tts_audio_path = None
-    try:
-        logger.info("  Step 1: Generating Kokoro TTS...")
-        tts_audio_data, temp_tts_audio_path = text_to_speech_fn(text, kokoro_voice, speed, lang)
-        if temp_tts_audio_path is None or not os.path.exists(temp_tts_audio_path):
-             logger.error("  Critical failure: TTS audio file not created or found after call.")
-             raise gr.Error(T_err["error_tts_intermediate_failed"])
-        logger.info(f"  Step 1 successful. Temp TTS audio: {temp_tts_audio_path}")
-        logger.info("  Step 2: RVC Conversion...")
-        rvc_output_audio = voice_conversion_fn(temp_tts_audio_path, rvc_index_file_name, rvc_pth_file_name, pitch_shift)
-        logger.info("  Step 2 successful.")
-        return rvc_output_audio
-    except Exception as e:
-        if not isinstance(e, gr.Error):
-             logger.error(f"Unexpected error in Text to RVC pipeline: {e}\n{traceback.format_exc()}")
-             raise gr.Error(T_err["error_unexpected"].format(e=e))
-        else:
-             raise e
-    finally:
-        if temp_tts_audio_path and os.path.exists(temp_tts_audio_path):
-            try: os.remove(temp_tts_audio_path); logger.info(f"Cleaned up temp TTS file (Text-to-RVC pipeline): {temp_tts_audio_path}")
-            except OSError as ose: logger.error(f"Failed to delete temp TTS file {temp_tts_audio_path}: {ose}")
-
-
-# --- Fonction pour mettre à jour l'UI lors du changement de langue ---
-def update_ui_language(selected_lang_code):
-    """Retourne une série de gr.update pour changer les textes de l'UI."""
-    T_update = UI_TEXTS[selected_lang_code]
-    logger.info(f"Updating UI language to: {selected_lang_code.upper()}")
-    return (
-        # Composants Globaux
-        gr.update(value=f"# {T_update['app_title']}"), # app_title_md
-        gr.update(value=T_update["app_description"]), # app_description_md
-        gr.update(value=T_update["refresh_button"]), # refresh_button
-        gr.update(label=T_update["lang_select_label"]), # lang_selector (met à jour son propre label)
-
-        # Tab 1
-        gr.update(label=T_update["tab1_title"]), # tab_tts
-        gr.update(label=T_update["tts_text_input_label"], placeholder=T_update["tts_text_input_placeholder"]), # tts_text_input
-        gr.update(label=T_update["tts_voice_select_label"]), # tts_voice_select
-        gr.update(label=T_update["tts_language_select_label"]), # tts_language_select
-        gr.update(label=T_update["tts_speed_slider_label"]), # tts_speed_slider
-        gr.update(value=T_update["tts_generate_button"]), # tts_generate_button
-        gr.update(label=T_update["tts_output_audio_label"]), # tts_output_audio
-
-        # Tab 2
-        gr.update(label=T_update["tab2_title"]), # tab_rvc
-        gr.update(label=T_update["rvc_input_audio_label"]), # rvc_input_audio
-        gr.update(value=T_update["rvc_input_audio_info"]), # rvc_input_audio_info_md
-        gr.update(label=T_update["rvc_pth_select_label"], info=T_update["rvc_pth_select_info"]), # rvc_pth_select
-        gr.update(label=T_update["rvc_index_select_label"], info=T_update["rvc_index_select_info"]), # rvc_index_select
-        gr.update(label=T_update["rvc_pitch_slider_label"]), # rvc_pitch_shift_slider
-        gr.update(value=T_update["rvc_generate_button"]), # rvc_generate_button
-        gr.update(label=T_update["rvc_output_audio_label"]), # rvc_output_audio
-
-        # Tab 3
-        gr.update(label=T_update["tab3_title"]), # tab_text_to_rvc
-        gr.update(value=T_update["ttrvc_description"]), # ttrvc_description_md
-        gr.update(label=T_update["ttrvc_text_input_label"], placeholder=T_update["ttrvc_text_input_placeholder"]), # ttrvc_text_input
-        gr.update(label=T_update["ttrvc_rvc_pth_select_label"]), # ttrvc_rvc_pth_select
-        gr.update(label=T_update["ttrvc_rvc_index_select_label"]), # ttrvc_rvc_index_select
-        gr.update(label=T_update["ttrvc_pitch_slider_label"]), # ttrvc_pitch_shift_slider
-        gr.update(label=T_update["ttrvc_kokoro_voice_label"], info=T_update["ttrvc_kokoro_voice_info"]), # ttrvc_kokoro_voice_select
-        gr.update(label=T_update["ttrvc_language_select_label"]), # ttrvc_language_select
-        gr.update(label=T_update["ttrvc_speed_slider_label"]), # ttrvc_speed_slider
-        gr.update(value=T_update["ttrvc_generate_button"]), # ttrvc_generate_button
-        gr.update(label=T_update["ttrvc_output_audio_label"]), # ttrvc_output_audio
-    )
-
-# --- Interface Gradio (utilise la langue par défaut initialement) ---
-T = UI_TEXTS[DEFAULT_UI_LANGUAGE] # Charge les textes initiaux
-
-with gr.Blocks(title=T["app_title"]) as demo:
-    # Section Globale (Titre, Description, Sélecteur de Langue, Bouton Refresh)
-    app_title_md = gr.Markdown(f"# {T['app_title']}")
-    app_description_md = gr.Markdown(T["app_description"])
-    with gr.Row():
-        lang_selector = gr.Radio(
-            choices=[("🇬🇧 English", "en"), ("🇫🇷 Français", "fr")],
-            value=DEFAULT_UI_LANGUAGE, # Définit la valeur initiale
-            label=T["lang_select_label"], # Utilise le label initial
-            interactive=True
-        )
-        refresh_button = gr.Button(T["refresh_button"])
-
-    # Définition des Onglets et de leurs composants
-    with gr.Tabs() as tabs:
-        with gr.Tab(T["tab1_title"], id="tab_tts") as tab_tts:
-            with gr.Row():
-                with gr.Column(scale=2):
-                    tts_text_input = gr.Textbox(lines=4, placeholder=T["tts_text_input_placeholder"], label=T["tts_text_input_label"])
-                with gr.Column(scale=1):
-                    tts_voice_select = gr.Dropdown(VOICES_KOKORO, label=T["tts_voice_select_label"], value="ff_siwis")
-                    tts_language_select = gr.Dropdown(LANGUAGES_KOKORO_CHOICES, label=T["tts_language_select_label"], value="fr-fr")
-                    tts_speed_slider = gr.Slider(minimum=0.5, maximum=2.0, step=0.1, value=1.0, label=T["tts_speed_slider_label"])
-            tts_generate_button = gr.Button(T["tts_generate_button"], variant="primary")
-            tts_output_audio = gr.Audio(label=T["tts_output_audio_label"])
-            tts_output_path_state = gr.State(None)
-
-        with gr.Tab(T["tab2_title"], id="tab_rvc") as tab_rvc:
-            with gr.Row():
-                with gr.Column(scale=1):
-                    rvc_input_audio = gr.Audio(label=T["rvc_input_audio_label"], sources=["upload", "microphone"], type="filepath")
-                    rvc_input_audio_info_md = gr.Markdown(T["rvc_input_audio_info"]) # Markdown ici
-                with gr.Column(scale=1):
-                    rvc_pth_select = gr.Dropdown(AVAILABLE_PTH_FILES, label=T["rvc_pth_select_label"], info=T["rvc_pth_select_info"])
-                    rvc_index_select = gr.Dropdown(AVAILABLE_INDEX_FILES, label=T["rvc_index_select_label"], info=T["rvc_index_select_info"])
-                    rvc_pitch_shift_slider = gr.Slider(minimum=-24, maximum=24, step=1, value=0, label=T["rvc_pitch_slider_label"])
-            rvc_generate_button = gr.Button(T["rvc_generate_button"], variant="primary")
-            rvc_output_audio = gr.Audio(label=T["rvc_output_audio_label"])
-
-        with gr.Tab(T["tab3_title"], id="tab_text_to_rvc") as tab_text_to_rvc:
-            ttrvc_description_md = gr.Markdown(T["ttrvc_description"]) # Markdown ici
-            with gr.Row():
-                 with gr.Column(scale=2):
-                    ttrvc_text_input = gr.Textbox(lines=4, placeholder=T["ttrvc_text_input_placeholder"], label=T["ttrvc_text_input_label"])
-                 with gr.Column(scale=1):
-                    ttrvc_rvc_pth_select = gr.Dropdown(AVAILABLE_PTH_FILES, label=T["ttrvc_rvc_pth_select_label"])
-                    ttrvc_rvc_index_select = gr.Dropdown(AVAILABLE_INDEX_FILES, label=T["ttrvc_rvc_index_select_label"])
-                    ttrvc_pitch_shift_slider = gr.Slider(minimum=-24, maximum=24, step=1, value=0, label=T["ttrvc_pitch_slider_label"])
-            with gr.Row():
-                 with gr.Column(scale=1):
-                     ttrvc_kokoro_voice_select = gr.Dropdown(VOICES_KOKORO, label=T["ttrvc_kokoro_voice_label"], value="ff_siwis", info=T["ttrvc_kokoro_voice_info"])
-                 with gr.Column(scale=1):
-                     ttrvc_language_select = gr.Dropdown(LANGUAGES_KOKORO_CHOICES, label=T["ttrvc_language_select_label"], value="fr-fr")
-                 with gr.Column(scale=1):
-                    ttrvc_speed_slider = gr.Slider(minimum=0.5, maximum=2.0, step=0.1, value=1.0, label=T["ttrvc_speed_slider_label"])
-            ttrvc_generate_button = gr.Button(T["ttrvc_generate_button"], variant="primary")
-            ttrvc_output_audio = gr.Audio(label=T["ttrvc_output_audio_label"])
-
-    # --- Définition des actions des boutons et des changements ---
-
-    # Actions des boutons de génération (inchangées)
-    tts_generate_button.click(fn=text_to_speech_fn, inputs=[tts_text_input, tts_voice_select, tts_speed_slider, tts_language_select], outputs=[tts_output_audio, tts_output_path_state], api_name="tts")
-    rvc_generate_button.click(fn=voice_conversion_fn, inputs=[rvc_input_audio, rvc_index_select, rvc_pth_select, rvc_pitch_shift_slider], outputs=rvc_output_audio, api_name="rvc")
-    ttrvc_generate_button.click(fn=text_to_rvc_voice_fn, inputs=[ttrvc_text_input, ttrvc_rvc_index_select, ttrvc_rvc_pth_select, ttrvc_pitch_shift_slider, ttrvc_kokoro_voice_select, ttrvc_speed_slider, ttrvc_language_select], outputs=ttrvc_output_audio, api_name="text_to_rvc")
-
-    # Lien entre sortie TTS et entrée RVC (inchangé)
-    tts_output_path_state.change(fn=lambda x: x, inputs=tts_output_path_state, outputs=rvc_input_audio)
-
-    # Action du bouton Refresh (met à jour seulement les listes RVC des onglets 2 et 3)
-    refresh_button.click(
-        fn=refresh_models_list,
-        inputs=None,
-        outputs=[
-            rvc_pth_select,         # Tab 2 PTH
-            rvc_index_select,       # Tab 2 Index
-            ttrvc_rvc_pth_select,   # Tab 3 PTH
-            ttrvc_rvc_index_select  # Tab 3 Index
-        ]
-    )
-
-    # ----> ACTION POUR CHANGER LA LANGUE DE L'INTERFACE <----
-    # Liste de TOUS les composants dont le texte doit être mis à jour
-    # L'ordre DOIT correspondre à l'ordre des gr.update() retournés par update_ui_language
-    components_to_update = [
-        # Globaux
-        app_title_md, app_description_md, refresh_button, lang_selector,
-        # Tab 1
-        tab_tts, tts_text_input, tts_voice_select, tts_language_select, tts_speed_slider,
-        tts_generate_button, tts_output_audio,
-        # Tab 2
-        tab_rvc, rvc_input_audio, rvc_input_audio_info_md, rvc_pth_select, rvc_index_select,
-        rvc_pitch_shift_slider, rvc_generate_button, rvc_output_audio,
-        # Tab 3
-        tab_text_to_rvc, ttrvc_description_md, ttrvc_text_input, ttrvc_rvc_pth_select,
-        ttrvc_rvc_index_select, ttrvc_pitch_shift_slider, ttrvc_kokoro_voice_select,
-        ttrvc_language_select, ttrvc_speed_slider, ttrvc_generate_button, ttrvc_output_audio,
-    ]
-    lang_selector.change(
-        fn=update_ui_language,
-        inputs=lang_selector,
-        outputs=components_to_update # La liste complète des composants
-    )
-
-# --- Lancement de l'application ---
-if __name__ == "__main__":
-    # Utilise les textes de la langue par défaut pour les messages console initiaux
-    T_console = UI_TEXTS[DEFAULT_UI_LANGUAGE]
-    if kokoro is None:
-        print("\n" + "="*50)
-        print(T_console["warn_kokoro_failed"])
-        print(T_console["warn_kokoro_paths"])
-        print(T_console["warn_tts_disabled"])
-        print("="*50 + "\n")
-    elif not AVAILABLE_PTH_FILES:
-         print("\n" + "="*50)
-         print(T_console["warn_rvc_pth_none_found"])
-         print(T_console["warn_rvc_pth_location"].format(path=RVC_PTH_DIR))
-         print(T_console["warn_rvc_disabled"])
-         print("="*50 + "\n")
-
-    print(f"Starting Gradio Interface in {DEFAULT_UI_LANGUAGE.upper()} (configurable in UI)...")
-    demo.launch(share=False, server_port=7860)
\ No newline at end of file
+# -*- coding: utf-8 -*-
+import time
+_IMPORT_START = time.perf_counter()
+# torch, kokoro_onnx et rvc_python ne sont importés qu'au chargement des modèles (cf. load_kokoro, audio_pipeline)
+import gradio as gr
+import soundfile as sf
+from pathlib import Path
+import os
+import numpy as np
+from rvc_cache import ModelCache, estimate_rvc_model_bytes
+from inference_pool import InferencePool
+from tts_scheduler import TTSBatchScheduler, kokoro_create_batch
+from model_registry import ModelRegistry
+from http_api import BadRequest, HTTPInferenceAPI, get_param
+from longform import FORMATS as LONGFORM_FORMATS, render_document
+from kokoro_session import session_info as kokoro_session_info, session_metrics as kokoro_session_metrics
+from rvc_backend import stats as rvc_backend_stats
+from result_cache import SynthesisCache, file_content_hash, normalize_text, synthesis_cache_key
+from metrics import instrument, instrument_stream, metrics_route, record_audio, register_collector, register_stats, span
+from audio_pipeline import (RVC_INPUT_SAMPLE_RATE, F0_METHODS, RVCParams, load_rvc_inference, resample_for_rvc, rvc_infer_array,
+                            split_text_for_streaming, resample_stream_for_rvc, rvc_stream, CrossfadeStitcher,
+                            decode_audio_for_rvc, split_audio_for_streaming, audio_cache_key, wav_bytes)
+import tempfile
+import zipfile
+import logging
+import traceback
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Durées de démarrage (s) : imports, chargement Kokoro, préchauffage des voix... (cf. readiness_fn)
+STARTUP_TIMINGS = {"imports": round(time.perf_counter() - _IMPORT_START, 3)}
+
+def record_startup_timing(name, start):
+    STARTUP_TIMINGS[name] = round(time.perf_counter() - start, 3)
+    logger.info(f"Startup: {name} took {STARTUP_TIMINGS[name]:.2f}s")
+
+# --- Constantes et Configuration ---
+RVC_MODEL_DIR = Path("modelRVC")
+RVC_INDEX_DIR = RVC_MODEL_DIR / "index"
+RVC_PTH_DIR = RVC_MODEL_DIR / "pth"
+KOKORO_ONNX_PATH = "modelTTS/kokoro-v1.0.onnx"
+KOKORO_VOICES_PATH = "modelTTS/voices-v1.0.bin"
+DEFAULT_UI_LANGUAGE = "en" # Default language set here
+# Cache des modèles RVC : nombre max de modèles, budget mémoire (Mo, 0 = illimité),
+# et voix épinglées au format "voix.pth:voix.index,autre.pth"
+RVC_CACHE_MAX_MODELS = int(os.environ.get("RVC_CACHE_MAX_MODELS", "8"))
+RVC_CACHE_MAX_MB = int(os.environ.get("RVC_CACHE_MAX_MB", "0"))
+RVC_CACHE_PINNED = os.environ.get("RVC_CACHE_PINNED", "")
+# Nombre de requêtes traitées en parallèle par événement Gradio (les modèles partagés sont thread-safe)
+APP_CONCURRENCY_LIMIT = int(os.environ.get("APP_CONCURRENCY_LIMIT", "1"))
+# Backend d'inférence : 0 = dans ce processus, N > 0 = pool de N processus workers
+# (chacun avec sa session Kokoro et ses modèles RVC), threads par worker = cœurs / N par défaut
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", "0"))
+INFERENCE_THREADS_PER_WORKER = int(os.environ.get("INFERENCE_THREADS_PER_WORKER", "0")) or None
+# Micro-batching TTS : taille max d'un lot (0 = désactivé) et fenêtre de regroupement (ms)
+TTS_BATCH_MAX_SIZE = int(os.environ.get("TTS_BATCH_MAX_SIZE", "0"))
+TTS_BATCH_WAIT_MS = float(os.environ.get("TTS_BATCH_WAIT_MS", "20"))
+# Lots exécutés en parallèle (0 = un par worker d'inférence, sinon APP_CONCURRENCY_LIMIT comme sans batching)
+TTS_BATCH_CONCURRENCY = int(os.environ.get("TTS_BATCH_CONCURRENCY", "0"))
+# Cache des résultats de synthèse : mémoire (Mo, 0 = désactivé) et niveau disque FLAC optionnel
+SYNTHESIS_CACHE_MAX_MB = int(os.environ.get("SYNTHESIS_CACHE_MAX_MB", "128"))
+SYNTHESIS_CACHE_DIR = os.environ.get("SYNTHESIS_CACHE_DIR", "")
+SYNTHESIS_CACHE_DISK_MAX_MB = int(os.environ.get("SYNTHESIS_CACHE_DISK_MAX_MB", "1024"))
+# Démarrage : "eager" = Kokoro chargé avant l'UI (comportement historique),
+# "background" = le serveur répond tout de suite ("warming") et les modèles chargent en parallèle,
+# "lazy" = rien n'est chargé avant la première requête
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "eager").lower()
+# Voix RVC chargées au démarrage, même format que RVC_CACHE_PINNED
+PREWARM_VOICES = os.environ.get("PREWARM_VOICES", "")
+STARTUP_PARALLELISM = int(os.environ.get("STARTUP_PARALLELISM", "4"))
+# Ajoute le détail des durées par étape (JSON) en dernière sortie des endpoints tts / rvc / text_to_rvc
+API_RETURN_TIMINGS = os.environ.get("API_RETURN_TIMINGS", "0").lower() in ("1", "true", "yes")
+# Surveillance de modelRVC/ : "auto" (inotify, sinon polling), "inotify", "poll" ou "off" (bouton Refresh seulement),
+# période du polling et fréquence de rafraîchissement des listes dans l'UI (s)
+MODEL_WATCH = os.environ.get("MODEL_WATCH", "auto").lower()
+MODEL_WATCH_POLL_SECONDS = float(os.environ.get("MODEL_WATCH_POLL_SECONDS", "2"))
+MODEL_WATCH_UI_SECONDS = float(os.environ.get("MODEL_WATCH_UI_SECONDS", "5"))
+# API HTTP asynchrone /v1 (cf. http_api.py) : "off", "on" (à côté de l'UI, même port) ou "only" (sans l'UI Gradio)
+HTTP_API = os.environ.get("HTTP_API", "off").lower()
+# Fan-out (un texte, plusieurs voix RVC) : conversions simultanées et nombre maximal de voix par requête
+FANOUT_PARALLELISM = int(os.environ.get("FANOUT_PARALLELISM", "4"))
+FANOUT_MAX_TARGETS = int(os.environ.get("FANOUT_MAX_TARGETS", "64"))
+# Documents longs (cf. longform.py) : segments rendus en même temps (0 = un de plus que de workers d'inférence, ou 2)
+LONGFORM_PARALLELISM = int(os.environ.get("LONGFORM_PARALLELISM", "0"))
+# Un worker d'inférence "spawn" réimporte ce module sous le nom __mp_main__ : il n'a besoin
+# ni du scan des modèles, ni du cache de synthèse, ni de l'API HTTP, ni de l'interface.
+IS_INFERENCE_WORKER = __name__ == "__mp_main__"
+
+# --- Variables Globales ---
+AVAILABLE_INDEX_FILES = []
+AVAILABLE_PTH_FILES = []
+MODEL_REGISTRY = ModelRegistry(
+    RVC_PTH_DIR, RVC_INDEX_DIR, poll_interval=MODEL_WATCH_POLL_SECONDS,
+    on_change=lambda changes: on_model_files_changed(changes),
+)
+RVC_CACHE = ModelCache(
+    max_models=RVC_CACHE_MAX_MODELS, max_bytes=RVC_CACHE_MAX_MB * 1024 * 1024,
+    size_fn=lambda model_key, rvc: estimate_rvc_model_bytes(rvc, model_key[1]),
+    on_evict=lambda model_key, rvc: _release_rvc_model(model_key, rvc),
+)
+kokoro = None
+KOKORO_STATE = "workers" if INFERENCE_WORKERS > 0 else "pending" # pending | loading | ready | failed | workers
+_KOKORO_LOCK = threading.Lock()
+WARMUP_DONE = threading.Event()
+PREWARMED_VOICES = []
+INFERENCE_POOL = None # InferencePool, créé au premier usage si INFERENCE_WORKERS > 0
+_BACKEND_INIT_LOCK = threading.Lock()
+TTS_SCHEDULER = None # TTSBatchScheduler, créé au premier usage si TTS_BATCH_MAX_SIZE > 0
+SYNTHESIS_CACHE = SynthesisCache(
+    max_memory_bytes=SYNTHESIS_CACHE_MAX_MB * 1024 * 1024,
+    disk_dir=SYNTHESIS_CACHE_DIR or None, max_disk_bytes=SYNTHESIS_CACHE_DISK_MAX_MB * 1024 * 1024,
+) if (SYNTHESIS_CACHE_MAX_MB > 0 or SYNTHESIS_CACHE_DIR) and not IS_INFERENCE_WORKER else None
+
+# ==================================================
+#           TEXTES DE L'INTERFACE (FR/EN)
+# ==================================================
+# (Dictionnaire UI_TEXTS reste le même qu'avant)
+UI_TEXTS = {
+    "fr": {
+        "app_title": "Convertisseur Audio Texte-Parole (Kokoro TTS + RVC)",
+        "app_description": "Générez de la parole à partir de texte avec Kokoro TTS, puis convertissez la voix avec des modèles RVC.",
+        "refresh_button": "🔄 Actualiser les Listes de Modèles RVC",
+        "lang_select_label": "Langue de l'Interface",
+        # Tab 1: TTS
+        "tab1_title": "1. Texte -> Parole (Kokoro TTS)",
+        "tts_text_input_label": "Texte à Synthétiser",
+        "tts_text_input_placeholder": "Entrez votre texte ici...",
+        "tts_voice_select_label": "Voix Kokoro TTS",
+        "tts_language_select_label": "Langue (peut affecter la prononciation)",
+        "tts_speed_slider_label": "Vitesse de Parole",
+        "tts_generate_button": "🔊 Générer Audio TTS",
+        "tts_output_audio_label": "Audio TTS Généré",
+        "tts_stream_button": "⚡ Diffuser l'Audio TTS (Streaming)",
+        "tts_stream_output_audio_label": "Audio TTS en Streaming",
+        # Tab 2: RVC
+        "tab2_title": "2. Conversion de Voix (RVC)",
+        "rvc_input_audio_label": "Audio d'Entrée pour RVC",
+        "rvc_input_audio_info": "👆 Utilisez l'audio généré à l'étape 1 OU téléchargez/enregistrez un fichier.",
+        "rvc_pth_select_label": "Modèle de Voix RVC (.pth)",
+        "rvc_pth_select_info": "Choisissez le fichier .pth de la voix cible.",
+        "rvc_index_select_label": "Fichier Index RVC (.index)",
+        "rvc_index_select_info": "Optionnel mais recommandé pour la qualité. Doit correspondre au .pth.",
+        "rvc_pitch_slider_label": "Décalage de Hauteur (demi-tons)",
+        "rvc_advanced_label": "⚙️ Réglages RVC Avancés",
+        "rvc_f0_method_label": "Méthode d'Extraction du F0",
+        "rvc_index_rate_label": "Influence de l'Index",
+        "rvc_protect_label": "Protection des Consonnes",
+        "rvc_generate_button": "🗣️ Convertir la Voix RVC",
+        "rvc_output_audio_label": "Audio Converti par RVC",
+        # Tab 3: Text -> RVC
+        "tab3_title": "3. Texte -> Voix RVC (Direct)",
+        "ttrvc_description": "Combine les étapes 1 et 2 : Génère la parole avec Kokoro puis la convertit avec RVC.",
+        "ttrvc_text_input_label": "Texte à Convertir",
+        "ttrvc_text_input_placeholder": "Entrez votre texte ici...",
+        "ttrvc_rvc_pth_select_label": "Modèle de Voix RVC (.pth)",
+        "ttrvc_rvc_index_select_label": "Fichier Index RVC (.index)",
+        "ttrvc_pitch_slider_label": "Décalage de Hauteur (demi-tons)",
+        "ttrvc_kokoro_voice_label": "Voix Kokoro TTS (Base)",
+        "ttrvc_kokoro_voice_info": "Voix utilisée pour générer la parole initiale avant conversion RVC.",
+        "ttrvc_language_select_label": "Langue Kokoro",
+        "ttrvc_speed_slider_label": "Vitesse de Parole (Base)",
+        "ttrvc_generate_button": "🚀 Générer Audio RVC depuis Texte",
+        "ttrvc_output_audio_label": "Audio RVC Final",
+        "ttrvc_stream_button": "⚡ Diffuser l'Audio RVC (Streaming)",
+        "ttrvc_stream_output_audio_label": "Audio RVC en Streaming",
+        # Erreurs (utilisées dans le backend, la langue est fixée au moment de l'erreur)
+        "error_kokoro_not_loaded": "Erreur: Le modèle Kokoro TTS n'est pas chargé.",
+        "error_tts_failed": "Erreur Kokoro TTS: {e}",
+        "error_tts_intermediate_failed": "Erreur: La synthèse Kokoro n'a produit aucun audio à convertir.",
+        "error_pth_not_found": "Erreur: Fichier modèle RVC introuvable : {path}",
+        "error_index_not_found_warning": "Fichier index RVC introuvable ({path}) : conversion sans index.",
+        "error_rvc_pth_missing": "Erreur: Veuillez choisir un modèle RVC (.pth).",
+        "error_rvc_input_audio_invalid": "Erreur: Audio d'entrée manquant ou illisible.",
+        "error_rvc_load_failed": "Erreur lors du chargement du modèle RVC : {e}",
+        "error_rvc_conversion_failed": "Erreur lors de la conversion RVC : {e}",
+        "error_unexpected": "Erreur inattendue : {e}",
+        "error_fanout_too_many": "Erreur: Trop de voix pour le fan-out : {count} (max {max}).",
+        "warn_kokoro_failed": "ATTENTION : le modèle Kokoro TTS n'a pas pu être chargé.",
+        "warn_kokoro_paths": "Vérifiez que kokoro-v1.0.onnx et voices-v1.0.bin sont présents dans le dossier modelTTS.",
+        "warn_tts_disabled": "Les fonctions TTS et Texte -> RVC sont désactivées.",
+        "warn_rvc_pth_none_found": "ATTENTION : aucun modèle RVC (.pth) trouvé.",
+        "warn_rvc_pth_location": "Placez vos fichiers .pth dans : {path}",
+        "warn_rvc_disabled": "Les fonctions de conversion RVC sont indisponibles tant qu'aucun modèle n'est présent.",
+    },
+    "en": {
+        "app_title": "Text-to-Speech Audio Converter (Kokoro TTS + RVC)",
+        "app_description": "Generate speech from text using Kokoro TTS, then convert the voice using RVC models.",
+        "refresh_button": "🔄 Refresh RVC Model Lists",
+        "lang_select_label": "Interface Language",
+        # Tab 1: TTS
+        "tab1_title": "1. Text -> Speech (Kokoro TTS)",
+        "tts_text_input_label": "Text to Synthesize",
+        "tts_text_input_placeholder": "Enter your text here...",
+        "tts_voice_select_label": "Kokoro TTS Voice",
+        "tts_language_select_label": "Language (may affect pronunciation)",
+        "tts_speed_slider_label": "Speech Speed",
+        "tts_generate_button": "🔊 Generate TTS Audio",
+        "tts_output_audio_label": "Generated TTS Audio",
+        "tts_stream_button": "⚡ Stream TTS Audio",
+        "tts_stream_output_audio_label": "Streamed TTS Audio",
+        # Tab 2: RVC
+        "tab2_title": "2. Voice Conversion (RVC)",
+        "rvc_input_audio_label": "Input Audio for RVC",
+        "rvc_input_audio_info": "👆 Use the audio generated in step 1 OR upload/record a file.",
+        "rvc_pth_select_label": "RVC Voice Model (.pth)",
+        "rvc_pth_select_info": "Choose the target voice's .pth file.",
+        "rvc_index_select_label": "RVC Index File (.index)",
+        "rvc_index_select_info": "Optional but recommended for quality. Should match the .pth file.",
+        "rvc_pitch_slider_label": "Pitch Shift (semitones)",
+        "rvc_advanced_label": "⚙️ Advanced RVC Settings",
+        "rvc_f0_method_label": "F0 Extraction Method",
+        "rvc_index_rate_label": "Index Influence",
+        "rvc_protect_label": "Consonant Protection",
+        "rvc_generate_button": "🗣️ Convert RVC Voice",
+        "rvc_output_audio_label": "Converted RVC Audio",
+        # Tab 3: Text -> RVC
+        "tab3_title": "3. Text -> RVC Voice (Direct)",
+        "ttrvc_description": "Combines steps 1 and 2: Generates speech with Kokoro then converts it with RVC.",
+        "ttrvc_text_input_label": "Text to Convert",
+        "ttrvc_text_input_placeholder": "Enter your text here...",
+        "ttrvc_rvc_pth_select_label": "RVC Voice Model (.pth)",
+        "ttrvc_rvc_index_select_label": "RVC Index File (.index)",
+        "ttrvc_pitch_slider_label": "Pitch Shift (semitones)",
+        "ttrvc_kokoro_voice_label": "Kokoro TTS Voice (Base)",
+        "ttrvc_kokoro_voice_info": "Voice used to generate the initial speech before RVC conversion.",
+        "ttrvc_language_select_label": "Kokoro Language",
+        "ttrvc_speed_slider_label": "Speech Speed (Base)",
+        "ttrvc_generate_button": "🚀 Generate RVC Audio from Text",
+        "ttrvc_output_audio_label": "Final RVC Audio",
+        "ttrvc_stream_button": "⚡ Stream RVC Audio",
+        "ttrvc_stream_output_audio_label": "Streamed RVC Audio",
+        # Errors (used in backend, language is fixed when error occurs)
+        "error_kokoro_not_loaded": "Error: Kokoro TTS model is not loaded.",
+        "error_tts_failed": "Kokoro TTS Error: {e}",
+        "error_tts_intermediate_failed": "Error: Kokoro TTS produced no audio to convert.",
+        "error_pth_not_found": "Error: RVC model file not found: {path}",
+        "error_index_not_found_warning": "RVC index file not found ({path}); converting without index.",
+        "error_rvc_pth_missing": "Error: Please select an RVC model (.pth).",
+        "error_rvc_input_audio_invalid": "Error: Input audio is missing or unreadable.",
+        "error_rvc_load_failed": "Error loading RVC model: {e}",
+        "error_rvc_conversion_failed": "Error during RVC conversion: {e}",
+        "error_unexpected": "Unexpected error: {e}",
+        "error_fanout_too_many": "Error: Too many fan-out voices: {count} (max {max}).",
+        "warn_kokoro_failed": "WARNING: the Kokoro TTS model could not be loaded.",
+        "warn_kokoro_paths": "Check that kokoro-v1.0.onnx and voices-v1.0.bin are in the modelTTS folder.",
+        "warn_tts_disabled": "TTS and Text -> RVC features are disabled.",
+        "warn_rvc_pth_none_found": "WARNING: no RVC model (.pth) found.",
+        "warn_rvc_pth_location": "Put your .pth files in: {path}",
+        "warn_rvc_disabled": "RVC conversion features are unavailable until a model is added.",
+    }
+}
+
+# --- Fonctions Utilitaires (inchangées) ---
+def scan_rvc_models(log_results=True):
+    global AVAILABLE_INDEX_FILES, AVAILABLE_PTH_FILES
+    logger.info(f"Scanning RVC model directories: {RVC_PTH_DIR} and {RVC_INDEX_DIR}")
+    try:
+        MODEL_REGISTRY.scan()
+    except Exception as e:
+        logger.error(f"Error during RVC model scan: {e}", exc_info=True)
+    AVAILABLE_PTH_FILES = MODEL_REGISTRY.pth_files()
+    AVAILABLE_INDEX_FILES = MODEL_REGISTRY.index_files()
+    if log_results:
+        logger.info(f"Scan complete. Found PTH files: {len(AVAILABLE_PTH_FILES)}")
+        logger.info(f"Scan complete. Found Index files: {len(AVAILABLE_INDEX_FILES)}")
+        if not AVAILABLE_PTH_FILES: logger.warning("No .pth model files found.")
+
+def create_silent_audio(sample_rate=44100):
+    # ... (même code qu'avant) ...
+    return (sample_rate, np.array([], dtype=np.float32))
+
+def on_model_files_changed(changes):
+    """Appelé par MODEL_REGISTRY : met à jour les listes et décharge seulement les modèles dont le fichier a changé."""
+    global AVAILABLE_INDEX_FILES, AVAILABLE_PTH_FILES
+    AVAILABLE_PTH_FILES = MODEL_REGISTRY.pth_files()
+    AVAILABLE_INDEX_FILES = MODEL_REGISTRY.index_files()
+    stale = {str(MODEL_REGISTRY.path(kind, name)) for kind, name, event in changes if event != "added"}
+    if not stale: return
+    for model_key in RVC_CACHE.keys():
+        if model_key[0] in stale or model_key[1] in stale:
+            RVC_CACHE.invalidate(model_key)
+            logger.info(f"RVC model file changed, unloaded: {os.path.basename(model_key[0])}")
+    if INFERENCE_POOL is not None: INFERENCE_POOL.invalidate(stale)
+
+def refresh_models_list():
+    logger.info("Refreshing RVC model lists for Tabs 2 & 3...")
+    # Avec la surveillance active, les listes sont déjà à jour : pas de rescan complet
+    if MODEL_REGISTRY.mode == "off": scan_rvc_models(log_results=True)
+    return (
+        gr.update(choices=AVAILABLE_PTH_FILES),   # rvc_pth_select (Tab 2)
+        gr.update(choices=AVAILABLE_INDEX_FILES), # rvc_index_select (Tab 2)
+        gr.update(choices=AVAILABLE_PTH_FILES),   # ttrvc_rvc_pth_select (Tab 3)
+        gr.update(choices=AVAILABLE_INDEX_FILES)  # ttrvc_rvc_index_select (Tab 3)
+    )
+
+def load_kokoro():
+    """Charge Kokoro une seule fois ; les appels concurrents attendent le premier chargement."""
+    global kokoro, KOKORO_STATE
+    if KOKORO_STATE != "pending": return kokoro
+    with _KOKORO_LOCK:
+        if KOKORO_STATE != "pending": return kokoro
+        KOKORO_STATE = "loading"
+        start = time.perf_counter()
+        try:
+            if os.path.exists(KOKORO_ONNX_PATH) and os.path.exists(KOKORO_VOICES_PATH):
+                from kokoro_frontend import load_kokoro_frontend
+                from kokoro_session import create_kokoro_session
+                with span("kokoro_load"): kokoro = load_kokoro_frontend(KOKORO_ONNX_PATH, KOKORO_VOICES_PATH, create_kokoro_session(KOKORO_ONNX_PATH))
+                logger.info("Kokoro TTS model initialized successfully.")
+            else:
+                logger.error(f"Kokoro TTS files not found. Check paths: {KOKORO_ONNX_PATH}, {KOKORO_VOICES_PATH}")
+        except Exception as e:
+            logger.error(f"Critical error during Kokoro TTS initialization: {e}", exc_info=True)
+            kokoro = None
+        KOKORO_STATE = "ready" if kokoro is not None else "failed"
+        record_startup_timing("kokoro_load", start)
+        return kokoro
+
+# --- Initialisation des modèles au démarrage ---
+if not IS_INFERENCE_WORKER:
+    _scan_start = time.perf_counter()
+    scan_rvc_models()
+    record_startup_timing("scan_models", _scan_start)
+    if INFERENCE_WORKERS > 0:
+        # Les workers chargent leur propre Kokoro (cf. _init_worker)
+        logger.info(f"Kokoro TTS will be loaded by {INFERENCE_WORKERS} inference worker(s).")
+    elif STARTUP_MODE == "eager":
+        load_kokoro()
+
+# --- Préparation des listes pour Gradio (Noms de voix/langues, inchangé) ---
+# ... (VOICES_KOKORO_RAW, LANGUAGES_KOKORO, COUNTRY_FLAGS, VOICES_KOKORO, LANGUAGES_KOKORO_CHOICES) ...
+VOICES_KOKORO_RAW = [
+    "af_alloy", "af_aoede", "af_bella", "af_heart", "af_jessica", "af_kore", "af_nicole",
+    "af_nova", "af_river", "af_sarah", "af_sky", "am_adam", "am_echo", "am_eric",
+    "am_fenrir", "am_liam", "am_michael", "am_onyx", "am_puck", "bf_alice",
+    "bf_emma", "bf_isabella", "bf_lily", "bm_daniel", "bm_fable", "bm_george", "bm_lewis",
+    "ff_siwis", "if_sara", "im_nicola", "jf_alpha", "jf_gongitsune", "jf_nezumi",
+    "jf_tebukuro", "jm_kumo", "zf_xiaobei",
+    "zf_xiaoni", "zf_xiaoxiao", "zf_xiaoyi"
+]
+LANGUAGES_KOKORO = {
+    "fr-fr": "Français", "it": "Italiano", "en-us": "English (US)", "en-gb": "English (GB)",
+    "ja": "日本語", "cmn": "中文", "pt-br": "Português (BR)", "es": "Español"
+}
+COUNTRY_FLAGS = { "af": "🇺🇸", "am": "🇺🇸", "bf": "🇬🇧", "bm": "🇬🇧", "ff": "🇫🇷", "if": "🇮🇹", "im": "🇮🇹", "jf": "🇯🇵", "jm": "🇯🇵", "zf": "🇨🇳" }
+VOICES_KOKORO = []
+for voice_code in VOICES_KOKORO_RAW:
+    country_code = voice_code[:2]
+    flag = COUNTRY_FLAGS.get(country_code, "🌐")
+    lang_key_fr = f"{country_code}-fr"; lang_key_base = country_code
+    lang_name = LANGUAGES_KOKORO.get(lang_key_fr, LANGUAGES_KOKORO.get(lang_key_base, country_code.upper()))
+    display_name = f"{flag} {voice_code.split('_')[1].capitalize()} ({lang_name})"
+    VOICES_KOKORO.append((display_name, voice_code))
+LANGUAGES_KOKORO_CHOICES = [(name, code) for code, name in LANGUAGES_KOKORO.items()]
+
+
+# --- Fonctions Core (inchangées, utilisent T pour les erreurs) ---
+# ... (text_to_speech_fn, load_rvc_model, voice_conversion_fn, text_to_rvc_voice_fn) ...
+# Note: Les gr.Error levées utiliseront la langue active AU MOMENT où l'erreur se produit.
+# Elles ne seront pas retraduites si l'utilisateur change la langue *après* l'affichage de l'erreur.
+def get_inference_pool():
+    """Pool de workers d'inférence (créé au premier appel), ou None en mode mono-processus."""
+    global INFERENCE_POOL
+    if INFERENCE_WORKERS <= 0: return None
+    with _BACKEND_INIT_LOCK:
+        if INFERENCE_POOL is None:
+            INFERENCE_POOL = InferencePool(
+                INFERENCE_WORKERS, threads_per_worker=INFERENCE_THREADS_PER_WORKER,
+                kokoro_onnx_path=KOKORO_ONNX_PATH, kokoro_voices_path=KOKORO_VOICES_PATH,
+                cache_max_models=RVC_CACHE_MAX_MODELS, cache_max_bytes=RVC_CACHE_MAX_MB * 1024 * 1024,
+            )
+        return INFERENCE_POOL
+
+def kokoro_available():
+    # En démarrage "background" / "lazy", attend (ou déclenche) le chargement plutôt que d'échouer
+    return INFERENCE_WORKERS > 0 or load_kokoro() is not None
+
+def inference_pool_stats_fn() -> dict:
+    """Charge et affinité des workers d'inférence (vide en mode mono-processus)."""
+    pool = get_inference_pool()
+    return pool.stats() if pool else {}
+
+def kokoro_synthesize_batch(texts, voice, speed, lang):
+    """Exécute un lot du scheduler TTS : un aller-retour vers un worker, ou directement sur la session locale."""
+    pool = get_inference_pool()
+    if pool: return pool.tts_batch(texts, voice, speed, lang)
+    with span("kokoro_batch"): return kokoro_create_batch(load_kokoro(), texts, voice, speed, lang)
+
+def get_tts_scheduler():
+    """Scheduler de micro-batching TTS (créé au premier appel), ou None s'il est désactivé."""
+    global TTS_SCHEDULER
+    if TTS_BATCH_MAX_SIZE <= 0: return None
+    with _BACKEND_INIT_LOCK:
+        if TTS_SCHEDULER is None:
+            # Un lot en cours par worker d'inférence ; en local, autant de lots que de requêtes Kokoro concurrentes sans batching
+            concurrency = TTS_BATCH_CONCURRENCY or (INFERENCE_WORKERS if INFERENCE_WORKERS > 0 else APP_CONCURRENCY_LIMIT)
+            TTS_SCHEDULER = TTSBatchScheduler(kokoro_synthesize_batch, max_batch_size=TTS_BATCH_MAX_SIZE, max_wait_ms=TTS_BATCH_WAIT_MS,
+                                              max_concurrent_batches=concurrency)
+        return TTS_SCHEDULER
+
+def tts_scheduler_stats_fn() -> dict:
+    """Taille des lots et latences p50/p99 du micro-batching TTS (vide s'il est désactivé)."""
+    scheduler = get_tts_scheduler()
+    return scheduler.stats() if scheduler else {}
+
+def cached_synthesis(cache_key, compute):
+    """Résultat (sample_rate, audio) depuis SYNTHESIS_CACHE, sinon compute() puis mise en cache."""
+    if SYNTHESIS_CACHE is None or cache_key is None: return compute()
+    with span("synthesis_cache_get"): cached = SYNTHESIS_CACHE.get(cache_key)
+    if cached is not None:
+        logger.info(f"Served from synthesis cache: {cache_key[:12]}")
+        return cached
+    result = compute()
+    with span("synthesis_cache_put"): SYNTHESIS_CACHE.put(cache_key, *result)
+    return result
+
+def kokoro_cache_parts():
+    """Ce qui, côté Kokoro, change l'audio sans changer les paramètres : profil ONNX et contenu des fichiers du modèle."""
+    return {"profile": kokoro_session_info()["profile"], "kokoro_onnx": file_content_hash(KOKORO_ONNX_PATH),
+            "kokoro_voices": file_content_hash(KOKORO_VOICES_PATH)}
+
+def tts_cache_key(text, voice, speed, lang):
+    return synthesis_cache_key(kind="tts", text=normalize_text(text), voice=voice, speed=float(speed), lang=lang, **kokoro_cache_parts())
+
+def synthesis_cache_stats_fn() -> dict:
+    """Hits mémoire/disque, misses et occupation du cache de résultats de synthèse."""
+    return SYNTHESIS_CACHE.stats() if SYNTHESIS_CACHE else {}
+
+def synthesize_kokoro_array(text, voice, speed, lang, is_phonemes=False):
+    """Synthèse Kokoro en mémoire : retourne (sample_rate, samples float32) sans écrire de fichier.
+
+    `is_phonemes` : `text` est déjà phonémisé (G2P sauté), cf. kokoro_frontend.
+    """
+    T_err = UI_TEXTS[DEFAULT_UI_LANGUAGE]
+    if not kokoro_available(): raise gr.Error(T_err["error_kokoro_not_loaded"])
+    if not text or not text.strip(): return create_silent_audio()
+    logger.info(f"TTS Kokoro: Voice='{voice}', Speed={speed}, Lang='{lang}', Text='{text[:50]}...'")
+    pool, scheduler = get_inference_pool(), get_tts_scheduler()
+    try:
+        if scheduler and not is_phonemes: sample_rate, samples = scheduler.synthesize(text, voice, speed, lang)
+        elif pool: sample_rate, samples = pool.tts(text, voice, speed, lang, is_phonemes)
+        else:
+            with span("kokoro"): samples, sample_rate = load_kokoro().create(text, voice=voice, speed=speed, lang=lang, is_phonemes=is_phonemes)
+    except Exception as e:
+        logger.error(f"Error during Kokoro TTS synthesis: {e}\n{traceback.format_exc()}")
+        raise gr.Error(T_err["error_tts_failed"].format(e=e))
+    if samples is None or len(samples) == 0: return create_silent_audio()
+    record_audio("tts", len(samples), sample_rate)
+    logger.info(f"  Kokoro TTS generated {len(samples)} samples at {sample_rate} Hz.")
+    return sample_rate, samples
+
+def text_to_speech_fn(text, voice, speed, lang):
+    # Utilise T[key] pour les messages d'erreur levés par gr.Error
+    T_err = UI_TEXTS[DEFAULT_UI_LANGUAGE] # Utilise la langue par défaut pour les erreurs backend pour simplifier
+    if not kokoro_available(): raise gr.Error(T_err["error_kokoro_not_loaded"])
+    if not text or not text.strip(): return create_silent_audio(), None
+    output_path = None
+    try:
+        sample_rate, samples = cached_synthesis(tts_cache_key(text, voice, speed, lang), lambda: synthesize_kokoro_array(text, voice, speed, lang))
+        if len(samples) == 0: return create_silent_audio(), None
+        # Le fichier temporaire ne sert qu'à alimenter l'onglet RVC de l'UI (gr.Audio type="filepath")
+        with span("file_io"), tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_file:
+            output_path = tmp_file.name
+            sf.write(output_path, samples, sample_rate)
+            logger.info(f"Temporary Kokoro TTS audio created: {output_path}")
+        return (sample_rate, samples), output_path
+    except Exception as e:
+        if output_path and os.path.exists(output_path):
+            try: os.remove(output_path); logger.info(f"Cleaned up temp TTS file after error: {output_path}")
+            except OSError as ose: logger.error(f"Failed to delete temp file {output_path}: {ose}")
+        if isinstance(e, gr.Error): raise e
+        logger.error(f"Error during Kokoro TTS synthesis: {e}\n{traceback.format_exc()}")
+        raise gr.Error(T_err["error_tts_failed"].format(e=e))
+
+def text_to_speech_phonemes_fn(phonemes, voice, speed):
+    """TTS depuis des phonèmes Kokoro déjà calculés (catalogues pré-phonémisés) : pas de G2P au service."""
+    T_err = UI_TEXTS[DEFAULT_UI_LANGUAGE]
+    if not kokoro_available(): raise gr.Error(T_err["error_kokoro_not_loaded"])
+    if not phonemes or not phonemes.strip(): return create_silent_audio()
+    cache_key = synthesis_cache_key(kind="tts_phonemes", phonemes=phonemes.strip(), voice=voice, speed=float(speed))
+    return cached_synthesis(cache_key, lambda: synthesize_kokoro_array(phonemes.strip(), voice, speed, "en-us", is_phonemes=True))
+
+def phonemize_fn(text: str, lang: str) -> str:
+    """Phonèmes Kokoro d'un texte, à réutiliser avec l'endpoint tts_phonemes."""
+    T_err = UI_TEXTS[DEFAULT_UI_LANGUAGE]
+    if not kokoro_available(): raise gr.Error(T_err["error_kokoro_not_loaded"])
+    pool = get_inference_pool()
+    with span("phonemize"): return pool.phonemize(text, lang) if pool else load_kokoro().phonemize(text, lang)
+
+def kokoro_frontend_stats_fn() -> dict:
+    """Cache de phonèmes du Kokoro de ce processus (hits/misses) ; vide avec des workers d'inférence."""
+    return kokoro.stats() if kokoro is not None else {}
+
+def _load_rvc_instance(rvc_pth_path, rvc_index_path):
+    T_err = UI_TEXTS[DEFAULT_UI_LANGUAGE]
+    logger.info(f"Loading new RVC model: {os.path.basename(rvc_pth_path)}")
+    if not os.path.exists(rvc_pth_path): raise FileNotFoundError(T_err["error_pth_not_found"].format(path=rvc_pth_path))
+    if rvc_index_path and not os.path.exists(rvc_index_path):
+        logger.warning(T_err["error_index_not_found_warning"].format(path=rvc_index_path))
+        rvc_index_path = None
+    import torch
+    device = "cuda:0" if torch.cuda.is_available() else "cpu"; logger.info(f"Using RVC device: {device}")
+    try:
+        if rvc_index_path: logger.info(f"  with index: {os.path.basename(rvc_index_path)}")
+        with span("rvc_model_load"): return load_rvc_inference(rvc_pth_path, rvc_index_path, device)
+    except Exception as e:
+        logger.error(f"Error loading RVC model ({os.path.basename(rvc_pth_path)}): {e}\n{traceback.format_exc()}")
+        raise gr.Error(T_err["error_rvc_load_failed"].format(e=e))
+
+def _release_rvc_model(model_key, rvc):
+    # La mémoire est libérée quand plus aucune requête en cours ne référence le modèle
+    import torch
+    if torch.cuda.is_available(): torch.cuda.empty_cache()
+
+def load_rvc_model(rvc_pth_path, rvc_index_path):
+    model_key = (rvc_pth_path, rvc_index_path)
+    if model_key in RVC_CACHE: logger.info(f"Using cached RVC model: {os.path.basename(rvc_pth_path)}")
+    rvc = RVC_CACHE.get_or_load(model_key, lambda: _load_rvc_instance(rvc_pth_path, rvc_index_path))
+    return rvc
+
+def is_plain_file_name(name):
+    """Nom de fichier sans dossier ("voix.pth", pas "../voix.pth") : reste dans modelRVC/pth ou modelRVC/index."""
+    return bool(name) and name not in (".", "..") and os.path.basename(name.replace("\\", "/")) == name
+
+def rvc_model_key(rvc_pth_file_name, rvc_index_file_name):
+    """Clé de RVC_CACHE pour un couple (.pth, .index) choisi dans l'UI (noms de fichiers simples uniquement)."""
+    for name in (rvc_pth_file_name, rvc_index_file_name):
+        if name and not is_plain_file_name(name): raise gr.Error(UI_TEXTS[DEFAULT_UI_LANGUAGE]["error_pth_not_found"].format(path=name))
+    rvc_index_path = RVC_INDEX_DIR / rvc_index_file_name if rvc_index_file_name else None
+    return (str(RVC_PTH_DIR / rvc_pth_file_name), str(rvc_index_path) if rvc_index_path else None)
+
+def pin_rvc_voice(rvc_pth_file_name, rvc_index_file_name=None):
+    """Épingle une voix "chaude" : jamais évincée du cache."""
+    RVC_CACHE.pin(rvc_model_key(rvc_pth_file_name, rvc_index_file_name))
+
+def unpin_rvc_voice(rvc_pth_file_name, rvc_index_file_name=None):
+    RVC_CACHE.unpin(rvc_model_key(rvc_pth_file_name, rvc_index_file_name))
+
+def paired_index_update(rvc_pth_file_name):
+    """Présélectionne le .index apparié au .pth choisi (même nom de voix), s'il existe."""
+    index_name = MODEL_REGISTRY.paired_index(rvc_pth_file_name) if rvc_pth_file_name else None
+    return gr.update(value=index_name) if index_name else gr.update()
+
+def model_lists_tick(known_version):
+    """Timer de l'UI : renvoie les nouvelles listes seulement si le registre a changé depuis le dernier tick."""
+    version = MODEL_REGISTRY.version
+    if version == known_version: return gr.update(), gr.update(), gr.update(), gr.update(), gr.update()
+    return (*refresh_models_list(), version)
+
+def model_registry_stats_fn() -> dict:
+    """État de la surveillance de modelRVC/ (mode, nombre de fichiers, voix appariées, événements)."""
+    return MODEL_REGISTRY.stats()
+
+def rvc_backend_stats_fn() -> dict:
+    """Chemin RVC de ce processus : générateurs TorchScript, HuBERT partagé, cache de features ; à zéro avec des workers d'inférence."""
+    return rvc_backend_stats()
+
+def rvc_cache_stats_fn() -> dict:
+    """Compteurs du cache de modèles RVC (hits/misses/évictions, mémoire), pour la supervision."""
+    return RVC_CACHE.stats()
+
+def parse_voice_list(spec):
+    """ "voix.pth:voix.index,autre.pth" -> [("voix.pth", "voix.index"), ("autre.pth", None)]"""
+    voices = []
+    for voice in filter(None, (v.strip() for v in spec.split(","))):
+        pth, _, index = voice.partition(":")
+        voices.append((pth, index or None))
+    return voices
+
+# Voix épinglées au démarrage (RVC_CACHE_PINNED)
+if not IS_INFERENCE_WORKER:
+    for pinned_pth, pinned_index in parse_voice_list(RVC_CACHE_PINNED):
+        pin_rvc_voice(pinned_pth, pinned_index)
+
+def prewarm_rvc_voice(rvc_pth_file_name, rvc_index_file_name=None):
+    """Charge une voix RVC (dans le processus ou dans un worker d'inférence) avant la première requête."""
+    start = time.perf_counter()
+    model_key = rvc_model_key(rvc_pth_file_name, rvc_index_file_name)
+    pool = get_inference_pool()
+    if pool: pool.preload(model_key)
+    else: load_rvc_model(*model_key)
+    PREWARMED_VOICES.append(rvc_pth_file_name)
+    record_startup_timing(f"prewarm:{rvc_pth_file_name}", start)
+
+def warm_up_models():
+    """Charge Kokoro et les voix PREWARM_VOICES en parallèle, puis passe l'état de démarrage à "ready"."""
+    start = time.perf_counter()
+    pool = get_inference_pool()
+    with ThreadPoolExecutor(max_workers=max(1, STARTUP_PARALLELISM), thread_name_prefix="warmup") as executor:
+        tasks = {executor.submit(pool.warmup, True) if pool else executor.submit(load_kokoro): "Kokoro"}
+        for pth, index in parse_voice_list(PREWARM_VOICES):
+            tasks[executor.submit(prewarm_rvc_voice, pth, index)] = pth
+        for future in as_completed(tasks):
+            try: future.result()
+            except Exception as e: logger.error(f"Warm-up failed for {tasks[future]}: {e}")
+    record_startup_timing("warm_up", start)
+    WARMUP_DONE.set()
+    print_startup_warnings()
+
+def readiness_fn() -> dict:
+    """État de démarrage ("warming" / "ready" / "degraded") et durées de chargement, pour les sondes de disponibilité."""
+    if not WARMUP_DONE.is_set() and STARTUP_MODE != "lazy": status = "warming"
+    elif KOKORO_STATE == "failed": status = "degraded"
+    else: status = "ready"
+    return {"status": status, "startup_mode": STARTUP_MODE, "kokoro": KOKORO_STATE,
+            "prewarmed_voices": list(PREWARMED_VOICES), "timings": dict(STARTUP_TIMINGS)}
+
+def make_rvc_params(pitch_shift, f0_method=None, index_rate=None, protect=None):
+    """RVCParams d'une requête ; les valeurs absentes (anciens appels API) prennent les défauts RVC."""
+    defaults = RVCParams()
+    return defaults._replace(
+        f0_up_key=int(pitch_shift or 0),
+        f0_method=f0_method or defaults.f0_method,
+        index_rate=defaults.index_rate if index_rate is None else float(index_rate),
+        protect=defaults.protect if protect is None else float(protect),
+    )
+
+def convert_rvc_array(audio_16k, rvc_index_file_name, rvc_pth_file_name, params, audio_key=None):
+    """Conversion RVC en mémoire d'un audio mono 16 kHz : retourne (sample_rate, audio) sans fichier temporaire.
+
+    `params` (RVCParams) est propre à la requête : le modèle partagé du cache n'est jamais modifié.
+    """
+    model_key = rvc_model_key(rvc_pth_file_name, rvc_index_file_name)
+    pool = get_inference_pool()
+    rvc = None if pool else load_rvc_model(*model_key)
+    logger.info(f"RVC params: {params}")
+    try:
+        if pool: sample_rate_rvc, converted_audio_rvc = pool.rvc(audio_16k, model_key, params, audio_key)
+        else: sample_rate_rvc, converted_audio_rvc = rvc_infer_array(rvc, audio_16k, params=params, audio_key=audio_key)
+    except Exception as e:
+        logger.error(f"Error during RVC conversion: {e}\n{traceback.format_exc()}")
+        raise gr.Error(UI_TEXTS[DEFAULT_UI_LANGUAGE]["error_rvc_conversion_failed"].format(e=e))
+    record_audio("rvc", len(converted_audio_rvc), sample_rate_rvc)
+    logger.info(f"RVC conversion successful. Samples: {len(converted_audio_rvc)}, Rate: {sample_rate_rvc}")
+    return (sample_rate_rvc, converted_audio_rvc)
+
+def voice_conversion_fn(input_audio_path, rvc_index_file_name, rvc_pth_file_name, pitch_shift, f0_method=None, index_rate=None, protect=None):
+    T_err = UI_TEXTS[DEFAULT_UI_LANGUAGE]
+    if not input_audio_path or not os.path.exists(input_audio_path): raise gr.Error(T_err["error_rvc_input_audio_invalid"])
+    if not rvc_pth_file_name: raise gr.Error(T_err["error_rvc_pth_missing"])
+    logger.info(f"RVC: Audio='{os.path.basename(str(input_audio_path))}', Index='{rvc_index_file_name}', PTH='{rvc_pth_file_name}', Pitch={pitch_shift}")
+    try:
+        from rvc_python.lib.audio import load_audio
+        with span("audio_decode"): audio_16k = load_audio(str(input_audio_path), RVC_INPUT_SAMPLE_RATE)
+        params = make_rvc_params(pitch_shift, f0_method, index_rate, protect)
+        return convert_rvc_array(audio_16k, rvc_index_file_name, rvc_pth_file_name, params)
+    except Exception as e:
+        if isinstance(e, gr.Error): raise e
+        logger.error(f"Error during RVC conversion: {e}\n{traceback.format_exc()}")
+        raise gr.Error(T_err["error_rvc_conversion_failed"].format(e=e))
+
+def text_to_rvc_cache_key(text, kokoro_voice, speed, lang, rvc_pth_file_name, rvc_index_file_name, params):
+    """Clé de cache Texte -> RVC ; le contenu des fichiers .pth / .index en fait partie (None si le .pth est absent)."""
+    rvc_pth_path, rvc_index_path = rvc_model_key(rvc_pth_file_name, rvc_index_file_name)
+    pth_hash = file_content_hash(rvc_pth_path)
+    if pth_hash is None: return None
+    return synthesis_cache_key(
+        kind="text_to_rvc", text=normalize_text(text), voice=kokoro_voice, speed=float(speed), lang=lang,
+        pth=pth_hash, index=file_content_hash(rvc_index_path), params=params._asdict(), **kokoro_cache_parts(),
+    )
+
+def text_to_rvc_voice_fn(text, rvc_index_file_name, rvc_pth_file_name, pitch_shift, kokoro_voice, speed, lang, f0_method=None, index_rate=None, protect=None):
+    T_err = UI_TEXTS[DEFAULT_UI_LANGUAGE]
+    if not rvc_pth_file_name: raise gr.Error(T_err["error_rvc_pth_missing"])
+    logger.info(f"Pipeline Text -> RVC: Kokoro='{kokoro_voice}', RVC='{rvc_pth_file_name}', Pitch={pitch_shift}, Text='{text[:50]}...'")
+    try:
+        params = make_rvc_params(pitch_shift, f0_method, index_rate, protect)
+        cache_key = text_to_rvc_cache_key(text, kokoro_voice, speed, lang, rvc_pth_file_name, rvc_index_file_name, params)
+        return cached_synthesis(cache_key, lambda: _text_to_rvc_voice(text, rvc_index_file_name, rvc_pth_file_name, params, kokoro_voice, speed, lang))
+    except Exception as e:
+        if not isinstance(e, gr.Error):
+             logger.error(f"Unexpected error in Text to RVC pipeline: {e}\n{traceback.format_exc()}")
+             raise gr.Error(T_err["error_unexpected"].format(e=e))
+        else:
+             raise e
+
+def _text_to_rvc_voice(text, rvc_index_file_name, rvc_pth_file_name, params, kokoro_voice, speed, lang):
+    T_err = UI_TEXTS[DEFAULT_UI_LANGUAGE]
+    pool = get_inference_pool()
+    if pool:
+        # Kokoro + RVC dans le même worker (de préférence celui qui détient déjà ce .pth)
+        if not text or not text.strip(): raise gr.Error(T_err["error_tts_intermediate_failed"])
+        try: rvc_output_audio = pool.text_to_rvc(text, kokoro_voice, speed, lang, rvc_model_key(rvc_pth_file_name, rvc_index_file_name), params)
+        except Exception as e:
+            logger.error(f"Error in inference worker (Text to RVC): {e}\n{traceback.format_exc()}")
+            raise gr.Error(T_err["error_rvc_conversion_failed"].format(e=e))
+        if rvc_output_audio is None: raise gr.Error(T_err["error_tts_intermediate_failed"])
+        logger.info("Pipeline Text -> RVC successful (inference worker).")
+        return rvc_output_audio
+    # Tout reste en mémoire : Kokoro (float32) -> 16 kHz -> RVC, sans WAV intermédiaire
+    logger.info("  Step 1: Generating Kokoro TTS...")
+    sample_rate, samples = synthesize_kokoro_array(text, kokoro_voice, speed, lang)
+    if len(samples) == 0:
+         logger.error("  Critical failure: Kokoro TTS returned no audio.")
+         raise gr.Error(T_err["error_tts_intermediate_failed"])
+    with span("resample"): audio_16k = resample_for_rvc(samples, sample_rate)
+    logger.info(f"  Step 1 successful. {len(samples)} samples at {sample_rate} Hz -> {len(audio_16k)} samples at {RVC_INPUT_SAMPLE_RATE} Hz")
+    logger.info("  Step 2: RVC Conversion...")
+    rvc_output_audio = convert_rvc_array(audio_16k, rvc_index_file_name, rvc_pth_file_name, params)
+    logger.info("  Step 2 successful.")
+    return rvc_output_audio
+
+# --- Fan-out : une synthèse Kokoro convertie vers plusieurs voix RVC ---
+def parse_fanout_targets(targets):
+    """Voix cibles -> [(pth, index ou None, hauteur)].
+
+    `targets` : texte "voix.pth:voix.index:2,autre.pth::-3" (index et hauteur optionnels, une voix
+    par virgule ou par ligne), ou liste de dicts {"pth", "index", "pitch"} (API HTTP).
+    """
+    if isinstance(targets, str):
+        targets = [voice.strip().split(":") for voice in targets.replace("\n", ",").split(",") if voice.strip()]
+    parsed = []
+    for target in targets:
+        if isinstance(target, dict): pth, index, pitch = target.get("pth"), target.get("index"), target.get("pitch")
+        else: pth, index, pitch = (list(target) + [None, None])[:3]
+        if not pth: raise ValueError(f"Fan-out target without .pth: {target}")
+        parsed.append((pth.strip(), (index or "").strip() or None, int(float(pitch or 0))))
+    return parsed
+
+def fanout_file_name(position, target):
+    """Nom du fichier d'une voix dans l'archive : "03_Voix" ou "03_Voix_-2" si transposée."""
+    pth, _, pitch = target
+    return f"{position + 1:02d}_{Path(pth).stem}" + (f"_{pitch:+d}" if pitch else "")
+
+def text_to_rvc_fanout(text, targets, kokoro_voice, speed, lang, f0_method=None, index_rate=None, protect=None):
+    """Un texte converti vers plusieurs voix RVC : produit (sample_rate, audio, nom de fichier) dans l'ordre de fin.
+
+    Kokoro, le passage à 16 kHz et l'empreinte de l'audio sont calculés une fois. Les features HuBERT
+    et le F0 ne sont extraits qu'une fois par processus (cf. rvc_backend) : ensuite, chaque voix ne
+    coûte plus que son générateur. Les conversions tournent en parallèle (FANOUT_PARALLELISM).
+    """
+    T_err = UI_TEXTS[DEFAULT_UI_LANGUAGE]
+    targets = parse_fanout_targets(targets)
+    if not targets: raise gr.Error(T_err["error_rvc_pth_missing"])
+    if len(targets) > FANOUT_MAX_TARGETS: raise gr.Error(T_err["error_fanout_too_many"].format(count=len(targets), max=FANOUT_MAX_TARGETS))
+    # Seuls les fichiers connus du registre : un nom comme "../x.pth" ne sort pas de modelRVC
+    known_pth, known_index = set(MODEL_REGISTRY.pth_files()), set(MODEL_REGISTRY.index_files())
+    for pth, index, _ in targets:
+        if pth not in known_pth: raise gr.Error(T_err["error_pth_not_found"].format(path=pth))
+        if index and index not in known_index: raise gr.Error(T_err["error_pth_not_found"].format(path=index))
+    if not text or not text.strip(): raise gr.Error(T_err["error_tts_intermediate_failed"])
+    logger.info(f"Pipeline Text -> RVC (fan-out): Kokoro='{kokoro_voice}', {len(targets)} RVC voices, Text='{text[:50]}...'")
+    sample_rate, samples = cached_synthesis(tts_cache_key(text, kokoro_voice, speed, lang), lambda: synthesize_kokoro_array(text, kokoro_voice, speed, lang))
+    with span("resample"): audio_16k = resample_for_rvc(samples, sample_rate)
+    audio_key = audio_cache_key(audio_16k)
+
+    def convert(target):
+        pth, index, pitch = target
+        params = make_rvc_params(pitch, f0_method, index_rate, protect)
+        cache_key = text_to_rvc_cache_key(text, kokoro_voice, speed, lang, pth, index, params)
+        return cached_synthesis(cache_key, lambda: convert_rvc_array(audio_16k, index, pth, params, audio_key=audio_key))
+
+    pending = list(enumerate(targets))
+    if get_inference_pool() is None:
+        # La première voix remplit le cache de features / F0 de ce processus avant que les autres ne partent
+        position, target = pending.pop(0)
+        yield (*convert(target), fanout_file_name(position, target))
+    executor = ThreadPoolExecutor(max_workers=max(1, FANOUT_PARALLELISM), thread_name_prefix="fanout")
+    try:
+        futures = {executor.submit(convert, target): position for position, target in pending}
+        for future in as_completed(futures):
+            position = futures[future]
+            yield (*future.result(), fanout_file_name(position, targets[position]))
+    finally:
+        # Requête abandonnée : les voix pas encore commencées ne sont pas calculées
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def text_to_rvc_fanout_fn(text, targets, kokoro_voice, speed, lang, f0_method=None, index_rate=None, protect=None):
+    """Fan-out pour l'UI / l'API Gradio : retourne une archive zip (un WAV par voix)."""
+    T_err = UI_TEXTS[DEFAULT_UI_LANGUAGE]
+    output_path = None
+    try:
+        with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as tmp_file, zipfile.ZipFile(tmp_file, mode="w") as archive:
+            output_path = tmp_file.name
+            for sample_rate, audio, name in text_to_rvc_fanout(text, targets, kokoro_voice, speed, lang, f0_method, index_rate, protect):
+                archive.writestr(f"{name}.wav", wav_bytes(audio, sample_rate))
+        return output_path
+    except Exception as e:
+        if output_path and os.path.exists(output_path):
+            try: os.remove(output_path)
+            except OSError as ose: logger.error(f"Failed to delete temp file {output_path}: {ose}")
+        if isinstance(e, gr.Error): raise e
+        logger.error(f"Unexpected error in Text to RVC fan-out pipeline: {e}\n{traceback.format_exc()}")
+        raise gr.Error(T_err["error_unexpected"].format(e=e))
+
+# --- Documents longs : segments en parallèle, fichier écrit au fil de l'eau (cf. longform.py) ---
+def longform_fn(text, output_format, kokoro_voice, speed, lang, rvc_pth_file_name=None, rvc_index_file_name=None,
+                pitch_shift=0, f0_method=None, index_rate=None, protect=None, progress=gr.Progress()):
+    """Document long -> fichier .wav / .flac / .ogg (Kokoro seul, ou Kokoro + RVC si un .pth est donné).
+
+    Chaque segment passe par SYNTHESIS_CACHE : relancer le même document après un échec
+    ne refait que les segments qui manquent encore au cache.
+    """
+    T_err = UI_TEXTS[DEFAULT_UI_LANGUAGE]
+    if not kokoro_available(): raise gr.Error(T_err["error_kokoro_not_loaded"])
+    suffix = f".{(output_format or 'flac').lower().lstrip('.')}"
+    if suffix not in LONGFORM_FORMATS: raise gr.Error(f"Unsupported output format '{output_format}' (expected: {', '.join(LONGFORM_FORMATS)}).")
+    # Vérifiés avant render_document : un nom inconnu échouerait sinon segment par segment
+    if rvc_pth_file_name and rvc_pth_file_name not in MODEL_REGISTRY.pth_files():
+        raise gr.Error(T_err["error_pth_not_found"].format(path=rvc_pth_file_name))
+    if rvc_pth_file_name and rvc_index_file_name and rvc_index_file_name not in MODEL_REGISTRY.index_files():
+        raise gr.Error(T_err["error_pth_not_found"].format(path=rvc_index_file_name))
+    if rvc_pth_file_name:
+        params = make_rvc_params(pitch_shift, f0_method, index_rate, protect)
+        render = lambda segment: cached_synthesis(
+            text_to_rvc_cache_key(segment, kokoro_voice, speed, lang, rvc_pth_file_name, rvc_index_file_name, params),
+            lambda: _text_to_rvc_voice(segment, rvc_index_file_name, rvc_pth_file_name, params, kokoro_voice, speed, lang))
+    else:
+        render = lambda segment: cached_synthesis(tts_cache_key(segment, kokoro_voice, speed, lang), lambda: synthesize_kokoro_array(segment, kokoro_voice, speed, lang))
+    parallelism = LONGFORM_PARALLELISM or (INFERENCE_WORKERS + 1 if INFERENCE_WORKERS > 0 else 2)
+    logger.info(f"Long-form: Kokoro='{kokoro_voice}', RVC='{rvc_pth_file_name or '-'}', {len(text or '')} characters -> {suffix}")
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp_file: output_path = tmp_file.name
+    try:
+        # gr.Error (modèle introuvable, Kokoro absent...) et ValueError ne se corrigent pas en réessayant
+        render_document(text, render, output_path, parallelism, no_retry=(ValueError, gr.Error),
+                        on_progress=lambda done, total, seconds: progress(done / total, desc=f"{done}/{total} segments, {seconds:.0f}s of audio"))
+        return output_path
+    except Exception as e:
+        if os.path.exists(output_path):
+            try: os.remove(output_path)
+            except OSError as ose: logger.error(f"Failed to delete temp file {output_path}: {ose}")
+        if isinstance(e, gr.Error): raise e
+        if isinstance(e, ValueError): raise gr.Error(str(e))
+        logger.error(f"Error in long-form synthesis: {e}\n{traceback.format_exc()}")
+        raise gr.Error(T_err["error_unexpected"].format(e=e))
+
+# --- Variantes streaming (phrase par phrase) ---
+def synthesize_kokoro_stream(text, voice, speed, lang):
+    """Générateur Kokoro : produit (sample_rate, samples) pour chaque groupe de phrases."""
+    for chunk_text in split_text_for_streaming(text):
+        sample_rate, samples = synthesize_kokoro_array(chunk_text, voice, speed, lang)
+        if len(samples): yield sample_rate, samples
+
+def text_to_speech_stream_fn(text, voice, speed, lang):
+    T_err = UI_TEXTS[DEFAULT_UI_LANGUAGE]
+    if not kokoro_available(): raise gr.Error(T_err["error_kokoro_not_loaded"])
+    if not text or not text.strip(): return
+    logger.info(f"TTS Kokoro (stream): Voice='{voice}', Speed={speed}, Lang='{lang}', Text='{text[:50]}...'")
+    stitcher = None
+    for sample_rate, samples in synthesize_kokoro_stream(text, voice, speed, lang):
+        if stitcher is None: stitcher = CrossfadeStitcher(sample_rate)
+        ready = stitcher.push(samples)
+        if len(ready): yield (sample_rate, ready)
+    if stitcher is not None:
+        tail = stitcher.flush()
+        if len(tail): yield (stitcher.sample_rate, tail)
+
+def text_to_rvc_voice_stream_fn(text, rvc_index_file_name, rvc_pth_file_name, pitch_shift, kokoro_voice, speed, lang, f0_method=None, index_rate=None, protect=None):
+    T_err = UI_TEXTS[DEFAULT_UI_LANGUAGE]
+    if not rvc_pth_file_name: raise gr.Error(T_err["error_rvc_pth_missing"])
+    if not text or not text.strip(): return
+    logger.info(f"Pipeline Text -> RVC (stream): Kokoro='{kokoro_voice}', RVC='{rvc_pth_file_name}', Pitch={pitch_shift}, Text='{text[:50]}...'")
+    params = make_rvc_params(pitch_shift, f0_method, index_rate, protect)
+    convert = lambda audio_16k, audio_key: convert_rvc_array(audio_16k, rvc_index_file_name, rvc_pth_file_name, params, audio_key=audio_key)
+    try:
+        audio_chunks = resample_stream_for_rvc(synthesize_kokoro_stream(text, kokoro_voice, speed, lang))
+        for sample_rate, audio in rvc_stream(convert, audio_chunks):
+            yield (sample_rate, audio)
+    except Exception as e:
+        if not isinstance(e, gr.Error):
+             logger.error(f"Unexpected error in Text to RVC streaming pipeline: {e}\n{traceback.format_exc()}")
+             raise gr.Error(T_err["error_unexpected"].format(e=e))
+        else:
+             raise e
+
+def voice_conversion_stream_fn(audio_16k, rvc_index_file_name, rvc_pth_file_name, pitch_shift, f0_method=None, index_rate=None, protect=None):
+    """Conversion RVC d'un audio 16 kHz tranche par tranche (annulable entre deux tranches)."""
+    T_err = UI_TEXTS[DEFAULT_UI_LANGUAGE]
+    if not rvc_pth_file_name: raise gr.Error(T_err["error_rvc_pth_missing"])
+    if len(audio_16k) == 0: raise gr.Error(T_err["error_rvc_input_audio_invalid"])
+    logger.info(f"RVC (stream): PTH='{rvc_pth_file_name}', Index='{rvc_index_file_name}', Pitch={pitch_shift}, {len(audio_16k) / RVC_INPUT_SAMPLE_RATE:.1f}s")
+    params = make_rvc_params(pitch_shift, f0_method, index_rate, protect)
+    convert = lambda audio, audio_key: convert_rvc_array(audio, rvc_index_file_name, rvc_pth_file_name, params, audio_key=audio_key)
+    yield from rvc_stream(convert, split_audio_for_streaming(audio_16k))
+
+# --- API HTTP asynchrone (cf. http_api.py) : les générateurs de streaming, avec des paramètres nommés ---
+def _http_kokoro_params(params):
+    """Texte, voix, vitesse et langue Kokoro d'une requête HTTP (BadRequest si absents ou mal formés)."""
+    return (get_param(params, "text", kind=str), get_param(params, "voice", "ff_siwis", str),
+            get_param(params, "speed", 1.0, float), get_param(params, "lang", "fr-fr", str))
+
+def _http_rvc_params(params):
+    """Hauteur, méthode F0, index_rate et protect d'une requête HTTP."""
+    f0_method = get_param(params, "f0_method", None, str)
+    if f0_method is not None and f0_method not in F0_METHODS: raise BadRequest(f"Unknown f0_method '{f0_method}' (expected: {', '.join(F0_METHODS)}).")
+    return (get_param(params, "pitch", 0, int), f0_method,
+            get_param(params, "index_rate", None, float), get_param(params, "protect", None, float))
+
+def _http_check_model_file(kind, name):
+    """Seuls les .pth / .index connus de MODEL_REGISTRY sont acceptés (pas de chemin arbitraire)."""
+    known = MODEL_REGISTRY.pth_files() if kind == "pth" else MODEL_REGISTRY.index_files()
+    if name not in known: raise BadRequest(f"Unknown {kind} file: {name!r}")
+    return name
+
+def _http_model_files(params):
+    """.pth (obligatoire) et .index (optionnel) d'une requête HTTP."""
+    index = get_param(params, "index", None, str)
+    return _http_check_model_file("pth", get_param(params, "pth", kind=str)), index and _http_check_model_file("index", index)
+
+def _http_tts(params, body):
+    return text_to_speech_stream_fn(*_http_kokoro_params(params))
+
+def _http_text_to_rvc(params, body):
+    text, voice, speed, lang = _http_kokoro_params(params)
+    pth, index = _http_model_files(params)
+    pitch, f0_method, index_rate, protect = _http_rvc_params(params)
+    return text_to_rvc_voice_stream_fn(text, index, pth, pitch, voice, speed, lang, f0_method, index_rate, protect)
+
+def _http_text_to_rvc_fanout(params, body):
+    text, voice, speed, lang = _http_kokoro_params(params)
+    _, f0_method, index_rate, protect = _http_rvc_params(params)
+    try: targets = parse_fanout_targets(get_param(params, "targets"))
+    except (ValueError, TypeError, AttributeError) as e: raise BadRequest(f"Invalid targets: {e}") from None
+    if len(targets) > FANOUT_MAX_TARGETS: raise BadRequest(f"Too many fan-out voices: {len(targets)} (max {FANOUT_MAX_TARGETS}).")
+    for pth, index, _ in targets:
+        _http_check_model_file("pth", pth)
+        if index: _http_check_model_file("index", index)
+    return text_to_rvc_fanout(text, targets, voice, speed, lang, f0_method, index_rate, protect)
+
+def _http_rvc(params, body):
+    if not body: raise BadRequest("Missing input audio in request body.")
+    pth, index = _http_model_files(params)
+    pitch, f0_method, index_rate, protect = _http_rvc_params(params)
+    try:
+        with span("audio_decode"): audio_16k = decode_audio_for_rvc(body)
+    except ValueError as e: raise BadRequest(f"Could not decode input audio: {e}") from None
+    return voice_conversion_stream_fn(audio_16k, index, pth, pitch, f0_method, index_rate, protect)
+
+HTTP_API_SERVER = None if HTTP_API == "off" or IS_INFERENCE_WORKER else HTTPInferenceAPI({
+    "tts": instrument_stream("http_tts", _http_tts),
+    "rvc": instrument_stream("http_rvc", _http_rvc),
+    "text_to_rvc": instrument_stream("http_text_to_rvc", _http_text_to_rvc),
+    "text_to_rvc_fanout": instrument_stream("http_text_to_rvc_fanout", _http_text_to_rvc_fanout),
+}, client_errors=(gr.Error,), archives=("text_to_rvc_fanout",))
+
+
+# --- Fonction pour mettre à jour l'UI lors du changement de langue ---
+def update_ui_language(selected_lang_code):
+    """Retourne une série de gr.update pour changer les textes de l'UI."""
+    T_update = UI_TEXTS[selected_lang_code]
+    logger.info(f"Updating UI language to: {selected_lang_code.upper()}")
+    return (
+        # Composants Globaux
+        gr.update(value=f"# {T_update['app_title']}"), # app_title_md
+        gr.update(value=T_update["app_description"]), # app_description_md
+        gr.update(value=T_update["refresh_button"]), # refresh_button
+        gr.update(label=T_update["lang_select_label"]), # lang_selector (met à jour son propre label)
+
+        # Tab 1
+        gr.update(label=T_update["tab1_title"]), # tab_tts
+        gr.update(label=T_update["tts_text_input_label"], placeholder=T_update["tts_text_input_placeholder"]), # tts_text_input
+        gr.update(label=T_update["tts_voice_select_label"]), # tts_voice_select
+        gr.update(label=T_update["tts_language_select_label"]), # tts_language_select
+        gr.update(label=T_update["tts_speed_slider_label"]), # tts_speed_slider
+        gr.update(value=T_update["tts_generate_button"]), # tts_generate_button
+        gr.update(label=T_update["tts_output_audio_label"]), # tts_output_audio
+        gr.update(value=T_update["tts_stream_button"]), # tts_stream_button
+        gr.update(label=T_update["tts_stream_output_audio_label"]), # tts_stream_output_audio
+
+        # Tab 2
+        gr.update(label=T_update["tab2_title"]), # tab_rvc
+        gr.update(label=T_update["rvc_input_audio_label"]), # rvc_input_audio
+        gr.update(value=T_update["rvc_input_audio_info"]), # rvc_input_audio_info_md
+        gr.update(label=T_update["rvc_pth_select_label"], info=T_update["rvc_pth_select_info"]), # rvc_pth_select
+        gr.update(label=T_update["rvc_index_select_label"], info=T_update["rvc_index_select_info"]), # rvc_index_select
+        gr.update(label=T_update["rvc_pitch_slider_label"]), # rvc_pitch_shift_slider
+        gr.update(label=T_update["rvc_advanced_label"]), # rvc_advanced_accordion
+        gr.update(label=T_update["rvc_f0_method_label"]), # rvc_f0_method_select
+        gr.update(label=T_update["rvc_index_rate_label"]), # rvc_index_rate_slider
+        gr.update(label=T_update["rvc_protect_label"]), # rvc_protect_slider
+        gr.update(value=T_update["rvc_generate_button"]), # rvc_generate_button
+        gr.update(label=T_update["rvc_output_audio_label"]), # rvc_output_audio
+
+        # Tab 3
+        gr.update(label=T_update["tab3_title"]), # tab_text_to_rvc
+        gr.update(value=T_update["ttrvc_description"]), # ttrvc_description_md
+        gr.update(label=T_update["ttrvc_text_input_label"], placeholder=T_update["ttrvc_text_input_placeholder"]), # ttrvc_text_input
+        gr.update(label=T_update["ttrvc_rvc_pth_select_label"]), # ttrvc_rvc_pth_select
+        gr.update(label=T_update["ttrvc_rvc_index_select_label"]), # ttrvc_rvc_index_select
+        gr.update(label=T_update["ttrvc_pitch_slider_label"]), # ttrvc_pitch_shift_slider
+        gr.update(label=T_update["rvc_advanced_label"]), # ttrvc_advanced_accordion
+        gr.update(label=T_update["rvc_f0_method_label"]), # ttrvc_f0_method_select
+        gr.update(label=T_update["rvc_index_rate_label"]), # ttrvc_index_rate_slider
+        gr.update(label=T_update["rvc_protect_label"]), # ttrvc_protect_slider
+        gr.update(label=T_update["ttrvc_kokoro_voice_label"], info=T_update["ttrvc_kokoro_voice_info"]), # ttrvc_kokoro_voice_select
+        gr.update(label=T_update["ttrvc_language_select_label"]), # ttrvc_language_select
+        gr.update(label=T_update["ttrvc_speed_slider_label"]), # ttrvc_speed_slider
+        gr.update(value=T_update["ttrvc_generate_button"]), # ttrvc_generate_button
+        gr.update(label=T_update["ttrvc_output_audio_label"]), # ttrvc_output_audio
+        gr.update(value=T_update["ttrvc_stream_button"]), # ttrvc_stream_button
+        gr.update(label=T_update["ttrvc_stream_output_audio_label"]), # ttrvc_stream_output_audio
+    )
+
+# --- Interface Gradio (utilise la langue par défaut initialement) ---
+if not IS_INFERENCE_WORKER:
+    T = UI_TEXTS[DEFAULT_UI_LANGUAGE] # Charge les textes initiaux
+    _ui_build_start = time.perf_counter()
+
+    with gr.Blocks(title=T["app_title"]) as demo:
+        # Section Globale (Titre, Description, Sélecteur de Langue, Bouton Refresh)
+        app_title_md = gr.Markdown(f"# {T['app_title']}")
+        app_description_md = gr.Markdown(T["app_description"])
+        with gr.Row():
+            lang_selector = gr.Radio(
+                choices=[("🇬🇧 English", "en"), ("🇫🇷 Français", "fr")],
+                value=DEFAULT_UI_LANGUAGE, # Définit la valeur initiale
+                label=T["lang_select_label"], # Utilise le label initial
+                interactive=True
+            )
+            refresh_button = gr.Button(T["refresh_button"])
+
+        # Définition des Onglets et de leurs composants
+        with gr.Tabs() as tabs:
+            with gr.Tab(T["tab1_title"], id="tab_tts") as tab_tts:
+                with gr.Row():
+                    with gr.Column(scale=2):
+                        tts_text_input = gr.Textbox(lines=4, placeholder=T["tts_text_input_placeholder"], label=T["tts_text_input_label"])
+                    with gr.Column(scale=1):
+                        tts_voice_select = gr.Dropdown(VOICES_KOKORO, label=T["tts_voice_select_label"], value="ff_siwis")
+                        tts_language_select = gr.Dropdown(LANGUAGES_KOKORO_CHOICES, label=T["tts_language_select_label"], value="fr-fr")
+                        tts_speed_slider = gr.Slider(minimum=0.5, maximum=2.0, step=0.1, value=1.0, label=T["tts_speed_slider_label"])
+                tts_generate_button = gr.Button(T["tts_generate_button"], variant="primary")
+                tts_output_audio = gr.Audio(label=T["tts_output_audio_label"])
+                tts_stream_button = gr.Button(T["tts_stream_button"])
+                tts_stream_output_audio = gr.Audio(label=T["tts_stream_output_audio_label"], streaming=True, autoplay=True)
+                tts_output_path_state = gr.State(None)
+
+            with gr.Tab(T["tab2_title"], id="tab_rvc") as tab_rvc:
+                with gr.Row():
+                    with gr.Column(scale=1):
+                        rvc_input_audio = gr.Audio(label=T["rvc_input_audio_label"], sources=["upload", "microphone"], type="filepath")
+                        rvc_input_audio_info_md = gr.Markdown(T["rvc_input_audio_info"]) # Markdown ici
+                    with gr.Column(scale=1):
+                        rvc_pth_select = gr.Dropdown(AVAILABLE_PTH_FILES, label=T["rvc_pth_select_label"], info=T["rvc_pth_select_info"])
+                        rvc_index_select = gr.Dropdown(AVAILABLE_INDEX_FILES, label=T["rvc_index_select_label"], info=T["rvc_index_select_info"])
+                        rvc_pitch_shift_slider = gr.Slider(minimum=-24, maximum=24, step=1, value=0, label=T["rvc_pitch_slider_label"])
+                        with gr.Accordion(T["rvc_advanced_label"], open=False) as rvc_advanced_accordion:
+                            rvc_f0_method_select = gr.Dropdown(F0_METHODS, value=RVCParams().f0_method, label=T["rvc_f0_method_label"])
+                            rvc_index_rate_slider = gr.Slider(minimum=0.0, maximum=1.0, step=0.05, value=RVCParams().index_rate, label=T["rvc_index_rate_label"])
+                            rvc_protect_slider = gr.Slider(minimum=0.0, maximum=0.5, step=0.01, value=RVCParams().protect, label=T["rvc_protect_label"])
+                rvc_generate_button = gr.Button(T["rvc_generate_button"], variant="primary")
+                rvc_output_audio = gr.Audio(label=T["rvc_output_audio_label"])
+
+            with gr.Tab(T["tab3_title"], id="tab_text_to_rvc") as tab_text_to_rvc:
+                ttrvc_description_md = gr.Markdown(T["ttrvc_description"]) # Markdown ici
+                with gr.Row():
+                     with gr.Column(scale=2):
+                        ttrvc_text_input = gr.Textbox(lines=4, placeholder=T["ttrvc_text_input_placeholder"], label=T["ttrvc_text_input_label"])
+                     with gr.Column(scale=1):
+                        ttrvc_rvc_pth_select = gr.Dropdown(AVAILABLE_PTH_FILES, label=T["ttrvc_rvc_pth_select_label"])
+                        ttrvc_rvc_index_select = gr.Dropdown(AVAILABLE_INDEX_FILES, label=T["ttrvc_rvc_index_select_label"])
+                        ttrvc_pitch_shift_slider = gr.Slider(minimum=-24, maximum=24, step=1, value=0, label=T["ttrvc_pitch_slider_label"])
+                        with gr.Accordion(T["rvc_advanced_label"], open=False) as ttrvc_advanced_accordion:
+                            ttrvc_f0_method_select = gr.Dropdown(F0_METHODS, value=RVCParams().f0_method, label=T["rvc_f0_method_label"])
+                            ttrvc_index_rate_slider = gr.Slider(minimum=0.0, maximum=1.0, step=0.05, value=RVCParams().index_rate, label=T["rvc_index_rate_label"])
+                            ttrvc_protect_slider = gr.Slider(minimum=0.0, maximum=0.5, step=0.01, value=RVCParams().protect, label=T["rvc_protect_label"])
+                with gr.Row():
+                     with gr.Column(scale=1):
+                         ttrvc_kokoro_voice_select = gr.Dropdown(VOICES_KOKORO, label=T["ttrvc_kokoro_voice_label"], value="ff_siwis", info=T["ttrvc_kokoro_voice_info"])
+                     with gr.Column(scale=1):
+                         ttrvc_language_select = gr.Dropdown(LANGUAGES_KOKORO_CHOICES, label=T["ttrvc_language_select_label"], value="fr-fr")
+                     with gr.Column(scale=1):
+                        ttrvc_speed_slider = gr.Slider(minimum=0.5, maximum=2.0, step=0.1, value=1.0, label=T["ttrvc_speed_slider_label"])
+                ttrvc_generate_button = gr.Button(T["ttrvc_generate_button"], variant="primary")
+                ttrvc_output_audio = gr.Audio(label=T["ttrvc_output_audio_label"])
+                ttrvc_stream_button = gr.Button(T["ttrvc_stream_button"])
+                ttrvc_stream_output_audio = gr.Audio(label=T["ttrvc_stream_output_audio_label"], streaming=True, autoplay=True)
+
+        # --- Définition des actions des boutons et des changements ---
+
+        # Actions des boutons de génération ; instrument() alimente /metrics et, avec API_RETURN_TIMINGS,
+        # ajoute une sortie JSON cachée avec les durées par étape de la requête
+        timings_output = [gr.JSON(visible=False)] if API_RETURN_TIMINGS else []
+        tts_generate_button.click(fn=instrument("tts", text_to_speech_fn, num_outputs=2, return_timings=API_RETURN_TIMINGS), inputs=[tts_text_input, tts_voice_select, tts_speed_slider, tts_language_select], outputs=[tts_output_audio, tts_output_path_state, *timings_output], api_name="tts")
+        rvc_generate_button.click(fn=instrument("rvc", voice_conversion_fn, return_timings=API_RETURN_TIMINGS), inputs=[rvc_input_audio, rvc_index_select, rvc_pth_select, rvc_pitch_shift_slider, rvc_f0_method_select, rvc_index_rate_slider, rvc_protect_slider], outputs=[rvc_output_audio, *timings_output], api_name="rvc")
+        ttrvc_generate_button.click(fn=instrument("text_to_rvc", text_to_rvc_voice_fn, return_timings=API_RETURN_TIMINGS), inputs=[ttrvc_text_input, ttrvc_rvc_index_select, ttrvc_rvc_pth_select, ttrvc_pitch_shift_slider, ttrvc_kokoro_voice_select, ttrvc_speed_slider, ttrvc_language_select, ttrvc_f0_method_select, ttrvc_index_rate_slider, ttrvc_protect_slider], outputs=[ttrvc_output_audio, *timings_output], api_name="text_to_rvc")
+
+        # Variantes streaming (générateurs) : l'audio est diffusé phrase par phrase
+        tts_stream_button.click(fn=instrument_stream("tts_stream", text_to_speech_stream_fn), inputs=[tts_text_input, tts_voice_select, tts_speed_slider, tts_language_select], outputs=tts_stream_output_audio, api_name="tts_stream")
+        ttrvc_stream_button.click(fn=instrument_stream("text_to_rvc_stream", text_to_rvc_voice_stream_fn), inputs=[ttrvc_text_input, ttrvc_rvc_index_select, ttrvc_rvc_pth_select, ttrvc_pitch_shift_slider, ttrvc_kokoro_voice_select, ttrvc_speed_slider, ttrvc_language_select, ttrvc_f0_method_select, ttrvc_index_rate_slider, ttrvc_protect_slider], outputs=ttrvc_stream_output_audio, api_name="text_to_rvc_stream")
+
+        # Endpoint API "phonèmes en entrée" (sans composant visible), cf. kokoro_frontend.py
+        with gr.Row(visible=False):
+            api_phonemes_input = gr.Textbox()
+            api_phonemes_button = gr.Button()
+        api_phonemes_button.click(fn=instrument("tts_phonemes", text_to_speech_phonemes_fn, return_timings=API_RETURN_TIMINGS), inputs=[api_phonemes_input, tts_voice_select, tts_speed_slider], outputs=[tts_output_audio, *timings_output], api_name="tts_phonemes")
+
+        # Endpoint API fan-out "un texte, plusieurs voix RVC" (sans composant visible) : archive zip en sortie
+        with gr.Row(visible=False):
+            api_fanout_targets_input = gr.Textbox()
+            api_fanout_button = gr.Button()
+            api_fanout_output = gr.File()
+        api_fanout_button.click(fn=instrument("text_to_rvc_fanout", text_to_rvc_fanout_fn, return_timings=API_RETURN_TIMINGS), inputs=[ttrvc_text_input, api_fanout_targets_input, ttrvc_kokoro_voice_select, ttrvc_speed_slider, ttrvc_language_select, ttrvc_f0_method_select, ttrvc_index_rate_slider, ttrvc_protect_slider], outputs=[api_fanout_output, *timings_output], api_name="text_to_rvc_fanout")
+
+        # Endpoint API documents longs (sans composant visible) : fichier audio en sortie, progression par segment
+        with gr.Row(visible=False):
+            api_longform_format_input = gr.Textbox(value="flac")
+            api_longform_pth_input = gr.Textbox()
+            api_longform_index_input = gr.Textbox()
+            api_longform_button = gr.Button()
+            api_longform_output = gr.File()
+        api_longform_button.click(fn=instrument("longform", longform_fn, return_timings=API_RETURN_TIMINGS), inputs=[ttrvc_text_input, api_longform_format_input, ttrvc_kokoro_voice_select, ttrvc_speed_slider, ttrvc_language_select, api_longform_pth_input, api_longform_index_input, ttrvc_pitch_shift_slider, ttrvc_f0_method_select, ttrvc_index_rate_slider, ttrvc_protect_slider], outputs=[api_longform_output, *timings_output], api_name="longform")
+
+        # Endpoint API de supervision (sans composant d'UI)
+        gr.api(rvc_cache_stats_fn, api_name="rvc_cache_stats")
+        gr.api(rvc_backend_stats_fn, api_name="rvc_backend_stats")
+        gr.api(inference_pool_stats_fn, api_name="inference_pool_stats")
+        gr.api(tts_scheduler_stats_fn, api_name="tts_scheduler_stats")
+        gr.api(synthesis_cache_stats_fn, api_name="synthesis_cache_stats")
+        gr.api(kokoro_frontend_stats_fn, api_name="kokoro_frontend_stats")
+        gr.api(phonemize_fn, api_name="phonemize")
+        gr.api(model_registry_stats_fn, api_name="model_registry_stats")
+        gr.api(readiness_fn, api_name="readiness", concurrency_limit=None) # hors file d'attente : répond pendant le chargement
+
+        # Lien entre sortie TTS et entrée RVC (inchangé)
+        tts_output_path_state.change(fn=lambda x: x, inputs=tts_output_path_state, outputs=rvc_input_audio)
+
+        # Action du bouton Refresh (met à jour seulement les listes RVC des onglets 2 et 3)
+        refresh_button.click(
+            fn=refresh_models_list,
+            inputs=None,
+            outputs=[
+                rvc_pth_select,         # Tab 2 PTH
+                rvc_index_select,       # Tab 2 Index
+                ttrvc_rvc_pth_select,   # Tab 3 PTH
+                ttrvc_rvc_index_select  # Tab 3 Index
+            ]
+        )
+        # Choisir un .pth présélectionne son .index apparié
+        rvc_pth_select.change(fn=paired_index_update, inputs=rvc_pth_select, outputs=rvc_index_select, show_progress="hidden")
+        ttrvc_rvc_pth_select.change(fn=paired_index_update, inputs=ttrvc_rvc_pth_select, outputs=ttrvc_rvc_index_select, show_progress="hidden")
+        # Les modèles ajoutés / supprimés dans modelRVC/ apparaissent sans cliquer sur Refresh
+        if MODEL_WATCH != "off":
+            model_lists_version = gr.State(MODEL_REGISTRY.version)
+            gr.Timer(MODEL_WATCH_UI_SECONDS).tick(
+                fn=model_lists_tick, inputs=model_lists_version,
+                outputs=[rvc_pth_select, rvc_index_select, ttrvc_rvc_pth_select, ttrvc_rvc_index_select, model_lists_version],
+                concurrency_limit=None, show_progress="hidden",
+            )
+
+        # ----> ACTION POUR CHANGER LA LANGUE DE L'INTERFACE <----
+        # Liste de TOUS les composants dont le texte doit être mis à jour
+        # L'ordre DOIT correspondre à l'ordre des gr.update() retournés par update_ui_language
+        components_to_update = [
+            # Globaux
+            app_title_md, app_description_md, refresh_button, lang_selector,
+            # Tab 1
+            tab_tts, tts_text_input, tts_voice_select, tts_language_select, tts_speed_slider,
+            tts_generate_button, tts_output_audio, tts_stream_button, tts_stream_output_audio,
+            # Tab 2
+            tab_rvc, rvc_input_audio, rvc_input_audio_info_md, rvc_pth_select, rvc_index_select,
+            rvc_pitch_shift_slider, rvc_advanced_accordion, rvc_f0_method_select, rvc_index_rate_slider, rvc_protect_slider,
+            rvc_generate_button, rvc_output_audio,
+            # Tab 3
+            tab_text_to_rvc, ttrvc_description_md, ttrvc_text_input, ttrvc_rvc_pth_select,
+            ttrvc_rvc_index_select, ttrvc_pitch_shift_slider, ttrvc_advanced_accordion, ttrvc_f0_method_select,
+            ttrvc_index_rate_slider, ttrvc_protect_slider, ttrvc_kokoro_voice_select,
+            ttrvc_language_select, ttrvc_speed_slider, ttrvc_generate_button, ttrvc_output_audio,
+            ttrvc_stream_button, ttrvc_stream_output_audio,
+        ]
+        lang_selector.change(
+            fn=update_ui_language,
+            inputs=lang_selector,
+            outputs=components_to_update # La liste complète des composants
+        )
+
+    # Compteurs des caches / workers exposés sur /metrics (lus au moment du scrape, sans créer les backends)
+    register_stats("rvc_cache", RVC_CACHE.stats)
+    register_stats("rvc_backend", rvc_backend_stats)
+    register_stats("synthesis_cache", lambda: SYNTHESIS_CACHE.stats() if SYNTHESIS_CACHE else {})
+    register_stats("tts_scheduler", lambda: TTS_SCHEDULER.stats() if TTS_SCHEDULER else {})
+    register_stats("inference_pool", lambda: INFERENCE_POOL.stats() if INFERENCE_POOL else {})
+    register_stats("kokoro_phonemes", kokoro_frontend_stats_fn)
+    register_stats("model_registry", MODEL_REGISTRY.stats)
+    register_stats("http_api", lambda: HTTP_API_SERVER.stats() if HTTP_API_SERVER else {})
+    register_collector(kokoro_session_metrics)
+
+# --- Lancement de l'application ---
+def print_startup_warnings():
+    # Utilise les textes de la langue par défaut pour les messages console initiaux
+    T_console = UI_TEXTS[DEFAULT_UI_LANGUAGE]
+    if KOKORO_STATE == "failed":
+        print("\n" + "="*50)
+        print(T_console["warn_kokoro_failed"])
+        print(T_console["warn_kokoro_paths"])
+        print(T_console["warn_tts_disabled"])
+        print("="*50 + "\n")
+    elif not AVAILABLE_PTH_FILES:
+         print("\n" + "="*50)
+         print(T_console["warn_rvc_pth_none_found"])
+         print(T_console["warn_rvc_pth_location"].format(path=RVC_PTH_DIR))
+         print(T_console["warn_rvc_disabled"])
+         print("="*50 + "\n")
+
+if __name__ == "__main__":
+    record_startup_timing("ui_build", _ui_build_start)
+    # Seulement dans le processus principal (les workers réimportent ce module)
+    MODEL_REGISTRY.start(MODEL_WATCH)
+    if STARTUP_MODE == "background":
+        # Le serveur se lance tout de suite ; readiness_fn répond "warming" jusqu'à la fin du chargement
+        threading.Thread(target=warm_up_models, name="warmup", daemon=True).start()
+    elif STARTUP_MODE == "eager":
+        warm_up_models()
+    else:
+        WARMUP_DONE.set()
+    logger.info(f"Startup timings (s): {STARTUP_TIMINGS}")
+    # /metrics (format Prometheus) et l'API /v1 sont servis par la même app que l'UI, hors file d'attente Gradio
+    routes = (HTTP_API_SERVER.routes() if HTTP_API_SERVER else []) + [metrics_route()]
+    if HTTP_API == "only":
+        import uvicorn
+        from starlette.applications import Starlette
+        print("Starting HTTP inference API only (/v1, no Gradio UI)...")
+        uvicorn.run(Starlette(routes=routes), port=7860)
+    else:
+        print(f"Starting Gradio Interface in {DEFAULT_UI_LANGUAGE.upper()} (configurable in UI)...")
+        demo.queue(default_concurrency_limit=APP_CONCURRENCY_LIMIT)
+        demo.launch(share=False, server_port=7860, app_kwargs={"routes": routes})
\ No newline at end of file
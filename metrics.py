@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""Instrumentation légère : spans de durée par étape, compteurs et histogrammes au format Prometheus.
+
+- `span("kokoro")` mesure un bloc : histogramme `kokoro_rvc_stage_seconds{stage=...}`,
+  erreurs comptées par type, et durée ajoutée à la trace de la requête en cours ;
+- `request_trace("tts")` ouvre la trace d'une requête (contextvars) ; `instrument()` l'applique
+  à une fonction d'endpoint et peut renvoyer le détail des durées avec la réponse ;
+- `render_prometheus()` produit le texte servi sur /metrics.
+
+Coût par span : deux perf_counter, un bisect et une prise de verrou, sans allocation
+notable ; l'instrumentation peut rester active en production.
+"""
+import bisect
+import contextvars
+import functools
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = "kokoro_rvc"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 4)
+
+_lock = threading.Lock()
+_metrics = {}     # nom -> métrique, dans l'ordre d'enregistrement
+_collectors = []  # fonctions appelées à chaque rendu : [(nom, type, aide, {labels: valeur})]
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (list(extra.items()) if extra else [])
+    if not pairs: return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name, self.help, self.labelnames = f"{PREFIX}_{name}", help_text, tuple(labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1.0):
+        with _lock: self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = f"{PREFIX}_{name}", help_text, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [compte par bucket..., +Inf], somme
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            series = self._series.get(labels)
+            if series is None: series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = list(itertools.accumulate(counts))
+            for bound, count in zip(self.buckets + (float("inf"),), cumulative):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, {'le': _format_value(bound)})} {int(count)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {int(cumulative[-1])}")
+        return lines
+
+
+def counter(name, help_text, labelnames=()):
+    return _metrics.setdefault(name, Counter(name, help_text, labelnames))
+
+
+def histogram(name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+    return _metrics.setdefault(name, Histogram(name, help_text, labelnames, buckets))
+
+
+def register_collector(fn):
+    """fn() -> [(nom, "gauge"|"counter", aide, {tuple de paires (label, valeur): valeur})], appelée à chaque rendu."""
+    _collectors.append(fn)
+    return fn
+
+
+def register_stats(prefix, stats_fn):
+    """Expose les champs numériques d'un dict stats() en jauges `<prefix>_<champ>` (listes : un label `worker` par élément)."""
+    def collect():
+        try: stats = stats_fn() or {}
+        except Exception: return []
+        families = []
+        for key, value in stats.items():
+            if isinstance(value, (list, tuple)): samples = {(("worker", str(i)),): v for i, v in enumerate(value) if _is_number(v)}
+            else: samples = {(): value} if _is_number(value) else {}
+            if samples: families.append((f"{prefix}_{key}", "gauge", f"{key} from {prefix} stats().", samples))
+        return families
+    return register_collector(collect)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+STAGE_SECONDS = histogram("stage_seconds", "Duration of each processing stage.", ("stage",))
+STAGE_ERRORS = counter("stage_errors_total", "Errors raised inside a stage, by exception type.", ("stage", "type"))
+REQUESTS = counter("requests_total", "Requests handled, by endpoint and outcome.", ("endpoint", "outcome"))
+REQUEST_SECONDS = histogram("request_seconds", "End-to-end request duration.", ("endpoint",))
+REQUEST_ERRORS = counter("request_errors_total", "Failed requests, by endpoint and exception type.", ("endpoint", "type"))
+SAMPLES = counter("samples_generated_total", "Audio samples produced, by stage.", ("stage",))
+AUDIO_SECONDS = counter("audio_seconds_generated_total", "Seconds of audio produced, by stage.", ("stage",))
+REALTIME_FACTOR = histogram("realtime_factor", "Processing time divided by audio duration, per request.", ("endpoint",), RTF_BUCKETS)
+FIRST_AUDIO_SECONDS = histogram("time_to_first_audio_seconds", "Delay before the first streamed chunk.", ("endpoint",))
+
+
+# --- Traces par requête ---
+_current_trace = contextvars.ContextVar("kokoro_rvc_trace", default=None)
+
+
+class RequestTrace:
+    """Durées cumulées par étape pour une requête."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def as_dict(self):
+        return {"endpoint": self.endpoint, "total_ms": round((time.perf_counter() - self.start) * 1000, 2),
+                "stages_ms": {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()}}
+
+
+@contextmanager
+def request_trace(endpoint):
+    trace = RequestTrace(endpoint)
+    token = _current_trace.set(trace)
+    try: yield trace
+    finally: _current_trace.reset(token)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def record_stage(stage, seconds):
+    """Enregistre une durée mesurée ailleurs (ex. temps internes du pipeline RVC, worker d'inférence)."""
+    STAGE_SECONDS.observe(seconds, stage)
+    trace = _current_trace.get()
+    if trace is not None: trace.add(stage, seconds)
+
+
+@contextmanager
+def span(stage):
+    """Mesure la durée d'un bloc sous le nom `stage` (erreurs comptées par type d'exception)."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        STAGE_ERRORS.inc(stage, type(e).__name__)
+        raise
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def record_audio(stage, num_samples, sample_rate):
+    SAMPLES.inc(stage, amount=num_samples)
+    if sample_rate: AUDIO_SECONDS.inc(stage, amount=num_samples / sample_rate)
+
+
+def _audio_seconds(value):
+    """Durée d'un résultat (sample_rate, audio), ou 0 si ce n'en est pas un."""
+    if isinstance(value, tuple) and len(value) == 2 and isinstance(value[0], int) and hasattr(value[1], "__len__"):
+        return len(value[1]) / value[0] if value[0] else 0.0
+    return 0.0
+
+
+def instrument(endpoint, fn, num_outputs=1, return_timings=False):
+    """Enveloppe une fonction d'endpoint : compteurs, durée, RTF et (option) détail des durées en sortie supplémentaire."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with request_trace(endpoint) as trace:
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                REQUESTS.inc(endpoint, "error"); REQUEST_ERRORS.inc(endpoint, type(e).__name__)
+                raise
+            elapsed = time.perf_counter() - trace.start
+        REQUESTS.inc(endpoint, "ok")
+        REQUEST_SECONDS.observe(elapsed, endpoint)
+        audio_seconds = _audio_seconds(result[0] if num_outputs > 1 else result)
+        if audio_seconds: REALTIME_FACTOR.observe(elapsed / audio_seconds, endpoint)
+        if not return_timings: return result
+        return (*result, trace.as_dict()) if num_outputs > 1 else (result, trace.as_dict())
+    return wrapper
+
+
+def instrument_stream(endpoint, fn):
+    """Variante pour les générateurs (streaming) : durée totale et délai avant le premier morceau."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start, first = time.perf_counter(), True
+        try:
+            for chunk in fn(*args, **kwargs):
+                if first: FIRST_AUDIO_SECONDS.observe(time.perf_counter() - start, endpoint); first = False
+                yield chunk
+        except GeneratorExit:
+            REQUESTS.inc(endpoint, "cancelled")  # client parti avant la fin du flux
+            raise
+        except BaseException as e:
+            REQUESTS.inc(endpoint, "error"); REQUEST_ERRORS.inc(endpoint, type(e).__name__)
+            raise
+        REQUESTS.inc(endpoint, "ok")
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint)
+    return wrapper
+
+
+# --- Exposition ---
+def render_prometheus():
+    """Texte au format d'exposition Prometheus 0.0.4."""
+    with _lock:
+        lines = [line for metric in _metrics.values() for line in metric.render()]
+    for collect in _collectors:
+        for name, kind, help_text, samples in collect():
+            full_name = f"{PREFIX}_{name}"
+            lines += [f"# HELP {full_name} {help_text}", f"# TYPE {full_name} {kind}"]
+            for labels, value in samples.items():
+                lines.append(f"{full_name}{_format_labels([k for k, _ in labels], [v for _, v in labels])} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_route(path="/metrics"):
+    """Route Starlette servant render_prometheus(), à passer à la création de l'app web."""
+    from starlette.responses import PlainTextResponse
+    from starlette.routing import Route
+    async def endpoint(request):
+        return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+    return Route(path, endpoint, methods=["GET"])
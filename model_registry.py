@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""Registre incrémental des modèles RVC (modelRVC/pth et modelRVC/index).
+
+- un scan complet (os.scandir) au démarrage, puis seulement des mises à jour fichier par
+  fichier : inotify sous Linux, sinon comparaison périodique taille / mtime (polling) ;
+- chaque fichier est suivi par (taille, mtime_ns) ; son hash de contenu est calculé à la
+  demande (content_hash) ou, une fois la surveillance démarrée, par un thread de basse
+  priorité, puis gardé tant que (taille, mtime_ns) ne changent pas : un fichier dont le hash
+  est connu et qui n'est que "touché" (même contenu) n'est pas signalé comme modifié ;
+- les listes triées sont tenues à jour par insertion (bisect) : pas de tri complet par
+  événement, même avec des milliers de modèles ;
+- appariement .pth <-> .index par nom de voix ("added_IVF256_Flat_nprobe_1_Voix_v2.index"
+  va avec "Voix.pth" ou "Voix_e200_s4000.pth").
+
+on_change(changes) reçoit une liste de (type, nom, événement) avec type "pth" | "index" et
+événement "added" | "modified" | "removed".
+"""
+import bisect
+import collections
+import ctypes
+import ctypes.util
+import logging
+import os
+import re
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+
+from result_cache import file_content_hash
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 2.0  # s, mode polling
+DEBOUNCE_SECONDS = 0.3       # regroupe les événements d'une copie de fichier en un seul changement
+SUFFIXES = {"pth": ".pth", "index": ".index"}
+
+_IN_CLOSE_WRITE, _IN_MOVED_FROM, _IN_MOVED_TO = 0x8, 0x40, 0x80
+_IN_DELETE, _IN_DELETE_SELF, _IN_MOVE_SELF = 0x200, 0x400, 0x800
+_IN_Q_OVERFLOW, _IN_IGNORED, _IN_NONBLOCK, _IN_CLOEXEC = 0x4000, 0x8000, 0o4000, 0o2000000
+_WATCH_MASK = _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def voice_key(file_name):
+    """Nom de voix normalisé d'un .pth ou d'un .index, pour l'appariement."""
+    stem = Path(file_name).stem
+    stem = re.sub(r"^(added|trained)_", "", stem, flags=re.I)
+    stem = re.sub(r"IVF\d+_Flat_nprobe_\d+_?", "", stem, flags=re.I)
+    stem = re.sub(r"(_e\d+)?(_s\d+)?$", "", stem)
+    stem = re.sub(r"_v[12]$", "", stem, flags=re.I)
+    return stem.strip("_- ").lower()
+
+
+class _Inotify:
+    """inotify via ctypes (Linux) : pas de dépendance supplémentaire."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0: raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}  # wd -> type ("pth" / "index")
+
+    def add(self, path, kind):
+        wd = self._add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0: raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self.watches[wd] = kind
+
+    def read(self, timeout):
+        """Événements disponibles : [(type, nom de fichier, masque)] ; type None = il faut tout rescanner."""
+        if not select.select([self.fd], [], [], timeout)[0]: return []
+        try: data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError: return []
+        events, offset = [], 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += _EVENT_HEADER.size + length
+            if mask & (_IN_Q_OVERFLOW | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_IGNORED): events.append((None, None, mask))
+            elif wd in self.watches: events.append((self.watches[wd], os.fsdecode(name), mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ModelRegistry:
+    """Fichiers .pth / .index connus, tenus à jour incrémentalement (cf. docstring du module)."""
+
+    def __init__(self, pth_dir, index_dir, on_change=None, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.dirs = {"pth": Path(pth_dir), "index": Path(index_dir)}
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.mode = "off"
+        self._lock = threading.Lock()
+        self._files = {"pth": {}, "index": {}}   # nom -> [taille, mtime_ns, hash ou None]
+        self._sorted = {"pth": [], "index": []}
+        self._index_by_voice = {}                 # clé de voix -> liste triée de .index
+        self._version = 0
+        self._events = self._scans = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._hash_queue = collections.deque()   # (type, nom) dont le hash de référence reste à calculer
+        self._hash_wakeup = threading.Event()
+        self._hasher = None
+
+    # --- Lecture ---
+    @property
+    def version(self):
+        """Incrémenté à chaque changement des listes (l'UI ne se met à jour que s'il a bougé)."""
+        return self._version
+
+    def pth_files(self):
+        with self._lock: return list(self._sorted["pth"])
+
+    def index_files(self):
+        with self._lock: return list(self._sorted["index"])
+
+    def path(self, kind, name):
+        return self.dirs[kind] / name
+
+    def paired_index(self, pth_name):
+        """.index apparié à un .pth (nom de voix identique), ou None."""
+        with self._lock:
+            candidates = self._index_by_voice.get(voice_key(pth_name))
+            return candidates[0] if candidates else None
+
+    def content_hash(self, kind, name):
+        """Hash du contenu (calculé à la demande puis gardé tant que taille et mtime ne changent pas)."""
+        with self._lock:
+            entry = self._files[kind].get(name)
+            if entry is None: return None
+            if entry[2] is not None: return entry[2]
+        digest = file_content_hash(self.path(kind, name))
+        with self._lock:
+            if self._files[kind].get(name) is entry: entry[2] = digest
+        return digest
+
+    def stats(self):
+        with self._lock:
+            return {"mode": self.mode, "pth_files": len(self._files["pth"]), "index_files": len(self._files["index"]),
+                    "paired_voices": sum(1 for name in self._files["pth"] if voice_key(name) in self._index_by_voice),
+                    "version": self._version, "events": self._events, "full_scans": self._scans}
+
+    # --- Mise à jour ---
+    def _stat(self, kind, name):
+        if not name.endswith(SUFFIXES[kind]): return None
+        try: st = os.stat(self.path(kind, name))
+        except OSError: return None
+        return (st.st_size, st.st_mtime_ns)
+
+    def _update_locked(self, kind, name, signature):
+        """Applique l'état observé d'un fichier : (événement ou None, hash connu avant une modification)."""
+        files, entry = self._files[kind], self._files[kind].get(name)
+        if signature is None:
+            if entry is None: return None, None
+            del files[name]
+            names = self._sorted[kind]
+            del names[bisect.bisect_left(names, name)]
+            if kind == "index":
+                voices = self._index_by_voice[voice_key(name)]
+                voices.remove(name)
+                if not voices: del self._index_by_voice[voice_key(name)]
+            return "removed", None
+        if entry is None:
+            files[name] = [*signature, None]
+            bisect.insort(self._sorted[kind], name)
+            if kind == "index": bisect.insort(self._index_by_voice.setdefault(voice_key(name), []), name)
+            return "added", None
+        if tuple(entry[:2]) == signature: return None, None
+        old_hash = entry[2]
+        entry[:] = [*signature, None]
+        return "modified", old_hash
+
+    def _apply(self, observed):
+        """observed : [(type, nom)] à revérifier sur le disque ; notifie on_change des différences."""
+        with self._lock:
+            updates = [(kind, name, *self._update_locked(kind, name, self._stat(kind, name))) for kind, name in dict.fromkeys(observed)]
+        changes = []
+        for kind, name, event, old_hash in updates:
+            if event is None: continue
+            if old_hash is not None:
+                new_hash = file_content_hash(self.path(kind, name))
+                with self._lock:
+                    entry = self._files[kind].get(name)
+                    if entry is not None and entry[2] is None: entry[2] = new_hash
+                # Fichier simplement "touché" (même contenu) : les modèles chargés restent valides
+                if new_hash == old_hash: continue
+            changes.append((kind, name, event))
+        with self._lock:
+            if any(event != "modified" for _, _, event in changes): self._version += 1
+            self._events += len(changes)
+        if changes:
+            logger.info(f"RVC model files changed: {', '.join(f'{event} {name}' for _, name, event in changes)}")
+            if self.on_change:
+                try: self.on_change(changes)
+                except Exception as e: logger.error(f"Error while handling model file changes: {e}", exc_info=True)
+        if self._hasher is not None: self._queue_hashes([(kind, name) for kind, name, event in changes if event != "removed"])
+        return changes
+
+    def scan(self):
+        """Scan complet des deux dossiers (démarrage, Refresh sans surveillance, débordement inotify)."""
+        observed = []
+        for kind, directory in self.dirs.items():
+            directory.mkdir(parents=True, exist_ok=True)
+            with os.scandir(directory) as entries:
+                on_disk = {entry.name for entry in entries if entry.name.endswith(SUFFIXES[kind])}
+            with self._lock: known = set(self._files[kind])
+            observed += [(kind, name) for name in on_disk | known]
+        with self._lock: self._scans += 1
+        return self._apply(observed)
+
+    # --- Surveillance ---
+    def start(self, mode="auto"):
+        """Démarre la surveillance : "inotify", "poll", "auto" (inotify puis polling) ou "off"."""
+        if mode == "off" or self._thread is not None: return
+        watcher = None
+        if mode in ("auto", "inotify"):
+            try:
+                watcher = _Inotify()
+                for kind, directory in self.dirs.items(): watcher.add(directory, kind)
+            except (OSError, AttributeError) as e:
+                if watcher is not None: watcher.close()
+                watcher = None
+                logger.warning(f"inotify unavailable ({e}); watching model folders by polling every {self.poll_interval}s.")
+        self.mode = "inotify" if watcher else "poll"
+        target = (lambda: self._inotify_loop(watcher)) if watcher else self._poll_loop
+        self._thread = threading.Thread(target=target, name="model-registry", daemon=True)
+        self._thread.start()
+        # Hash de référence des fichiers déjà connus (scan de démarrage), hors du chemin des requêtes
+        self._hasher = threading.Thread(target=self._hash_loop, name="model-hasher", daemon=True)
+        self._hasher.start()
+        with self._lock: known = [(kind, name) for kind in self._files for name in self._files[kind]]
+        self._queue_hashes(known)
+
+    def stop(self):
+        self._stop.set()
+        self._hash_wakeup.set()
+        for thread in (self._thread, self._hasher):
+            if thread is not None: thread.join()
+
+    def _queue_hashes(self, files):
+        with self._lock: self._hash_queue.extend(files)
+        self._hash_wakeup.set()
+
+    def _hash_loop(self):
+        try: os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)  # Linux : ce thread seulement
+        except (AttributeError, OSError): pass
+        while not self._stop.is_set():
+            self._hash_wakeup.clear()
+            while not self._stop.is_set():
+                with self._lock: item = self._hash_queue.popleft() if self._hash_queue else None
+                if item is None: break
+                self.content_hash(*item)
+            self._hash_wakeup.wait()
+
+    def _inotify_loop(self, watcher):
+        try:
+            while not self._stop.is_set():
+                events = watcher.read(1.0)
+                if not events: continue
+                # Une copie produit plusieurs événements : on attend la fin de la rafale
+                deadline = time.monotonic() + DEBOUNCE_SECONDS
+                while time.monotonic() < deadline: events += watcher.read(max(0.0, deadline - time.monotonic()))
+                if any(kind is None for kind, _, _ in events): self.scan()
+                else: self._apply([(kind, name) for kind, name, _ in events])
+                if any(kind is None and mask & ~_IN_Q_OVERFLOW for kind, _, mask in events):
+                    break  # dossier surveillé supprimé ou déplacé : la surveillance inotify est perdue
+        finally:
+            watcher.close()
+        if not self._stop.is_set():
+            logger.warning("Model folder watch lost; falling back to polling.")
+            self.mode = "poll"
+            self._poll_loop()
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try: self.scan()
+            except OSError as e: logger.warning(f"Model folder poll failed: {e}")
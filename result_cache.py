@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""Cache adressé par contenu des résultats de synthèse (TTS et Texte -> RVC).
+
+Deux niveaux :
+- mémoire : LRU borné en octets, audio NumPy tel quel ;
+- disque (optionnel) : un fichier FLAC 16 bits par entrée quand les échantillons sont des
+  multiples de 1/32768 (sortie RVC), sinon un WAV dans le type d'origine (float32...) ;
+  le type NumPy est restauré à la lecture : un hit disque rend exactement le même audio
+  qu'un hit mémoire. LRU borné en octets.
+La clé est un hash des paramètres de synthèse, qui inclut le hash du contenu des
+fichiers .pth / .index : si un modèle change sur le disque, sa clé change et les
+anciennes entrées ne sont plus jamais servies (elles finissent évincées).
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+logger = logging.getLogger(__name__)
+
+_HASH_CHUNK_BYTES = 1 << 20
+_file_hashes = {}  # chemin -> ((taille, mtime_ns), sha1)
+_file_hashes_lock = threading.Lock()
+_PCM16_SCALE = 32768.0
+# Type NumPy -> sous-type WAV sans perte, pour l'audio non représentable en PCM 16 bits
+_WAV_SUBTYPES = {"float32": "FLOAT", "float64": "DOUBLE", "int16": "PCM_16", "int32": "PCM_32"}
+_WAV_DTYPES = {subtype: dtype for dtype, subtype in _WAV_SUBTYPES.items()}
+
+
+def file_content_hash(path):
+    """SHA-1 du contenu d'un fichier, recalculé seulement si sa taille ou sa date change."""
+    if not path: return None
+    path = str(path)
+    try: st = os.stat(path)
+    except OSError: return None
+    signature = (st.st_size, st.st_mtime_ns)
+    with _file_hashes_lock:
+        cached = _file_hashes.get(path)
+        if cached and cached[0] == signature: return cached[1]
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_CHUNK_BYTES), b""): digest.update(block)
+    with _file_hashes_lock: _file_hashes[path] = (signature, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def _is_pcm16(audio):
+    """Vrai si l'audio tient sans perte dans du PCM 16 bits (entiers int16 ou flottants k / 32768)."""
+    if audio.dtype == np.int16: return True
+    if audio.dtype.name not in ("float32", "float64"): return False
+    scaled = audio * _PCM16_SCALE  # exact : multiplication par une puissance de 2
+    return bool(np.all(scaled == np.round(scaled)) and scaled.min() >= -32768 and scaled.max() <= 32767)
+
+
+def normalize_text(text):
+    """Forme canonique du texte pour la clé : Unicode NFC, espaces fusionnés."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text or "")).strip()
+
+
+def synthesis_cache_key(**parts):
+    """Hash stable d'un ensemble de paramètres de synthèse (valeurs JSON-sérialisables)."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SynthesisCache:
+    """Cache LRU (mémoire + disque FLAC / WAV optionnel) de résultats (sample_rate, audio)."""
+
+    def __init__(self, max_memory_bytes, disk_dir=None, max_disk_bytes=0):
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (sample_rate, audio)
+        self._memory_bytes = 0
+        self._disk = OrderedDict()    # key -> taille du fichier, du moins au plus récent
+        self._disk_bytes = 0
+        self._memory_hits = self._disk_hits = self._misses = self._puts = 0
+        self._memory_evictions = self._disk_evictions = self._disk_errors = 0
+        if self.disk_dir: self._scan_disk()
+
+    # --- Disque ---
+    def _disk_paths(self, key):
+        """(FLAC, WAV) : une entrée n'existe que sous l'une des deux formes."""
+        return self.disk_dir / key[:2] / f"{key}.flac", self.disk_dir / key[:2] / f"{key}.wav"
+
+    def _scan_disk(self):
+        self.disk_dir.mkdir(parents=True, exist_ok=True)
+        files = []
+        for path in (*self.disk_dir.glob("*/*.flac"), *self.disk_dir.glob("*/*.wav")):
+            try: st = path.stat()
+            except OSError: continue
+            files.append((st.st_mtime, path.stem, st.st_size))
+        for _, key, size in sorted(files):
+            self._disk[key] = size
+            self._disk_bytes += size
+        logger.info(f"Synthesis disk cache: {len(self._disk)} entries, {self._disk_bytes / 1e6:.1f} MB in {self.disk_dir}")
+        with self._lock: evicted = self._evict_disk_locked()
+        self._remove_files(evicted)
+
+    def _evict_disk_locked(self):
+        evicted = []
+        while self.max_disk_bytes and self._disk_bytes > self.max_disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self._disk_evictions += 1
+            evicted.append(key)
+        return evicted
+
+    def _remove_files(self, keys):
+        for key in keys:
+            for path in self._disk_paths(key):
+                try: path.unlink()
+                except FileNotFoundError: pass
+                except OSError as e: logger.warning(f"Could not remove cached audio {key}: {e}")
+
+    def _read_disk(self, key):
+        flac_path, wav_path = self._disk_paths(key)
+        path = flac_path if flac_path.exists() else wav_path
+        try:
+            with sf.SoundFile(path) as f:
+                # FLAC : type d'origine dans le commentaire ; WAV : déduit du sous-type
+                dtype = (f.comment or "float32") if f.format == "FLAC" else _WAV_DTYPES.get(f.subtype, "float32")
+                audio, sample_rate = f.read(dtype=dtype), f.samplerate
+            os.utime(path)  # l'ordre LRU survit au redémarrage
+            return sample_rate, audio
+        except Exception as e:
+            logger.warning(f"Dropping unreadable cached audio {path}: {e}")
+            with self._lock:
+                size = self._disk.pop(key, None)
+                if size is not None: self._disk_bytes -= size
+                self._disk_errors += 1
+            self._remove_files([key])
+            return None
+
+    def _write_disk(self, key, sample_rate, audio):
+        flac_path, wav_path = self._disk_paths(key)
+        if _is_pcm16(audio):
+            path, stale, format, subtype = flac_path, wav_path, "FLAC", "PCM_16"
+        else:
+            path, stale, format = wav_path, flac_path, "WAV"
+            subtype = _WAV_SUBTYPES.get(audio.dtype.name)
+            if subtype is None: audio, subtype = audio.astype(np.float32), "FLOAT"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=path.suffix, dir=path.parent)
+        try:
+            channels = 1 if audio.ndim == 1 else audio.shape[1]
+            with os.fdopen(fd, "wb") as raw, sf.SoundFile(raw, "w", sample_rate, channels, subtype, format=format) as f:
+                if format == "FLAC": f.comment = audio.dtype.name  # relu par _read_disk
+                f.write(audio)
+            os.replace(tmp_path, path)
+            try: stale.unlink()
+            except FileNotFoundError: pass
+        except Exception as e:
+            logger.warning(f"Could not write cached audio {path}: {e}")
+            try: os.remove(tmp_path)
+            except OSError: pass
+            with self._lock: self._disk_errors += 1
+            return
+        size = path.stat().st_size
+        with self._lock:
+            self._disk_bytes += size - self._disk.pop(key, 0)
+            self._disk[key] = size
+            evicted = self._evict_disk_locked()
+        self._remove_files(evicted)
+
+    # --- Mémoire ---
+    def _put_memory_locked(self, key, value):
+        size = value[1].nbytes
+        if self.max_memory_bytes and size > self.max_memory_bytes: return
+        old = self._memory.pop(key, None)
+        if old is not None: self._memory_bytes -= old[1].nbytes
+        self._memory[key] = value
+        self._memory_bytes += size
+        while self.max_memory_bytes and self._memory_bytes > self.max_memory_bytes:
+            _, (_, audio) = self._memory.popitem(last=False)
+            self._memory_bytes -= audio.nbytes
+            self._memory_evictions += 1
+
+    # --- API ---
+    def get(self, key):
+        """Retourne (sample_rate, audio) ou None ; un hit disque est remonté en mémoire."""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self._memory_hits += 1
+                return value
+            on_disk = key in self._disk
+            if on_disk: self._disk.move_to_end(key)
+        if on_disk:
+            value = self._read_disk(key)
+            if value is not None:
+                with self._lock:
+                    self._disk_hits += 1
+                    self._put_memory_locked(key, value)
+                return value
+        with self._lock: self._misses += 1
+        return None
+
+    def put(self, key, sample_rate, audio):
+        audio = np.asarray(audio)
+        if len(audio) == 0: return
+        with self._lock:
+            self._puts += 1
+            self._put_memory_locked(key, (sample_rate, audio))
+        if self.disk_dir: self._write_disk(key, sample_rate, audio)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear(); self._memory_bytes = 0
+            keys = list(self._disk); self._disk.clear(); self._disk_bytes = 0
+        self._remove_files(keys)
+
+    def stats(self):
+        """Compteurs de supervision : hits par niveau, misses, occupation, évictions."""
+        with self._lock:
+            lookups = self._memory_hits + self._disk_hits + self._misses
+            return {
+                "memory_entries": len(self._memory), "memory_bytes": self._memory_bytes, "max_memory_bytes": self.max_memory_bytes,
+                "disk_entries": len(self._disk), "disk_bytes": self._disk_bytes, "max_disk_bytes": self.max_disk_bytes,
+                "memory_hits": self._memory_hits, "disk_hits": self._disk_hits, "misses": self._misses,
+                "hit_rate": (self._memory_hits + self._disk_hits) / lookups if lookups else 0.0,
+                "puts": self._puts, "memory_evictions": self._memory_evictions,
+                "disk_evictions": self._disk_evictions, "disk_errors": self._disk_errors,
+            }
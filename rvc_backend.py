@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""Chemin d'inférence RVC optimisé pour le CPU : HuBERT partagé, cache de features, générateur TorchScript.
+
+- rvc_python charge un encodeur HuBERT par RVCInference : ici un seul HuBERT par processus
+  (et par device / précision) sert tous les modèles RVC en cache ;
+- cache optionnel des features HuBERT et du F0 (RVC_FEATURE_CACHE_MB), indexé par l'empreinte
+  de l'audio d'entrée : convertir la même sortie TTS vers plusieurs voix ne les calcule qu'une
+  fois (ni HuBERT ni l'extraction du F0 ne dépendent de la voix ; la transposition est refaite
+  pour chaque voix) ;
+- sur CPU, le générateur est compilé en TorchScript au chargement (RVC_CPU_BACKEND=torchscript) ;
+  sa sortie est comparée à celle du modèle eager sur une entrée de test, et toute erreur
+  (compilation, écart, échec à l'exécution) fait repasser ce modèle en PyTorch eager.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import record_stage
+
+logger = logging.getLogger(__name__)
+
+# "torchscript" (défaut) ou "eager" pour le générateur RVC sur CPU
+RVC_CPU_BACKEND = os.environ.get("RVC_CPU_BACKEND", "torchscript").lower()
+# Budget du cache de features HuBERT / F0 par processus (Mo, 0 = désactivé)
+RVC_FEATURE_CACHE_MB = int(os.environ.get("RVC_FEATURE_CACHE_MB", "64"))
+CHECK_FRAMES = 200  # longueur (trames de features) de l'entrée de test du générateur compilé
+# Bornes de Pipeline.get_f0 (rvc_python) pour quantifier le F0 en 255 pas sur l'échelle mel
+F0_MEL_MIN, F0_MEL_MAX = 1127 * np.log(1 + 50 / 700), 1127 * np.log(1 + 1100 / 700)
+
+_lock = threading.Lock()
+_huberts = {}  # (device, demi-précision) -> SharedHubert
+_counters = {"compiled_generators": 0, "generator_fallbacks": 0}
+
+
+def _nbytes(value):
+    return value.nbytes if isinstance(value, np.ndarray) else value.element_size() * value.nelement()
+
+
+class FeatureCache:
+    """LRU thread-safe empreinte d'audio -> features HuBERT (tenseurs CPU) ou F0 (numpy), borné en octets."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._hits = self._misses = 0
+
+    def get(self, key):
+        with self._lock:
+            features = self._entries.get(key)
+            if features is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return features
+
+    def put(self, key, features):
+        size = _nbytes(features)
+        if size > self.max_bytes: return
+        with self._lock:
+            if key in self._entries: return
+            self._entries[key] = features
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= _nbytes(evicted)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {"feature_cache_entries": len(self._entries), "feature_cache_bytes": self._bytes,
+                    "feature_cache_max_bytes": self.max_bytes, "feature_cache_hits": self._hits,
+                    "feature_cache_misses": self._misses, "feature_cache_hit_rate": self._hits / lookups if lookups else 0.0}
+
+
+FEATURE_CACHE = FeatureCache(RVC_FEATURE_CACHE_MB * 1024 * 1024) if RVC_FEATURE_CACHE_MB > 0 else None
+
+
+class SharedHubert:
+    """HuBERT unique du processus, avec la même interface pour le pipeline rvc_python."""
+    shared = True  # cf. rvc_cache.estimate_rvc_model_bytes : hors budget de chaque modèle RVC
+
+    def __init__(self, model, cache=None):
+        self.model = model
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def extract_features(self, source, padding_mask=None, output_layer=None, **kwargs):
+        if self.cache is None: return self.model.extract_features(source=source, padding_mask=padding_mask, output_layer=output_layer, **kwargs)
+        key = (hashlib.sha1(source.detach().cpu().numpy().tobytes()).hexdigest(), output_layer, str(source.dtype))
+        features = self.cache.get(key)
+        if features is not None: return features.to(source.device).clone(), padding_mask
+        result = self.model.extract_features(source=source, padding_mask=padding_mask, output_layer=output_layer, **kwargs)
+        self.cache.put(key, result[0].detach().cpu().clone())
+        return result
+
+
+def shared_hubert(config, load):
+    """HuBERT partagé pour ce device / cette précision ; `load()` ne sert qu'au premier appel."""
+    key = (str(config.device), bool(config.is_half))
+    with _lock:
+        hubert = _huberts.get(key)
+        if hubert is None:
+            start = time.perf_counter()
+            hubert = _huberts[key] = SharedHubert(load(), FEATURE_CACHE)
+            record_stage("hubert_load", time.perf_counter() - start)
+            logger.info(f"Shared HuBERT loaded on {key[0]} in {time.perf_counter() - start:.2f}s")
+    return hubert
+
+
+def _transpose_f0(f0, f0_up_key):
+    """Fin de Pipeline.get_f0 : transposition, puis F0 grossier (1..255, échelle mel) pour le générateur."""
+    f0 = f0 * pow(2, f0_up_key / 12)
+    f0_mel = 1127 * np.log(1 + f0 / 700)
+    f0_mel[f0_mel > 0] = (f0_mel[f0_mel > 0] - F0_MEL_MIN) * 254 / (F0_MEL_MAX - F0_MEL_MIN) + 1
+    f0_mel[f0_mel <= 1] = 1
+    f0_mel[f0_mel > 255] = 255
+    return np.rint(f0_mel).astype(np.int32), f0
+
+
+def install_f0_cache():
+    """Branche le cache de F0 sur Pipeline.get_f0 de rvc_python (idempotent) : F0 extrait sans
+    transposition une fois par audio, puis transposé pour chaque voix."""
+    from rvc_python.modules.vc.pipeline import Pipeline
+    with _lock:
+        if FEATURE_CACHE is None or getattr(Pipeline.get_f0, "cached", False): return
+        extract = Pipeline.get_f0
+        def get_f0(self, input_audio_path, x, p_len, f0_up_key, f0_method, filter_radius, inp_f0=None):
+            if inp_f0 is not None: return extract(self, input_audio_path, x, p_len, f0_up_key, f0_method, filter_radius, inp_f0)
+            key = ("f0", hashlib.sha1(np.ascontiguousarray(x).tobytes()).hexdigest(), p_len, f0_method, filter_radius)
+            f0 = FEATURE_CACHE.get(key)
+            if f0 is None:
+                f0 = extract(self, input_audio_path, x, p_len, 0, f0_method, filter_radius)[1]
+                FEATURE_CACHE.put(key, f0.copy())
+            return _transpose_f0(f0, f0_up_key)
+        get_f0.cached = True
+        Pipeline.get_f0 = get_f0
+
+
+class ScriptedGenerator:
+    """Générateur RVC compilé TorchScript ; repasse définitivement en eager à la première erreur."""
+
+    def __init__(self, eager, scripted):
+        self.eager = eager
+        self.scripted = scripted
+
+    def __getattr__(self, name):
+        return getattr(self.eager, name)
+
+    def infer(self, *args):
+        scripted = self.scripted
+        if scripted is not None:
+            try: return scripted.infer(*args)
+            except Exception as e:
+                logger.warning(f"TorchScript RVC generator failed ({e}); falling back to eager PyTorch for this model.")
+                self.scripted = None
+                with _lock: _counters["generator_fallbacks"] += 1
+        return self.eager.infer(*args)
+
+
+def _check_generator(eager, scripted, if_f0):
+    """Compare les deux générateurs sur une entrée aléatoire, avec le même bruit (graine fixée localement)."""
+    import torch
+    frames = CHECK_FRAMES
+    features = torch.randn(1, frames, eager.enc_p.emb_phone.in_features) * 0.1
+    lengths, sid = torch.tensor([frames]).long(), torch.tensor([0]).long()
+    if if_f0: args = (features, lengths, torch.randint(1, 255, (1, frames)), torch.rand(1, frames) * 300 + 100, sid)
+    else: args = (features, lengths, sid)
+    outputs = []
+    for module in (eager, scripted):
+        with torch.random.fork_rng(), torch.no_grad():
+            torch.manual_seed(0)
+            outputs.append(module.infer(*args)[0].float())
+    diff, peak = (outputs[0] - outputs[1]).abs().max().item(), outputs[0].abs().max().item()
+    if diff > 1e-3 * max(peak, 1e-3): raise RuntimeError(f"TorchScript output differs from eager (max diff {diff:.2e})")
+
+
+def compile_generator(net_g, if_f0, device):
+    """Générateur à utiliser pour l'inférence : TorchScript sur CPU si possible, sinon le module eager."""
+    if RVC_CPU_BACKEND != "torchscript" or str(device) != "cpu": return net_g
+    import torch
+    start = time.perf_counter()
+    try:
+        # Le hook de weight norm n'est pas scriptable ; le retirer ne change pas la sortie
+        try: net_g.remove_weight_norm()
+        except (AttributeError, ValueError): pass
+        scripted = torch.jit.script(net_g.eval())
+        if not hasattr(scripted, "infer"): raise RuntimeError("infer() is not exported by the scripted module")
+        _check_generator(net_g, scripted, if_f0)
+    except Exception as e:
+        logger.warning(f"RVC generator could not be compiled with TorchScript ({e}); using eager PyTorch.")
+        with _lock: _counters["generator_fallbacks"] += 1
+        return net_g
+    record_stage("rvc_generator_compile", time.perf_counter() - start)
+    with _lock: _counters["compiled_generators"] += 1
+    logger.info(f"RVC generator compiled with TorchScript in {time.perf_counter() - start:.2f}s")
+    return ScriptedGenerator(net_g, scripted)
+
+
+def stats():
+    """Générateurs compilés / repassés en eager, HuBERT chargés et compteurs du cache de features."""
+    with _lock:
+        result = dict(_counters, backend=RVC_CPU_BACKEND, hubert_models=len(_huberts))
+    if FEATURE_CACHE is not None: result.update(FEATURE_CACHE.stats())
+    return result
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""Cache borné et thread-safe des modèles RVC (éviction LRU, budget mémoire, épinglage)."""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_rvc_model_bytes(rvc, index_path=None):
+    """Estime la mémoire d'un RVCInference : poids torch (générateur, HuBERT s'il lui est propre) + fichier index."""
+    total = 0
+    vc = getattr(rvc, "vc", None)
+    for module in (getattr(vc, "net_g", None), getattr(vc, "hubert_model", None)):
+        # HuBERT partagé (cf. rvc_backend) : chargé une fois par processus, hors budget de chaque modèle
+        if module is None or getattr(module, "shared", False): continue
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            total += tensor.numel() * tensor.element_size()
+    shared_index = getattr(rvc, "shared_index", None)
+    if shared_index is not None:
+        # Les parties projetées en mmap sont partagées entre processus : hors budget de ce cache
+        if not shared_index.mapped: total += os.path.getsize(shared_index.path)
+        if not shared_index.vectors_mapped: total += shared_index.vectors.nbytes
+    elif index_path and os.path.exists(index_path):
+        total += os.path.getsize(index_path)
+    return total
+
+
+class ModelCache:
+    """Cache LRU de modèles, borné en nombre et en octets.
+
+    - chargement "single-flight" : deux premières requêtes simultanées sur la même clé
+      ne chargent le modèle qu'une fois, la seconde attend le résultat de la première ;
+    - les entrées épinglées (pin) ne sont jamais évincées ;
+    - une invalidation pendant un chargement en cours n'est pas perdue : le modèle chargé est
+      rendu aux appelants déjà en attente mais n'entre pas dans le cache ;
+    - compteurs hits / misses / evictions exposés par stats().
+    """
+
+    def __init__(self, max_models=None, max_bytes=None, size_fn=None, on_evict=None):
+        self.max_models = max_models  # None ou 0 = pas de limite
+        self.max_bytes = max_bytes
+        self._size_fn = size_fn or (lambda key, value: 0)
+        self._on_evict = on_evict
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, size), ordre = du moins au plus récent
+        self._inflight = {}            # key -> Future pendant le chargement
+        self._generations = {}         # key -> nombre d'invalidations (détecte celles faites pendant un chargement)
+        self._pinned = set()
+        self._bytes = 0
+        self._hits = self._misses = self._evictions = self._loads = self._load_failures = self._coalesced = 0
+
+    def get_or_load(self, key, loader):
+        """Retourne le modèle en cache ou le charge via loader() (un seul chargement par clé)."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return self._entries[key][0]
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = Future()
+                generation = self._generations.get(key, 0)
+                is_owner = True
+                self._misses += 1
+            else:
+                is_owner = False
+                self._coalesced += 1
+        if not is_owner:
+            logger.info(f"Waiting for in-flight load of RVC model: {key}")
+            return future.result()
+        try:
+            value = loader()
+            size = self._size_fn(key, value)
+        except BaseException as e:
+            with self._lock:
+                if self._inflight.get(key) is future: del self._inflight[key]
+                self._load_failures += 1
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._loads += 1
+            if self._inflight.get(key) is future: del self._inflight[key]
+            if self._generations.get(key, 0) != generation:
+                # Invalidé pendant le chargement : le fichier a pu changer, ce modèle ne doit pas être servi ensuite
+                logger.info(f"RVC model invalidated while loading, not cached: {key}")
+                evicted = []
+            else:
+                self._entries[key] = (value, size)
+                self._bytes += size
+                evicted = self._evict_locked(keep=key)
+        future.set_result(value)
+        self._notify_evicted(evicted)
+        return value
+
+    def get(self, key):
+        """Retourne le modèle en cache sans le charger (None si absent)."""
+        with self._lock:
+            if key not in self._entries: return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return self._entries[key][0]
+
+    def __contains__(self, key):
+        with self._lock: return key in self._entries
+
+    def __len__(self):
+        with self._lock: return len(self._entries)
+
+    def keys(self):
+        with self._lock: return list(self._entries.keys())
+
+    def pin(self, key):
+        """Épingle une clé (voix "chaude") : elle ne sera plus évincée, même si elle n'est pas encore chargée."""
+        with self._lock: self._pinned.add(key)
+
+    def unpin(self, key):
+        with self._lock:
+            self._pinned.discard(key)
+            evicted = self._evict_locked()
+        self._notify_evicted(evicted)
+
+    def invalidate(self, key):
+        """Retire une entrée du cache (épinglée ou non), par ex. quand le fichier du modèle change.
+
+        Un chargement en cours pour cette clé ne sera pas mis en cache ; les requêtes suivantes rechargent.
+        """
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._inflight.pop(key, None)
+            entry = self._entries.pop(key, None)
+            if entry is not None: self._bytes -= entry[1]
+        if entry is not None: self._notify_evicted([(key, entry[0])])
+        return entry is not None
+
+    def clear(self):
+        with self._lock:
+            evicted = [(key, value) for key, (value, _) in self._entries.items()]
+            self._entries.clear(); self._bytes = 0
+        self._notify_evicted(evicted)
+
+    def stats(self):
+        """Compteurs de supervision du cache."""
+        with self._lock:
+            return {
+                "entries": len(self._entries), "bytes": self._bytes,
+                "max_models": self.max_models, "max_bytes": self.max_bytes,
+                "pinned": len(self._pinned), "loading": len(self._inflight),
+                "hits": self._hits, "misses": self._misses, "coalesced": self._coalesced,
+                "loads": self._loads, "load_failures": self._load_failures, "evictions": self._evictions,
+            }
+
+    def _over_budget_locked(self):
+        if self.max_models and len(self._entries) > self.max_models: return True
+        if self.max_bytes and self._bytes > self.max_bytes: return True
+        return False
+
+    def _evict_locked(self, keep=None):
+        evicted = []
+        for key in list(self._entries.keys()):  # du moins récemment utilisé au plus récent
+            if not self._over_budget_locked(): break
+            if key in self._pinned or key == keep: continue
+            value, size = self._entries.pop(key)
+            self._bytes -= size
+            self._evictions += 1
+            evicted.append((key, value))
+        if self._over_budget_locked():
+            logger.warning(f"RVC model cache over budget with only pinned/recent entries left: {len(self._entries)} models, {self._bytes} bytes")
+        return evicted
+
+    def _notify_evicted(self, evicted):
+        for key, value in evicted:
+            logger.info(f"Evicted RVC model from cache: {key}")
+            if self._on_evict:
+                try: self._on_evict(key, value)
+                except Exception as e: logger.error(f"Error while releasing evicted model {key}: {e}", exc_info=True)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""Index de recherche RVC (.index faiss) ouverts une fois par processus, en mmap quand c'est possible.
+
+rvc_python relit le .index (faiss.read_index) et en reconstruit tous les vecteurs
+(reconstruct_n) à chaque conversion, y compris pour chaque morceau en streaming, et chaque
+worker d'inférence en garde ses propres copies. Ici :
+- open_rvc_index() garde l'index ouvert tant qu'un modèle RVC chargé le référence ;
+- les vecteurs (big_npy) sont lus depuis `<fichier>.index.vectors.npy` en mmap, en lecture
+  seule : les pages sont partagées entre tous les workers par le cache du système ;
+- l'index faiss lui-même est ouvert en mmap si faiss le permet. faiss 1.7.3 (requirements.txt)
+  n'a que IO_FLAG_MMAP, qui ne projette que les listes inversées des index IVF (le cas des
+  .index RVC, y compris la variante SQ8) ; un index Flat reste lu en mémoire. Les versions
+  plus récentes (IO_FLAG_MMAP_IFC) projettent aussi les index Flat ;
+- variante compacte optionnelle (RVC_INDEX_COMPACT=1) : `<fichier>.index.sq8` (IVF-SQ8,
+  environ 4x plus petit) et vecteurs float16, au prix d'une recherche approchée un peu moins fine.
+
+Les fichiers annexes s'écrivent à côté des originaux avec :
+    python rvc_index.py modelRVC/index/*.index [--compact]
+Un fichier annexe plus ancien que son .index est ignoré (l'original est relu).
+"""
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+import weakref
+
+import numpy as np
+
+from metrics import record_stage
+
+logger = logging.getLogger(__name__)
+
+# Utiliser les fichiers annexes mmap (1) ou toujours relire l'original (0)
+RVC_INDEX_MMAP = os.environ.get("RVC_INDEX_MMAP", "1").lower() in ("1", "true", "yes")
+# Préférer la variante compacte (SQ8 + float16) quand elle existe
+RVC_INDEX_COMPACT = os.environ.get("RVC_INDEX_COMPACT", "0").lower() in ("1", "true", "yes")
+
+_open_indexes = weakref.WeakValueDictionary()  # (chemin, mtime_ns, compact) -> RVCIndex
+_open_lock = threading.Lock()
+_hook_lock = threading.Lock()
+
+
+def vectors_path(index_path, compact=False):
+    return f"{index_path}.vectors16.npy" if compact else f"{index_path}.vectors.npy"
+
+
+def compact_index_path(index_path):
+    return f"{index_path}.sq8"
+
+
+def _fresh(sidecar, source):
+    """Le fichier annexe existe et n'est pas plus ancien que le .index d'origine."""
+    try: return os.stat(sidecar).st_mtime_ns >= os.stat(source).st_mtime_ns
+    except OSError: return False
+
+
+class RVCIndex:
+    """Index faiss + vecteurs, avec l'interface utilisée par rvc_python (ntotal, search, reconstruct_n)."""
+
+    def __init__(self, path, mmap=RVC_INDEX_MMAP, compact=RVC_INDEX_COMPACT):
+        import faiss
+        self.path = str(path)
+        use_compact = mmap and compact and _fresh(compact_index_path(path), path)
+        index_path = compact_index_path(path) if use_compact else self.path
+        mmap_ifc = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        flag = (mmap_ifc or getattr(faiss, "IO_FLAG_MMAP", 0)) if mmap else 0
+        self.index = None
+        if flag:
+            try: self.index = faiss.read_index(index_path, flag)
+            except RuntimeError: pass  # type d'index non projetable
+        # IO_FLAG_MMAP seul ne projette que les listes inversées : un index sans invlists est en mémoire
+        self.mapped = self.index is not None and (flag == mmap_ifc or hasattr(self.index, "invlists"))
+        if self.index is None: self.index = faiss.read_index(index_path)
+        vectors = None
+        for candidate in ([vectors_path(path, compact=True)] if use_compact else []) + [vectors_path(path)]:
+            if mmap and _fresh(candidate, path):
+                vectors = np.load(candidate, mmap_mode="r")
+                break
+        # Sans fichier annexe : même reconstruction que rvc_python, mais une seule fois par processus
+        self.vectors = vectors if vectors is not None else self.index.reconstruct_n(0, self.index.ntotal)
+        self.vectors_mapped = vectors is not None
+        self.ntotal = self.index.ntotal
+
+    def search(self, x, k):
+        return self.index.search(x, k)
+
+    def reconstruct_n(self, i0, n):
+        return self.vectors[i0:i0 + n]
+
+
+def open_rvc_index(path):
+    """RVCIndex partagé pour ce chemin ; rouvert si le fichier change, libéré quand plus personne ne le référence."""
+    path = str(path)
+    key = (path, os.stat(path).st_mtime_ns, RVC_INDEX_COMPACT)
+    with _open_lock:
+        index = _open_indexes.get(key)
+        if index is None:
+            start = time.perf_counter()
+            index = _open_indexes[key] = RVCIndex(path)
+            record_stage("rvc_index_load", time.perf_counter() - start)
+            logger.info(f"RVC index opened: {os.path.basename(path)} ({index.ntotal} vectors, "
+                        f"{'mmap' if index.vectors_mapped else 'in memory'}) in {time.perf_counter() - start:.2f}s")
+    return index
+
+
+class _FaissReadHook:
+    """Remplace le module faiss vu par le pipeline rvc_python : read_index passe par open_rvc_index."""
+
+    def __init__(self, faiss):
+        self._faiss = faiss
+
+    def __getattr__(self, name):
+        return getattr(self._faiss, name)
+
+    def read_index(self, path, *args):
+        return open_rvc_index(path)
+
+
+def install_index_hook():
+    """Branche open_rvc_index dans rvc_python (idempotent)."""
+    from rvc_python.modules.vc import pipeline
+    with _hook_lock:
+        if not isinstance(pipeline.faiss, _FaissReadHook): pipeline.faiss = _FaissReadHook(pipeline.faiss)
+
+
+# ==================================================
+#           CONVERSION DES .index EXISTANTS
+# ==================================================
+def _save_atomic(path, write):
+    fd, tmp_path = tempfile.mkstemp(suffix=".part", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "wb") as f: write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+
+def convert_index(path, compact=False):
+    """Écrit les fichiers annexes mmap d'un .index ; retourne la liste des fichiers écrits."""
+    import faiss
+    index = faiss.read_index(str(path))
+    vectors = np.ascontiguousarray(index.reconstruct_n(0, index.ntotal), dtype=np.float32)
+    written = [vectors_path(path)]
+    _save_atomic(written[-1], lambda f: np.save(f, vectors))
+    if compact:
+        written.append(vectors_path(path, compact=True))
+        _save_atomic(written[-1], lambda f: np.save(f, vectors.astype(np.float16)))
+        try: ivf = faiss.extract_index_ivf(index)
+        except RuntimeError: ivf = None
+        if ivf is not None:
+            # Même quantificateur grossier (déjà entraîné) : seul l'encodage SQ8 est appris
+            sq8 = faiss.IndexIVFScalarQuantizer(ivf.quantizer, ivf.d, ivf.nlist, faiss.ScalarQuantizer.QT_8bit, ivf.metric_type)
+            sq8.nprobe = ivf.nprobe
+        else:
+            sq8 = faiss.IndexScalarQuantizer(index.d, faiss.ScalarQuantizer.QT_8bit, index.metric_type)
+        sq8.train(vectors)
+        sq8.add(vectors)
+        written.append(compact_index_path(path))
+        _save_atomic(written[-1], lambda f: faiss.write_index(sq8, faiss.PyCallbackIOWriter(f.write)))
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Écrit à côté de chaque .index RVC ses fichiers annexes mmap.")
+    parser.add_argument("indexes", nargs="+", help="Fichiers .index (ex. modelRVC/index/*.index)")
+    parser.add_argument("--compact", action="store_true", help="Ajoute la variante SQ8 + vecteurs float16 (RVC_INDEX_COMPACT=1)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    import faiss
+    for path in args.indexes:
+        start = time.perf_counter()
+        written = convert_index(path, compact=args.compact)
+        sizes = ", ".join(f"{os.path.basename(p)} {os.path.getsize(p) / 1e6:.1f} MB" for p in written)
+        logger.info(f"{os.path.basename(path)} ({os.path.getsize(path) / 1e6:.1f} MB) -> {sizes} in {time.perf_counter() - start:.1f}s")
+        # Ce que paie rvc_python à chaque conversion, contre l'ouverture via les fichiers annexes
+        start = time.perf_counter(); original = faiss.read_index(path); original.reconstruct_n(0, original.ntotal)
+        reread = time.perf_counter() - start
+        start = time.perf_counter(); RVCIndex(path, compact=args.compact)
+        logger.info(f"  load: read_index + reconstruct_n {reread * 1000:.0f} ms, mmap {(time.perf_counter() - start) * 1000:.0f} ms")
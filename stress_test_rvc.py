@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Test de charge : conversions RVC parallèles sur UN modèle partagé, avec des réglages différents.
+
+Le modèle est chargé comme en production (load_rvc_inference : hook d'index, cache de F0 /
+features, générateur compilé). Chaque requête porte ses propres RVCParams (hauteur, index_rate,
+protect) et chaque sortie parallèle doit être identique, échantillon par échantillon
+(np.array_equal), à la référence calculée en série pour le même réglage : la moindre fuite de
+paramètre entre requêtes change la sortie.
+
+Le générateur RVC tire du bruit aléatoire : pour ce test, il est seedé à partir de ses entrées
+(SeededGenerator), ce qui rend chaque conversion reproductible quel que soit l'ordre d'exécution.
+
+Exemple :
+    python stress_test_rvc.py modelRVC/pth/voix.pth --index modelRVC/index/voix.index --workers 8
+"""
+import argparse
+import itertools
+import logging
+import random
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from rvc_python.lib.audio import load_audio
+
+from audio_pipeline import RVC_INPUT_SAMPLE_RATE, RVCParams, load_rvc_inference, rvc_infer_array
+
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def synthetic_voice(seconds=3.0, f0=180.0, sample_rate=RVC_INPUT_SAMPLE_RATE):
+    """Signal harmonique avec vibrato, suffisant pour que RVC produise un F0 mesurable."""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    inst_f0 = f0 * (1 + 0.03 * np.sin(2 * np.pi * 5 * t))
+    phase = 2 * np.pi * np.cumsum(inst_f0) / sample_rate
+    audio = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 1.5 * t) ** 2
+    return (0.3 * audio * envelope / np.abs(audio).max()).astype(np.float32)
+
+
+class SeededGenerator:
+    """Générateur dont le bruit est tiré d'une graine dérivée de ses entrées (sortie reproductible).
+
+    Seul l'appel au générateur est sérialisé ; HuBERT, l'index, le F0 et les paramètres restent concurrents.
+    """
+
+    def __init__(self, generator):
+        self.generator = generator
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.generator, name)
+
+    def infer(self, *args):
+        seed = zlib.crc32(b"".join(a.detach().cpu().numpy().tobytes() for a in args if torch.is_tensor(a)))
+        with self._lock, torch.random.fork_rng():
+            torch.manual_seed(seed)
+            return self.generator.infer(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pth", help="Modèle RVC (.pth)")
+    parser.add_argument("--index", default=None, help="Fichier .index (optionnel)")
+    parser.add_argument("--input", default=None, help="Audio d'entrée (sinon signal synthétique)")
+    parser.add_argument("--pitches", default="-12,-5,0,7,12", help="Décalages testés (demi-tons)")
+    parser.add_argument("--index-rates", default="0.0,0.75", help="Valeurs d'index_rate testées")
+    parser.add_argument("--protects", default="0.33,0.5", help="Valeurs de protect testées")
+    parser.add_argument("--f0-method", default="harvest")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=2, help="Requêtes par réglage")
+    args = parser.parse_args()
+
+    device = "cuda:0" if torch.cuda.is_available() else "cpu"
+    rvc = load_rvc_inference(args.pth, args.index, device)
+    rvc.vc.net_g = SeededGenerator(rvc.vc.net_g)
+    audio = load_audio(args.input, RVC_INPUT_SAMPLE_RATE) if args.input else synthetic_voice()
+    settings = [RVCParams(f0_up_key=int(pitch), f0_method=args.f0_method, index_rate=float(index_rate), protect=float(protect))
+                for pitch, index_rate, protect in itertools.product(args.pitches.split(","), args.index_rates.split(","), args.protects.split(","))]
+
+    # Références en série
+    reference = {}
+    for params in settings:
+        reference[params] = rvc_infer_array(rvc, audio, params=params)[1]
+        print(f"reference pitch={params.f0_up_key:+d} index_rate={params.index_rate} protect={params.protect}: {len(reference[params])} samples")
+
+    # Même travail en parallèle, ordre mélangé, sur l'instance partagée
+    jobs = [params for params in settings for _ in range(args.repeats)]
+    random.shuffle(jobs)
+    def run(params):
+        return params, rvc_infer_array(rvc, audio, params=params)[1]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(run, jobs))
+    elapsed = time.perf_counter() - start
+
+    failures = 0
+    for params, out in results:
+        expected = reference[params]
+        if not np.array_equal(out, expected):
+            failures += 1
+            diff = np.abs(out - expected).max() if len(out) == len(expected) else float("nan")
+            print(f"FAIL pitch={params.f0_up_key:+d} index_rate={params.index_rate} protect={params.protect}: "
+                  f"{len(out)} samples (ref {len(expected)}), max diff {diff:.3g}")
+    print(f"{len(results)} parallel conversions with {args.workers} workers in {elapsed:.1f}s, {failures} failure(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
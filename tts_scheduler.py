@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""Micro-batching des requêtes TTS Kokoro concurrentes.
+
+Les requêtes qui arrivent dans une même fenêtre (quelques ms) sont regroupées par
+(voix, vitesse, langue) puis exécutées ensemble, et chaque appelant récupère son propre
+résultat. Jusqu'à `max_concurrent_batches` lots tournent en même temps (un par worker
+d'inférence) ; tant qu'ils sont tous occupés, les requêtes s'accumulent pour le lot
+suivant. L'export ONNX de Kokoro ne traite qu'un énoncé par session.run (pas de masque
+d'attention : du padding changerait l'audio), donc un lot n'est pas un tenseur [B, T] :
+le gain vient de la déduplication des textes identiques (prompts IVR / notifications
+répétés), d'un seul aller-retour par lot vers les workers d'inférence, et d'un nombre
+borné de sessions ONNX actives au lieu de N threads qui se disputent les mêmes cœurs.
+"""
+import argparse
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+from metrics import record_stage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH_SIZE = 16
+DEFAULT_MAX_WAIT_MS = 20
+LATENCY_WINDOW = 1000  # nombre de latences récentes gardées pour p50 / p99
+
+
+def kokoro_create_batch(kokoro, texts, voice, speed, lang):
+    """Synthétise une liste de textes avec les mêmes réglages.
+
+    Retourne une liste alignée sur `texts` : (sample_rate, samples) ou l'exception levée
+    pour ce texte (une erreur n'affecte pas les autres requêtes du lot).
+    """
+    unique = {}
+    for text in texts:
+        if text in unique: continue
+        try:
+            samples, sample_rate = kokoro.create(text, voice=voice, speed=speed, lang=lang)
+            unique[text] = (sample_rate, samples)
+        except Exception as e:
+            unique[text] = e
+    return [unique[text] for text in texts]
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+class _Request:
+    __slots__ = ("text", "group", "future", "submitted")
+
+    def __init__(self, text, group):
+        self.text, self.group = text, group
+        self.future = Future()
+        self.submitted = time.perf_counter()
+
+
+class TTSBatchScheduler:
+    """Regroupe les appels TTS concurrents en lots par (voix, vitesse, langue).
+
+    `synthesize_batch(texts, voice, speed, lang)` retourne une liste alignée sur `texts`
+    de (sample_rate, samples) ou d'exceptions (cf. kokoro_create_batch) ; il est appelé depuis
+    au plus `max_concurrent_batches` threads à la fois.
+    """
+
+    def __init__(self, synthesize_batch, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 max_concurrent_batches=1):
+        self.synthesize_batch = synthesize_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self.max_concurrent_batches = max(1, int(max_concurrent_batches))
+        self._slots = threading.Semaphore(self.max_concurrent_batches)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent_batches, thread_name_prefix="tts-batch")
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._requests = self._batches = self._deduplicated = self._failures = 0
+        self._thread = threading.Thread(target=self._loop, name="tts-batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, text, voice, speed, lang):
+        """Ajoute une requête ; retourne un Future de (sample_rate, samples)."""
+        request = _Request(text, (voice, float(speed), lang))
+        with self._cond:
+            if self._closed: raise RuntimeError("TTS batch scheduler is shut down.")
+            self._queue.append(request)
+            self._cond.notify()
+        return request.future
+
+    def synthesize(self, text, voice, speed, lang):
+        """Appel bloquant, même contrat que kokoro.create mais retourne (sample_rate, samples)."""
+        future = self.submit(text, voice, speed, lang)
+        try: return future.result()
+        finally: record_stage("tts_batch_wait", getattr(future, "queue_seconds", 0.0))
+
+    def _collect(self):
+        """Attend une 1re requête puis jusqu'à max_wait (ou max_batch_size requêtes) pour remplir le lot."""
+        with self._cond:
+            while not self._queue and not self._closed: self._cond.wait()
+            if not self._queue: return []
+            deadline = self._queue[0].submitted + self.max_wait
+            while len(self._queue) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0: break
+                self._cond.wait(remaining)
+            return [self._queue.popleft() for _ in range(min(self.max_batch_size, len(self._queue)))]
+
+    def _loop(self):
+        while True:
+            # Un lot n'est collecté que lorsqu'un exécutant est libre : sinon les requêtes continuent de s'accumuler
+            self._slots.acquire()
+            batch = self._collect()
+            if not batch:
+                self._slots.release()
+                if self._closed: return
+                continue
+            groups = {}
+            for request in batch: groups.setdefault(request.group, []).append(request)
+            for number, ((voice, speed, lang), requests) in enumerate(groups.items()):
+                if number: self._slots.acquire()
+                self._executor.submit(self._run_group_in_slot, requests, voice, speed, lang)
+
+    def _run_group_in_slot(self, requests, voice, speed, lang):
+        try: self._run_group(requests, voice, speed, lang)
+        finally: self._slots.release()
+
+    def _run_group(self, requests, voice, speed, lang):
+        texts = [r.text for r in requests]
+        started = time.perf_counter()
+        for request in requests: request.future.queue_seconds = started - request.submitted
+        try:
+            results = self.synthesize_batch(texts, voice, speed, lang)
+        except Exception as e:
+            results = [e] * len(requests)
+        done = time.perf_counter()
+        with self._cond:
+            self._batches += 1
+            self._requests += len(requests)
+            self._deduplicated += len(texts) - len(set(texts))
+            self._failures += sum(isinstance(r, Exception) for r in results)
+            self._latencies.extend(done - r.submitted for r in requests)
+        logger.debug(f"TTS batch: {len(requests)} request(s), voice='{voice}', speed={speed}, lang='{lang}'")
+        for request, result in zip(requests, results):
+            if isinstance(result, Exception): request.future.set_exception(result)
+            else: request.future.set_result(result)
+
+    def stats(self):
+        """Compteurs du scheduler : taille moyenne des lots, déduplications, latences (ms)."""
+        with self._cond:
+            latencies = list(self._latencies)
+            return {
+                "max_batch_size": self.max_batch_size, "max_wait_ms": self.max_wait * 1000,
+                "max_concurrent_batches": self.max_concurrent_batches,
+                "queued": len(self._queue), "requests": self._requests, "batches": self._batches,
+                "mean_batch_size": self._requests / self._batches if self._batches else 0.0,
+                "deduplicated": self._deduplicated, "failures": self._failures,
+                "latency_p50_ms": _percentile(latencies, 50) * 1000, "latency_p99_ms": _percentile(latencies, 99) * 1000,
+            }
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+
+# ==================================================
+#           BENCHMARK : DIRECT VS MICRO-BATCHING
+# ==================================================
+def _benchmark(args):
+    from concurrent.futures import ThreadPoolExecutor
+    from kokoro_onnx import Kokoro
+    kokoro = Kokoro(args.onnx, args.voices)
+    prompts = [line.strip() for line in open(args.prompts, encoding="utf-8") if line.strip()] if args.prompts else [
+        "Votre colis est en cours de livraison.", "Merci de patienter, un conseiller va vous répondre.",
+        "Votre rendez-vous est confirmé.", "Code de vérification envoyé.",
+    ]
+    jobs = [prompts[i % len(prompts)] for i in range(args.requests)]
+    kokoro.create(jobs[0], voice=args.voice, speed=1.0, lang=args.lang)  # chauffe hors mesure
+
+    def direct(text):
+        samples, sample_rate = kokoro.create(text, voice=args.voice, speed=1.0, lang=args.lang)
+        return sample_rate, samples
+
+    scheduler = TTSBatchScheduler(lambda texts, voice, speed, lang: kokoro_create_batch(kokoro, texts, voice, speed, lang),
+                                  args.max_batch_size, args.max_wait_ms)
+    for name, fn in (("unbatched", direct), ("micro-batched", lambda text: scheduler.synthesize(text, args.voice, 1.0, args.lang))):
+        def timed(text):
+            start = time.perf_counter(); fn(text); return time.perf_counter() - start
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as clients:
+            latencies = list(clients.map(timed, jobs))
+        elapsed = time.perf_counter() - start
+        print(f"{name:>14}: {len(jobs) / elapsed:.2f} req/s, p50 {_percentile(latencies, 50) * 1000:.0f} ms, "
+              f"p99 {_percentile(latencies, 99) * 1000:.0f} ms")
+    print(scheduler.stats())
+    scheduler.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare le TTS direct et le micro-batching sous charge concurrente.")
+    parser.add_argument("--onnx", default="modelTTS/kokoro-v1.0.onnx")
+    parser.add_argument("--voices", default="modelTTS/voices-v1.0.bin")
+    parser.add_argument("--prompts", default=None, help="Fichier texte, un prompt par ligne")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    parser.add_argument("--voice", default="ff_siwis")
+    parser.add_argument("--lang", default="fr-fr")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    _benchmark(parser.parse_args())